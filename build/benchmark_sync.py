@@ -0,0 +1,106 @@
+'''Measures sync latency of the Docker executor sync engines
+
+Creates a synthetic project tree in a temporary directory and measures the
+initial sync and repeated syncs after changing a few files. Requires a running
+Docker engine, e.g.:
+
+    $ python build/benchmark_sync.py --files 10000 --modes rsync rsync-incremental
+    $ python build/benchmark_sync.py --files 100000 --modes rsync native
+'''
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+from typing import Tuple
+
+import yaml
+
+from brock.config.config import Config
+from brock.executors.docker import DockerExecutor
+from brock.log import init_logging
+
+MODES = {
+    'rsync': {
+        'type': 'rsync'
+    },
+    'rsync-incremental': {
+        'type': 'rsync',
+        'incremental': True
+    },
+    'native': {
+        'type': 'native'
+    },
+}
+
+
+def create_tree(root: str, files: int, files_per_dir: int = 100):
+    for i in range(files):
+        directory = os.path.join(root, f'dir{i // files_per_dir}')
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f'file{i}.c'), 'w') as f:
+            f.write(f'int foo{i}(void) {{ return {i}; }}\n')
+
+
+def benchmark(mode: str, root: str, changes: int, rounds: int) -> Tuple[float, float]:
+    '''Returns duration of the initial sync and median duration of the syncs after a change (in seconds)'''
+    config = {
+        'version': '0.0.1',
+        'project': f'benchmark-{os.getpid()}',
+        'executors': {
+            'alpine': {
+                'type': 'docker',
+                'image': 'alpine',
+                'sync': MODES[mode],
+            }
+        }
+    }
+    os.chdir(root)
+    executor = DockerExecutor(Config([yaml.dump(config)]), 'alpine')
+    try:
+        start = time.perf_counter()
+        executor.sync_in()
+        initial = time.perf_counter() - start
+
+        times = []
+        for n in range(rounds):
+            for i in range(changes):
+                with open(os.path.join(root, 'dir0', f'file{i}.c'), 'a') as f:
+                    f.write(f'// round {n}\n')
+            start = time.perf_counter()
+            executor.sync_in()
+            times.append(time.perf_counter() - start)
+
+        print(f'{mode:<24} initial {initial:8.2f} s    {changes} changed: {statistics.median(times):8.3f} s (median)')
+        return initial, statistics.median(times)
+    finally:
+        executor.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=10000, help='number of files in the synthetic tree')
+    parser.add_argument('--changes', type=int, default=1, help='number of files changed before each sync')
+    parser.add_argument('--rounds', type=int, default=10, help='number of measured syncs')
+    parser.add_argument('--modes', nargs='+', default=list(MODES), choices=list(MODES))
+    args = parser.parse_args()
+
+    init_logging()
+    root = tempfile.mkdtemp(prefix='brock-benchmark-')
+    try:
+        create_tree(root, args.files)
+        results = [(x, *benchmark(x, root, args.changes, args.rounds)) for x in args.modes]
+        # ready to be recorded in the README or a commit message
+        print(f'\n| mode | initial sync ({args.files} files) | sync of {args.changes} changed |')
+        print('|---|---|---|')
+        for mode, initial, changed in results:
+            print(f'| {mode} | {initial:.2f} s | {changed * 1000:.0f} ms |')
+    finally:
+        os.chdir(os.path.dirname(root))
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
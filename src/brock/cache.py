@@ -0,0 +1,19 @@
+import os
+import platform
+
+
+def get_cache_dir(*subdirs: str) -> str:
+    '''Returns a directory for brock's host-side state, creating it if needed
+
+    The location can be overridden by the BROCK_CACHE_DIR environment variable.
+    '''
+    root = os.environ.get('BROCK_CACHE_DIR')
+    if not root:
+        if platform.system() == 'Windows':
+            root = os.path.join(os.environ.get('LOCALAPPDATA', os.path.expanduser('~')), 'brock')
+        else:
+            root = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'brock')
+
+    path = os.path.join(root, *subdirs)
+    os.makedirs(path, exist_ok=True)
+    return path
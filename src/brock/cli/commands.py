@@ -170,3 +170,28 @@ def exec(state: State, executor=None, executor_at=None, input=None):
         raise UsageError('No command specified')
 
     return state.project.exec_raw(' '.join(input), executor)
+
+
+@click.command()
+@click.option('--executor', '-e', default=None, help='Executor to export the artifacts from', metavar='EXECUTOR')
+@click.argument('executor_at', required=False, metavar='[@EXECUTOR]')
+@click.argument('paths', nargs=-1)
+@pass_state
+def export(state: State, executor=None, executor_at=None, paths=None):
+    '''Copy artifacts from executor overlays to the project folder'''
+    if executor_at and not executor_at.startswith('@'):
+        paths = (executor_at,) + paths
+        executor_at = None
+
+    if executor and executor_at:
+        raise UsageError('Specify the executor either with --executor parameter or @executor, not both')
+    elif executor:
+        pass
+    elif executor_at:
+        executor = executor_at[1:]
+    else:
+        executor = state.project.default_executor
+        if not executor:
+            raise UsageError('Multiple executors available, you have to specify which one to use')
+
+    return state.project.export(executor, paths)
@@ -8,10 +8,12 @@ from .state import State, set_verbosity, set_no_color, set_analytics, set_analyt
 
 from brock.exception import BaseBrockException, ConfigError, UsageError
 from brock.project import Project
+from brock.gc import gc as collect_garbage
+from brock import workspace
 from brock.config.config import Config
 from brock import __version__
 from brock.log import get_logger, init_logging
-from .commands import create_command, shell, exec, create_command_with_options
+from .commands import create_command, shell, exec, export, create_command_with_options
 
 
 class CustomCommandGroup(click.Group):
@@ -89,6 +91,43 @@ def pre_cli(ctx, verbose, args):
     metavar='EXECUTOR'
 )
 @click.option('-s', '--status', is_flag=True, help='Show state of the project')
+@click.option('--usage', is_flag=True, help='Show CPU usage and size of the volumes with --status (slower)')
+@click.option(
+    '--cache-stats',
+    is_flag=False,
+    flag_value='all',
+    default=None,
+    help='Show size of the persistent caches',
+    metavar='EXECUTOR'
+)
+@click.option(
+    '--cache-prune',
+    is_flag=False,
+    flag_value='all',
+    default=None,
+    help='Clear the persistent caches',
+    metavar='EXECUTOR'
+)
+@click.option(
+    '--gc',
+    is_flag=False,
+    flag_value='',
+    default=None,
+    help='Remove docker resources of moved or deleted projects (and of projects unused for AGE, e.g. 30d)',
+    metavar='AGE'
+)
+@click.option('--dry-run', is_flag=True, help='Only report what --gc would remove')
+@click.option(
+    '--workspace',
+    'workspace_command',
+    default=None,
+    help='Run the command in all projects below the current directory',
+    metavar='COMMAND'
+)
+@click.option(
+    '-j', '--jobs', type=click.IntRange(min=1), default=None, help='Number of projects run at once by --workspace'
+)
+@click.option('--reap', is_flag=True, hidden=True, help='Stop idle executors (started in background by brock)')
 @click.option('-v', '--verbose', count=True, help='Set logging verbosity', expose_value=False)
 @click.option(
     '--no-color',
@@ -100,8 +139,29 @@ def pre_cli(ctx, verbose, args):
 )
 @analytics_options_decorator
 @click.pass_context
-def cli(ctx, stop, update, restart, status, **kwargs):
+def cli(
+    ctx, stop, update, restart, status, usage, cache_stats, cache_prune, gc, dry_run, workspace_command, jobs, reap,
+    **kwargs
+):
     state = ctx.find_object(State)
+    if usage and not status:
+        raise UsageError('--usage can be used only with --status')
+    if workspace_command is not None and ctx.invoked_subcommand is None:
+        if stop or update or restart or status or cache_stats or cache_prune or gc is not None:
+            raise UsageError('Invalid arguments combination')
+        # works outside of a project too
+        state.error = None
+        return workspace.run(workspace_command, jobs)
+    elif jobs is not None:
+        raise UsageError('--jobs can be used only with --workspace')
+    if gc is not None and ctx.invoked_subcommand is None:
+        if stop or update or restart or status or cache_stats or cache_prune:
+            raise UsageError('Invalid arguments combination')
+        # works outside of a project too
+        state.error = None
+        return collect_garbage(gc or None, dry_run)
+    elif dry_run:
+        raise UsageError('--dry-run can be used only with --gc')
     # allow running --help and --version even if config parsing failed
     if state.error:
         raise state.error
@@ -114,11 +174,18 @@ def cli(ctx, stop, update, restart, status, **kwargs):
         elif restart:
             ctx.obj.project.restart(None if restart == 'all' else restart)
         elif status:
-            ctx.obj.project.status()
+            ctx.obj.project.status(usage)
+        elif cache_stats:
+            ctx.obj.project.cache_stats(None if cache_stats == 'all' else cache_stats)
+        elif cache_prune:
+            ctx.obj.project.prune_caches(None if cache_prune == 'all' else cache_prune)
+        elif reap:
+            ctx.obj.project.reap()
         else:
             # default command if available
             state.project.exec()
-    elif stop or update or restart or status:
+    elif stop or update or restart or status or cache_stats or cache_prune or reap or gc is not None \
+            or workspace_command is not None:
         raise UsageError('Invalid arguments combination')
 
 
@@ -154,6 +221,7 @@ def main(args=None):
 
         cli.add_command(shell)
         cli.add_command(exec)
+        cli.add_command(export)
 
         if project:
             for name, cmd in project.commands.items():
@@ -179,8 +247,8 @@ def main(args=None):
         except Exception as ex:
             cli_error = ex
 
-        if config_error:
-            raise config_error
+        if state.error:
+            raise state.error
         elif cli_error:
             raise cli_error
         elif result is not None:
@@ -7,10 +7,12 @@ from pathlib import Path
 
 from brock import __version__
 from brock.exception import ConfigError
+from brock.size import SIZE_REGEX
 from brock.log import get_logger
 
 
 class Config(Munch):
+    FILE_NAMES = ['.brock.yml', 'brock.yml', '.brock.yaml', 'brock.yaml']
     SCHEMA = {
         'version': And(str, Regex(r'^[0-9]+.[0-9]+.[0-9]+$')),
         'project': str,
@@ -19,10 +21,16 @@ class Config(Munch):
         Optional('commands', default={}): {
             Optional('default'): str,
             str: {
-                Optional('default_executor'): str,
-                Optional('chdir'): str,
-                Optional('help'): str,
+                Optional('default_executor'):
+                    str,
+                Optional('chdir'):
+                    str,
+                Optional('help'):
+                    str,
                 Optional('depends_on'): [str],
+                Optional('sync_out'):
+                    bool,
+                Optional('sync_paths'): [str],
                 Optional('options'): {
                     Optional(str):
                         Or({
@@ -48,11 +56,21 @@ class Config(Munch):
                             Optional('help'): str
                         })
                 },
-                Optional('steps'): [Or(str, {
-                    Optional('executor'): str,
-                    Optional('shell'): str,
-                    'script': str
-                })],
+                Optional('matrix'):
+                    Or([str], {
+                        'executors': [str],
+                        Optional('jobs'): And(int, lambda x: x >= 1)
+                    }),
+                Optional('steps'): [
+                    Or(
+                        str, {
+                            Optional('executor'): str,
+                            Optional('shell'): str,
+                            Optional('shard'): [Use(str)],
+                            'script': str
+                        }
+                    )
+                ],
             }
         },
         Optional('executors', default={}): {
@@ -77,6 +95,17 @@ class Config(Munch):
                         Or(int, And(str, Regex(r'^\d+/(tcp|udp|sctp)'))): int
                     },
                     Optional('devices'): [str],
+                    Optional('overlays'): [{
+                        'path': str,
+                        Optional('type'): Or('volume', 'tmpfs'),
+                        Optional('export'): [str],
+                    }],
+                    Optional('caches'): {
+                        str: Or(str, {
+                            'path': str,
+                            Optional('size'): And(str, Regex(SIZE_REGEX)),
+                        })
+                    },
                     Optional('sync'):
                         Or(
                             {
@@ -85,14 +114,57 @@ class Config(Munch):
                                 Optional('filter'): [str],
                                 Optional('include'): [str],
                                 Optional('exclude'): [str],
+                                Optional('incremental'): bool,
+                                Optional('outputs'): [str],
+                                Optional('scoped'): bool,
+                                Optional('paths'): [str],
+                                Optional('gitignore'): bool,
                             },
                             {
                                 'type': 'mutagen',
                                 Optional('options'): [str],
                                 Optional('exclude'): [str],
+                                Optional('shared'): bool,
+                                Optional('gitignore'): bool,
+                            },
+                            {
+                                'type': 'native',
+                                Optional('exclude'): [str],
+                                Optional('gitignore'): bool,
                             },
                         ),
+                    Optional('build'): {
+                        Optional('target'): str,
+                        Optional('cache_from'): [str],
+                        Optional('buildkit'): bool,
+                    },
                     Optional('prepare'): [str],
+                    Optional('snapshot'):
+                        Or(bool, {
+                            Optional('inputs'): [str],
+                        }),
+                    Optional('resources'): {
+                        Optional('cpus'): And(Or(int, float), lambda x: x > 0),
+                        Optional('cpuset'): And(str, Regex(r'^\d+(-\d+)?(,\d+(-\d+)?)*$')),
+                        Optional('memory'): And(str, Regex(SIZE_REGEX)),
+                        Optional('shm_size'): And(str, Regex(SIZE_REGEX)),
+                        Optional('tmpfs'): [Or(str, {
+                            'path': str,
+                            Optional('size'): And(str, Regex(SIZE_REGEX)),
+                        })],
+                        Optional('ulimits'): {
+                            str: Or(int, {
+                                'soft': int,
+                                'hard': int
+                            })
+                        },
+                    },
+                    Optional('replicas'):
+                        And(int, lambda x: x >= 1),
+                    Optional('idle'): {
+                        'timeout': And(int, lambda x: x > 0),
+                        Optional('spares'): And(int, lambda x: x >= 0),
+                    },
                     Optional('default_shell'):
                         str,
                 }, {
@@ -105,10 +177,20 @@ class Config(Munch):
         }
     }
 
-    def __init__(self, configs: t.Optional[t.List[str]] = None, config_file_names: t.Optional[t.List[str]] = None):
+    def __init__(
+        self,
+        configs: t.Optional[t.List[str]] = None,
+        config_file_names: t.Optional[t.List[str]] = None,
+        work_dir: t.Optional[str] = None
+    ):
+        '''
+        :param configs: config files (or their content) to use instead of the ones found from the work dir
+        :param config_file_names: names of the config files to look for
+        :param work_dir: directory brock is run in, the current one by default
+        '''
         self._log = get_logger()
 
-        self.work_dir = os.getcwd().replace('\\', '/')
+        self.work_dir = (work_dir or os.getcwd()).replace('\\', '/')
 
         if configs is None:
             all_configs = self._scan_files(config_file_names)
@@ -165,7 +247,7 @@ class Config(Munch):
 
     def _scan_files(self, file_names: t.Optional[t.List[str]] = None) -> t.List[str]:
         if file_names is None:
-            file_names = ['.brock.yml', 'brock.yml', '.brock.yaml', 'brock.yaml']
+            file_names = self.FILE_NAMES
 
         self._log.extra_info(f'Scanning config files, work dir: {self.work_dir}')
 
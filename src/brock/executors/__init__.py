@@ -1,5 +1,5 @@
 import hashlib
-from typing import Optional, Union, Sequence, Dict, Any
+from typing import Optional, Union, Sequence, Dict, Any, List, Tuple
 from brock.log import get_logger
 from brock.config.config import Config
 from brock.exception import ExecutorError
@@ -51,14 +51,41 @@ class Executor:
     def env_vars(self) -> Dict:
         return self._env_vars
 
-    def sync_in(self):
-        '''Synchronizes local data to executor if needed'''
+    @property
+    def sync_group(self) -> Optional[str]:
+        '''Identifier of the synced data shared with other executors, None if not shared'''
+        return None
+
+    @property
+    def synced(self) -> bool:
+        '''True if the executor works on a copy of the project kept in sync by `sync_in` and `sync_out`'''
+        return False
+
+    def is_dirty(self) -> bool:
+        '''Checks if the synced data were modified since the last sync in'''
+        return True
+
+    def sync_in(self, chdir: Optional[str] = None, paths: Sequence[str] = ()):
+        '''Synchronizes local data to executor if needed
+
+        :param chdir: directory (relative to the project) the next command works in
+        :param paths: additional relative paths the next command needs
+        '''
         pass
 
     def sync_out(self):
         '''Synchronizes local data out of executor if needed'''
         pass
 
+    def warm_up(self, chdir: Optional[str] = None, paths: Sequence[str] = ()) -> bool:
+        '''Starts the executor in advance (in a background thread), before it is needed
+
+        :param chdir: directory (relative to the project) the first command works in
+        :param paths: additional relative paths the first command needs
+        :return: True if the project was synced into the executor
+        '''
+        return False
+
     def status(self) -> str:
         return 'Idle'
 
@@ -79,6 +106,40 @@ class Executor:
     ) -> int:
         raise NotImplementedError
 
+    def exec_sharded(
+        self,
+        command: Union[str, Sequence[str]],
+        items: Sequence[str],
+        chdir: Optional[str] = None,
+        env_options: Optional[dict] = None
+    ) -> int:
+        '''Executes the command for each of the work items, passed in BROCK_SHARD_ITEM environment variable
+
+        :return: exit code of the first failed item, 0 if all succeeded
+        '''
+        exit_code = 0
+        for item in items:
+            item_exit_code = self.exec(command, chdir, dict(env_options or {}, BROCK_SHARD_ITEM=item))
+            if item_exit_code != 0:
+                self._log.error(f'Failed {item} (exit code {item_exit_code})')
+                exit_code = exit_code or item_exit_code
+        return exit_code
+
+    def cache_stats(self) -> List[Tuple[str, str, Optional[int], Optional[int]]]:
+        '''Returns name, path, size and size limit (in bytes, None if not known) of the persistent caches'''
+        return []
+
+    def prune_caches(self):
+        '''Clears the persistent caches'''
+        pass
+
+    def export(self, paths: Sequence[str] = ()) -> int:
+        '''Copies artifacts from the executor storage to the project folder
+
+        :param paths: relative paths (or glob patterns) to export, the configured ones if empty
+        '''
+        raise ExecutorError("This executor doesn't support exporting artifacts")
+
     def shell(self) -> int:
         '''Opens a shell session, if available'''
         raise ExecutorError("This executor doesn't support direct shell access")
@@ -0,0 +1,112 @@
+import os
+import stat
+import json
+import hashlib
+from typing import IO, List, Optional, Sequence
+
+from docker.utils.build import exclude_paths, create_archive
+
+
+class BuildContext:
+    '''Files of a Docker build context, honoring the .dockerignore file'''
+
+    def __init__(self, root: str, dockerfile: str = 'Dockerfile'):
+        '''Collects the context files
+
+        :param root: directory of the build context
+        :param dockerfile: path of the Dockerfile relative to the root
+        '''
+        self.root = os.path.abspath(root)
+        self.dockerfile = dockerfile
+        self.files: List[str] = sorted(exclude_paths(self.root, self._read_dockerignore(), dockerfile=dockerfile))
+
+    def _read_dockerignore(self) -> List[str]:
+        # the same parsing as used by docker-py when sending the context
+        try:
+            with open(os.path.join(self.root, '.dockerignore')) as f:
+                lines = [x.strip() for x in f.read().splitlines()]
+        except OSError:
+            return []
+        return [x for x in lines if x and not x.startswith('#')]
+
+    @property
+    def file_count(self) -> int:
+        return sum(1 for x in self.files if not os.path.isdir(os.path.join(self.root, x)))
+
+    @property
+    def size(self) -> int:
+        '''Total size of the context files in bytes'''
+        size = 0
+        for path in self.files:
+            try:
+                st = os.lstat(os.path.join(self.root, path))
+            except FileNotFoundError:
+                continue
+            if stat.S_ISREG(st.st_mode):
+                size += st.st_size
+        return size
+
+    def archive(self, fileobj: IO[bytes]) -> IO[bytes]:
+        '''Writes the context files (and nothing else) as a tar archive to the file object'''
+        return create_archive(self.root, files=self.files, fileobj=fileobj)
+
+    def digest(self, options: Sequence[str] = (), cache_path: Optional[str] = None) -> str:
+        '''Returns a hash of the context content (and build options affecting the result)
+
+        :param cache_path: file keeping the last digest, reused (without reading the files) as long as
+            the metadata of the files (mtimes, sizes, ...) didn't change
+        '''
+        if cache_path is None:
+            return self._content_digest(options)
+
+        metadata = self._metadata_digest(options)
+        try:
+            with open(cache_path) as f:
+                cached = json.load(f)
+            if cached['metadata'] == metadata:
+                return cached['digest']
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+        digest = self._content_digest(options)
+        try:
+            with open(cache_path, 'w') as f:
+                json.dump({'metadata': metadata, 'digest': digest}, f)
+        except OSError:
+            pass
+        return digest
+
+    def _metadata_digest(self, options: Sequence[str]) -> str:
+        sha = hashlib.sha256()
+        for option in options:
+            sha.update(f'O {option}\0'.encode('utf-8'))
+        for path in self.files:
+            try:
+                st = os.lstat(os.path.join(self.root, path))
+            except FileNotFoundError:
+                continue
+            sha.update(
+                f'{path} {st.st_mode} {st.st_size} {st.st_mtime_ns} {st.st_ctime_ns} {st.st_ino}\0'.encode('utf-8')
+            )
+        return sha.hexdigest()
+
+    def _content_digest(self, options: Sequence[str]) -> str:
+        sha = hashlib.sha256()
+        for option in options:
+            sha.update(f'O {option}\0'.encode('utf-8'))
+        for path in self.files:
+            full_path = os.path.join(self.root, path)
+            try:
+                st = os.lstat(full_path)
+            except FileNotFoundError:
+                continue
+            if stat.S_ISDIR(st.st_mode):
+                sha.update(f'D {path}\0'.encode('utf-8'))
+            elif stat.S_ISLNK(st.st_mode):
+                sha.update(f'L {path} {os.readlink(full_path)}\0'.encode('utf-8'))
+            else:
+                sha.update(f'F {path} {st.st_mode & 0o111 != 0} {st.st_size}\0'.encode('utf-8'))
+                with open(full_path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(65536), b''):
+                        sha.update(chunk)
+        return sha.hexdigest()
@@ -4,16 +4,48 @@ import subprocess
 import docker
 import time
 import re
-
-from typing import Optional, Union, Sequence, Dict, List, Any, Union, Iterator
+import io
+import posixpath
+import json
+import shutil
+import tempfile
+import tarfile
+import shlex
+import fnmatch
+import hashlib
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from typing import Optional, Union, Sequence, Dict, List, Any, Union, Iterator, Tuple, IO
 from brock.log import get_logger
 from brock.executors import Executor
+from brock.executors.build_context import BuildContext
 from brock.config.config import Config
 from brock.exception import ExecutorError
+from brock.cache import get_cache_dir
+from brock.sync.filters import PathFilter
+from brock.sync.manifest import Manifest
+from brock.sync.gitignore import GitIgnore
+from brock.size import parse_size, format_size
+from brock.parallel import run_parallel, format_error
+from brock.lock import FileLock
 
 
 class Container:
     '''Docker container abstraction'''
+    # label of images built from a Dockerfile, hash of the build context used
+    CONTEXT_LABEL = 'brock.context.digest'
+    # labels of the containers and volumes created by brock
+    PROJECT_LABEL = 'brock.project'
+    BASE_DIR_LABEL = 'brock.base-dir'
+    PATH_LABEL = 'brock.path'
+    EXECUTOR_LABEL = 'brock.executor'
+    ROLE_LABEL = 'brock.role'
+    # BuildKit availability in the docker CLI, checked once
+    _cli_buildkit: Optional[bool] = None
+    _buildx_driver: Optional[str] = None
 
     def __init__(
         self,
@@ -27,7 +59,20 @@ class Container:
         devices: List[str] = [],
         volumes: Dict[str, Dict[str, Any]] = {},
         run_endpoint: str = None,
-        host_container_id: str = None
+        host_container_id: str = None,
+        command: Optional[str] = None,
+        persistent_volumes: Sequence[str] = (),
+        tmpfs: Dict[str, str] = {},
+        build_target: Optional[str] = None,
+        cache_from: Sequence[str] = (),
+        buildkit: Optional[bool] = None,
+        labels: Dict[str, str] = {},
+        volume_labels: Dict[str, Dict[str, str]] = {},
+        cpus: Optional[float] = None,
+        cpuset: Optional[str] = None,
+        memory: Optional[int] = None,
+        shm_size: Optional[int] = None,
+        ulimits: Dict[str, Tuple[int, int]] = {}
     ):
         self.name = name
         self._platform = platform
@@ -39,6 +84,19 @@ class Container:
         self._volumes = volumes
         self._run_endpoint = run_endpoint
         self._host_container_id = host_container_id
+        self._command = command
+        self._persistent_volumes = persistent_volumes
+        self._tmpfs = tmpfs
+        self._build_target = build_target
+        self._cache_from = cache_from
+        self._buildkit = buildkit
+        self._labels = labels
+        self._volume_labels = volume_labels
+        self._cpus = cpus
+        self._cpuset = cpuset
+        self._memory = memory
+        self._shm_size = shm_size
+        self._ulimits = ulimits
 
         self._log = get_logger()
 
@@ -141,12 +199,12 @@ class Container:
             if name not in volumes:
                 self._log.extra_info(f'Creating volume {name}')
                 try:
-                    self._docker.volumes.create(name)
+                    self._docker.volumes.create(name, labels=self._volume_labels.get(name, self._labels))
                 except docker.errors.APIError as ex:
                     raise ExecutorError(f'Failed to create volume: {ex}')
         self._volumes = new_volumes
 
-    def _delete_volumes(self) -> None:
+    def delete_volumes(self) -> None:
         '''Deletes named volumes used by the container'''
         try:
             volumes = [x.name for x in self._docker.volumes.list()]
@@ -154,7 +212,7 @@ class Container:
             raise ExecutorError(f'Failed to list volumes: {ex}')
 
         for name in self._volumes:
-            if name not in volumes:
+            if name not in volumes or name in self._persistent_volumes:
                 continue
 
             self._log.extra_info(f'Deleting volume {name}')
@@ -163,24 +221,131 @@ class Container:
             except docker.errors.APIError as ex:
                 raise ExecutorError(f'Failed to delete volume: {ex}')
 
-    def _build(self):
+    def _build(self, pull: bool = False) -> bool:
+        '''Builds the image unless it was built from the same context already
+
+        :param pull: pull the base images and build even if the context didn't change, the digest of the context
+            doesn't cover the base images
+        :return: True if the image changed
+        '''
+        dockerfile = self._dockerfile
+        if dockerfile is None:
+            raise ExecutorError('No Dockerfile to build the image from')
+        context = BuildContext(os.path.dirname(dockerfile), os.path.basename(dockerfile))
+        # the content is hashed again only if the metadata of the context files changed since the last start
+        cache_path = os.path.join(get_cache_dir('contexts'), f'{self._image_name}-{self._image_tag}.json')
+        digest = context.digest([f'target={self._build_target}'] if self._build_target else [], cache_path)
+        image = self._image
+        if not pull and image is not None and image.labels.get(self.CONTEXT_LABEL) == digest:
+            self._log.extra_info(f'Image is up to date with build context {digest[:12]}, skipping build')
+            return False
+
         self._log.info(f'Building Docker image from {self._dockerfile}')
-        dockerdir = os.path.dirname(self._dockerfile)
+        self._log.info(f'Build context: {context.file_count} files, {format_size(context.size)}')
+        with tempfile.TemporaryFile() as archive:
+            context.archive(archive)
+            archive.seek(0)
+            if self._use_buildkit():
+                self._build_buildkit(archive, context.dockerfile, digest, pull)
+            else:
+                self._build_api(archive, context.dockerfile, digest, pull)
+        built = self._image
+        # the layers are reused, the image stays the same if neither the context nor the base images changed
+        return image is None or built is None or built.id != image.id
+
+    def _use_buildkit(self) -> bool:
+        if self._buildkit is False or self._platform != 'linux':
+            return False
+        if Container._cli_buildkit is None:
+            # BuildKit is used by the docker CLI if the buildx plugin is available
+            try:
+                ret = subprocess.run(['docker', 'buildx', 'version'], capture_output=True)
+                Container._cli_buildkit = ret.returncode == 0
+            except FileNotFoundError:
+                Container._cli_buildkit = False
+        if self._buildkit and not Container._cli_buildkit:
+            self._log.warning('BuildKit is not available (docker CLI with buildx is needed), using the legacy builder')
+        return Container._cli_buildkit
+
+    @classmethod
+    def _get_buildx_driver(cls) -> str:
+        '''Returns driver of the current buildx builder (docker, docker-container, ...)'''
+        if cls._buildx_driver is None:
+            cls._buildx_driver = 'docker'
+            try:
+                ret = subprocess.run(['docker', 'buildx', 'inspect'], capture_output=True, text=True)
+            except FileNotFoundError:
+                return cls._buildx_driver
+            match = re.search(r'^Driver:\s*(\S+)', ret.stdout, re.MULTILINE)
+            if ret.returncode == 0 and match:
+                cls._buildx_driver = match.group(1)
+        return cls._buildx_driver
+
+    def _build_buildkit(self, archive: IO[bytes], dockerfile: str, digest: str, pull: bool = False):
+        cmd = ['docker', 'build', '-f', dockerfile, '-t', f'{self._image_name}:{self._image_tag}']
+        cmd += ['--label', f'{self.CONTEXT_LABEL}={digest}']
+        if pull:
+            cmd.append('--pull')
+        if self._platform:
+            cmd += ['--platform', self._platform]
+        if self._get_buildx_driver() != 'docker':
+            # builders other than the docker engine's own keep the result in their cache only
+            cmd.append('--load')
+        for key, value in self._labels.items():
+            cmd += ['--label', f'{key}={value}']
+        # embed the cache metadata, so the image can be used by cache_from of other builds
+        cmd += ['--build-arg', 'BUILDKIT_INLINE_CACHE=1']
+        if self._build_target:
+            cmd += ['--target', self._build_target]
+        for image in self._cache_from:
+            cmd += ['--cache-from', image]
+        # the context is streamed from stdin
+        cmd.append('-')
+        self._log.debug(f'Running {cmd}')
+        try:
+            ret = subprocess.run(cmd, stdin=archive, env=dict(os.environ, DOCKER_BUILDKIT='1'))
+        except KeyboardInterrupt:
+            self._log.warning('Execution interrupted')
+            return
+        if ret.returncode != 0:
+            raise ExecutorError('Unable to build image')
+
+    def _build_api(self, archive: IO[bytes], dockerfile: str, digest: str, pull: bool = False):
         try:
             generator = self._docker.api.build(
-                path=dockerdir, platform=self._platform, tag=f'{self._image_name}:{self._image_tag}', decode=True
+                fileobj=archive,
+                custom_context=True,
+                dockerfile=dockerfile,
+                platform=self._platform,
+                tag=f'{self._image_name}:{self._image_tag}',
+                labels=dict(self._labels, **{self.CONTEXT_LABEL: digest}),
+                target=self._build_target,
+                cache_from=list(self._cache_from) or None,
+                pull=pull,
+                decode=True
             )
             try:
                 for chunk in generator:
                     if 'stream' in chunk:
                         print(chunk['stream'], end='')
+                    elif 'error' in chunk:
+                        raise ExecutorError(f"Unable to build image: {chunk['error']}")
             except KeyboardInterrupt:
                 self._log.warning('Execution interrupted')
 
         except (docker.errors.BuildError, docker.errors.APIError) as e:
             raise ExecutorError(f'Unable to build image: {str(e)}')
 
-    def _pull(self):
+    def _pull(self) -> bool:
+        '''Pulls the image unless the local one matches the registry
+
+        :return: True if the image changed
+        '''
+        image = self._image
+        if image is not None and self._is_up_to_date(image):
+            self._log.info(f'Image {self._image_name}:{self._image_tag} is up to date')
+            return False
+
         self._log.info(f'Pulling image {self._image_name}:{self._image_tag}')
         try:
             generator = self._docker.api.pull(
@@ -196,6 +361,148 @@ class Container:
         except docker.errors.APIError as ex:
             raise ExecutorError(f'Failed to pull image: {ex}')
 
+        pulled = self._image
+        changed = image is None or pulled is None or pulled.id != image.id
+        if not changed:
+            self._log.info(f'Image {self._image_name}:{self._image_tag} did not change')
+        return changed
+
+    def _is_up_to_date(self, image) -> bool:
+        '''Compares the manifest digest in the registry with the digests of the local image'''
+        try:
+            remote = self._docker.images.get_registry_data(f'{self._image_name}:{self._image_tag}')
+        except docker.errors.APIError as ex:
+            self._log.debug(f'Registry not reachable: {ex}')
+            return False
+        return any(x.endswith(f'@{remote.id}') for x in image.attrs.get('RepoDigests') or [])
+
+    def volume_id(self, name: str) -> Optional[str]:
+        '''Returns an identifier of the named volume instance, None if it doesn't exist'''
+        try:
+            volume = self._docker.volumes.get(name)
+        except docker.errors.NotFound:
+            return None
+        except docker.errors.APIError as ex:
+            raise ExecutorError(f'Failed to inspect volume: {ex}')
+        return f"{volume.name}@{volume.attrs.get('CreatedAt', '')}"
+
+    def put_file(self, path: str, data: bytes) -> None:
+        '''Stores data to a file inside the running container'''
+        stream = io.BytesIO()
+        with tarfile.open(fileobj=stream, mode='w') as tar:
+            info = tarfile.TarInfo(os.path.basename(path))
+            info.size = len(data)
+            info.mtime = int(time.time())
+            tar.addfile(info, io.BytesIO(data))
+        try:
+            self._container.put_archive(os.path.dirname(path), stream.getvalue())
+        except docker.errors.APIError as ex:
+            raise ExecutorError(f'Failed to copy file to container: {ex}')
+
+    @staticmethod
+    def list_labeled(labels: Dict[str, str]) -> Dict[str, Any]:
+        '''Returns running containers having all the labels by their names, using a single query'''
+        try:
+            containers = docker.from_env().containers.list(
+                filters={'label': [f'{key}={value}' for key, value in labels.items()]}
+            )
+        except docker.errors.DockerException as ex:
+            raise ExecutorError(f'Failed to list containers: {ex}')
+        return {x.name: x for x in containers}
+
+    @staticmethod
+    def list_named(names: Sequence[str]) -> Dict[str, Any]:
+        '''Returns the running containers of the names by their names, using a single query'''
+        if not names:
+            return {}
+        try:
+            containers = docker.from_env().containers.list(filters={'name': list(names)})
+        except docker.errors.DockerException as ex:
+            raise ExecutorError(f'Failed to list containers: {ex}')
+        # the name filter matches parts of the names too
+        return {x.name: x for x in containers if x.name in names}
+
+    @staticmethod
+    def resource_usage(container: Any, one_shot: bool = True) -> Tuple[Optional[float], Optional[int]]:
+        '''Returns CPU usage (in percent of one CPU) and memory usage (in bytes) of the running container
+
+        A single sample is read if one_shot, it is immediate but the CPU usage is not known then. Otherwise,
+        the docker engine waits for the second sample (a second or two).
+        '''
+        try:
+            stats = container.stats(stream=False, one_shot=one_shot)
+        except docker.errors.APIError:
+            return None, None
+
+        cpu = None
+        cpu_stats = stats.get('cpu_stats') or {}
+        precpu_stats = stats.get('precpu_stats') or {}
+        cpu_delta = (cpu_stats.get('cpu_usage') or {}).get('total_usage', 0) - \
+            (precpu_stats.get('cpu_usage') or {}).get('total_usage', 0)
+        system_delta = cpu_stats.get('system_cpu_usage', 0) - precpu_stats.get('system_cpu_usage', 0)
+        if system_delta > 0 and cpu_delta >= 0:
+            cpu = cpu_delta / system_delta * cpu_stats.get('online_cpus', 1) * 100
+
+        memory = None
+        memory_stats = stats.get('memory_stats') or {}
+        if 'usage' in memory_stats:
+            # the page cache is not counted, the same as docker stats does
+            cache = (memory_stats.get('stats') or {}).get('inactive_file', 0)
+            memory = memory_stats['usage'] - cache
+        elif 'privateworkingset' in memory_stats:
+            memory = memory_stats['privateworkingset']
+        return cpu, memory
+
+    @property
+    def volume_names(self) -> List[str]:
+        '''Names of the named volumes used by the container'''
+        return [x for x in self._volumes if x in self._volume_labels]
+
+    def volume_users(self, name: str) -> List[str]:
+        '''Returns names of containers using the named volume'''
+        try:
+            return [x.name for x in self._docker.containers.list(all=True, filters={'volume': name})]
+        except docker.errors.APIError as ex:
+            raise ExecutorError(f'Failed to list containers: {ex}')
+
+    def volume_sizes(self) -> Dict[str, int]:
+        '''Returns sizes of all volumes in bytes, -1 if not known'''
+        try:
+            volumes = self._docker.df().get('Volumes') or []
+        except docker.errors.APIError as ex:
+            raise ExecutorError(f'Failed to get disk usage: {ex}')
+        return {x['Name']: (x.get('UsageData') or {}).get('Size', -1) for x in volumes}
+
+    def remove_volume(self, name: str) -> None:
+        try:
+            self._docker.volumes.get(name).remove()
+        except docker.errors.NotFound:
+            pass
+        except docker.errors.APIError as ex:
+            raise ExecutorError(f'Failed to delete volume: {ex}')
+
+    def get_archive(self, path: str) -> Optional[IO[bytes]]:
+        '''Returns a tar archive of the path inside the running container, None if it doesn't exist'''
+        try:
+            stream, _ = self._container.get_archive(path)
+        except docker.errors.NotFound:
+            return None
+        except docker.errors.APIError as ex:
+            raise ExecutorError(f'Failed to copy data from container: {ex}')
+
+        archive = tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024)
+        for chunk in stream:
+            archive.write(chunk)
+        archive.seek(0)
+        return archive
+
+    def put_archive(self, path: str, archive: IO[bytes]) -> None:
+        '''Extracts the tar archive to the path inside the running container'''
+        try:
+            self._container.put_archive(path, archive)
+        except docker.errors.APIError as ex:
+            raise ExecutorError(f'Failed to copy data to container: {ex}')
+
     def is_running(self) -> bool:
         try:
             self._docker.containers.get(self.name)
@@ -203,18 +510,26 @@ class Container:
             return False
         return True
 
-    def start(self) -> None:
+    def start(self, image: Optional[str] = None) -> None:
+        '''Starts the container
+
+        :param image: image to run instead of the configured one (e.g. its snapshot)
+        '''
         if self.is_running():
             return
 
-        if self._image is None:
+        if image is None and self._dockerfile:
+            # rebuilt only if the build context changed
+            self._build()
+        elif image is None and self._image is None:
             self.update()
 
         self._log.info(f'Starting container {self.name}')
         self._create_volumes()
         try:
             res = self._docker_run.containers.run(
-                image=f'{self._image_name}:{self._image_tag}',
+                image=image or f'{self._image_name}:{self._image_tag}',
+                command=self._command,
                 name=self.name,
                 auto_remove=True,
                 detach=True,
@@ -226,32 +541,112 @@ class Container:
                 isolation=self._isolation,
                 devices=self._devices,
                 volumes=self._volumes,
+                tmpfs=self._tmpfs or None,
+                labels=self._labels,
+                nano_cpus=int(self._cpus * 1e9) if self._cpus else None,
+                cpuset_cpus=self._cpuset,
+                mem_limit=self._memory,
+                shm_size=self._shm_size,
+                ulimits=[docker.types.Ulimit(name=x, soft=y[0], hard=y[1]) for x, y in self._ulimits.items()] or None,
             )
             self._log.debug(res)
         except docker.errors.APIError as ex:
             raise ExecutorError(f'Failed to start container: {ex}')
 
-    def stop(self) -> None:
+    def stop(self, delete_volumes: bool = True) -> None:
+        '''Stops (and removes) the container
+
+        :param delete_volumes: delete the non-persistent volumes of the container
+        '''
         if not self.is_running():
             return
         self._log.info(f'Stopping container {self.name}')
-        self._container.stop()
         try:
-            self._container.wait(timeout=60, condition='removed')
+            container = self._container
+            container.stop()
+            container.wait(timeout=60, condition='removed')
         except ExecutorError:
+            # stopped by someone else in the meantime
+            pass
+        except docker.errors.NotFound:
             pass
-        self._delete_volumes()
+        except docker.errors.APIError as ex:
+            raise ExecutorError(f'Failed to stop container: {ex}')
+        if delete_volumes:
+            self.delete_volumes()
 
-    def update(self) -> None:
+    def image_id(self) -> str:
+        '''Returns ID of the configured image, pulling it if missing or building it if its build context changed'''
         if self._dockerfile:
             self._build()
+        image = self._image
+        if image is None:
+            self.update()
+            image = self._image
+        if image is None:
+            raise ExecutorError(f'Image {self._image_name}:{self._image_tag} is not available')
+        return image.id
+
+    def has_image(self, name: str) -> bool:
+        try:
+            self._docker.images.get(name)
+        except docker.errors.ImageNotFound:
+            return False
+        return True
+
+    def commit(self, repository: str, tag: str) -> None:
+        '''Creates an image from the current state of the container (with the labels of the container)'''
+        try:
+            self._container.commit(repository=repository, tag=tag)
+        except docker.errors.APIError as ex:
+            raise ExecutorError(f'Failed to commit container: {ex}')
+
+    def remove_images(self, repository: str, keep: str) -> None:
+        '''Removes the tags of the repository (and the images left without a tag) except the kept one
+
+        :param keep: tag to keep, as repository:tag
+        '''
+        try:
+            images = self._docker.images.list(name=repository)
+        except docker.errors.APIError as ex:
+            raise ExecutorError(f'Failed to list images: {ex}')
+        for image in images:
+            for tag in image.tags:
+                if tag == keep or tag.rsplit(':', 1)[0] != repository:
+                    continue
+                self._log.extra_info(f'Removing image {tag}')
+                try:
+                    self._docker.images.remove(tag)
+                except docker.errors.APIError as ex:
+                    # e.g. used by a container
+                    self._log.warning(f'Failed to remove image {tag}: {ex}')
+
+    def update(self) -> bool:
+        '''Pulls or builds the image, the container is stopped if the image changed
+
+        :return: True if the image changed
+        '''
+        if self._dockerfile:
+            changed = self._build(pull=True)
         else:
-            self._pull()
+            changed = self._pull()
 
-        if self.is_running():
+        if changed and self.is_running():
             self.stop()
+        return changed
+
+    def exec(
+        self,
+        command: Union[str, Sequence[str]],
+        work_dir: str,
+        env: Optional[Dict[str, Any]] = None,
+        prefix: Optional[str] = None
+    ) -> int:
+        '''Executes the command, printing its output
 
-    def exec(self, command: Union[str, Sequence[str]], work_dir: str) -> int:
+        :param env: environment variables added to the container ones for this command
+        :param prefix: prefix of the output lines, the output is printed by whole lines if set
+        '''
         if not self.is_running():
             self.start()
 
@@ -260,17 +655,30 @@ class Container:
 
         try:
             exec_id = self._container.client.api.exec_create(
-                self._container.id, command, workdir=work_dir, environment=self._env
+                self._container.id, command, workdir=work_dir, environment=dict(self._env, **(env or {}))
             )['Id']
             output = self._container.client.api.exec_start(exec_id, stream=True, demux=True)
+            # incomplete lines of stdout and stderr
+            pending = ['', '']
             try:
                 for chunk in output:
-                    if chunk[0]:
-                        print(chunk[0].decode('utf-8', 'replace'), end='')
-                    if chunk[1]:
-                        print(chunk[1].decode('utf-8', 'replace'), end='', file=sys.stderr)
+                    for index, data in enumerate(chunk):
+                        if not data:
+                            continue
+                        stream = sys.stdout if index == 0 else sys.stderr
+                        text = data.decode('utf-8', 'replace')
+                        if prefix is None:
+                            print(text, end='', file=stream)
+                            continue
+                        lines = (pending[index] + text).split('\n')
+                        pending[index] = lines.pop()
+                        if lines:
+                            print(''.join(f'{prefix}{x}\n' for x in lines), end='', file=stream)
             except KeyboardInterrupt:
                 self._log.warning('Execution interrupted')
+            for index, text in enumerate(pending):
+                if text:
+                    print(f'{prefix}{text}', file=sys.stdout if index == 0 else sys.stderr)
 
             res = self._container.client.api.exec_inspect(exec_id)
             exit_code = res['ExitCode']
@@ -280,6 +688,27 @@ class Container:
         except docker.errors.APIError as ex:
             raise ExecutorError(f'Failed to execute command: {ex}')
 
+    def exec_output(self, command: Union[str, Sequence[str]], work_dir: str) -> Tuple[int, bytes]:
+        '''Executes the command and returns its exit code and captured stdout'''
+        self._log.debug(f'Executing command in container {self.name}: {command}')
+        try:
+            exec_id = self._container.client.api.exec_create(
+                self._container.id, command, workdir=work_dir, environment=self._env, stderr=False
+            )['Id']
+            output = self._container.client.api.exec_start(exec_id)
+            exit_code = self._container.client.api.exec_inspect(exec_id)['ExitCode']
+            return exit_code, output
+        except docker.errors.APIError as ex:
+            raise ExecutorError(f'Failed to execute command: {ex}')
+
+    def has_running_exec(self) -> bool:
+        '''Checks if any command (or shell) is being executed in the container'''
+        try:
+            exec_ids = self._container.attrs.get('ExecIDs') or []
+            return any(self._docker.api.exec_inspect(x).get('Running') for x in exec_ids)
+        except (ExecutorError, docker.errors.APIError):
+            return False
+
     def shell(self, shell: str, work_dir: str) -> int:
         if not self.is_running():
             self.start()
@@ -315,8 +744,31 @@ class MutagenSync:
             raise ExecutorError(f'Failed to create Mutagen sync session: {ret.stderr}')
 
     @staticmethod
-    def list() -> Iterator[Dict[str, Any]]:
-        '''Returns a list of all active Mutagen sync sessions.'''
+    def list(session_name: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        '''Returns a list of active Mutagen sync sessions (all or the one specified by name).'''
+        cmd = ['mutagen', 'sync', 'list', '--template', '{{ json . }}']
+        if session_name is not None:
+            cmd.append(session_name)
+        ret = subprocess.run(cmd, capture_output=True, text=True)
+        if ret.returncode == 0:
+            try:
+                sessions = json.loads(ret.stdout)
+            except ValueError:
+                sessions = None
+            if isinstance(sessions, list):
+                for listed in sessions:
+                    yield {
+                        'name': listed.get('name'),
+                        'identifier': listed.get('identifier'),
+                        'status': listed.get('status'),
+                        'alpha': MutagenSync._endpoint(listed.get('alpha', {})),
+                        'beta': MutagenSync._endpoint(listed.get('beta', {})),
+                    }
+                return
+        if session_name is not None:
+            raise ExecutorError(f'Failed to list Mutagen sync session {session_name}')
+
+        # older Mutagen versions don't support templates, parse the human-readable output
         ret = subprocess.run(['mutagen', 'sync', 'list'], capture_output=True, text=True)
         if ret.returncode != 0:
             raise ExecutorError('Failed to list Mutagen sync sessions')
@@ -327,6 +779,7 @@ class MutagenSync:
             line = line.strip()
             if line.startswith('Name:'):
                 if session:
+                    yield session
                     session = {}
                 session['name'] = line.split(':', 1)[1].strip()
             elif line.startswith('Identifier:'):
@@ -349,24 +802,52 @@ class MutagenSync:
         if session:
             yield session
 
+    @staticmethod
+    def _endpoint(endpoint: Dict[str, Any]) -> Dict[str, Any]:
+        url = endpoint.get('path', '')
+        if endpoint.get('host'):
+            url = f"{endpoint.get('protocol', '')}://{endpoint['host']}{url}"
+        return {'url': url, 'connected': endpoint.get('connected', False)}
+
     @staticmethod
     def get(session_name: str) -> Optional[Dict[str, Any]]:
         '''Returns a specific Mutagen sync session by name.'''
-        return next((s for s in MutagenSync.list() if s['name'] == session_name), None)
+        try:
+            return next(MutagenSync.list(session_name), None)
+        except ExecutorError:
+            # the session doesn't exist or templates are not supported, search all sessions
+            return next((s for s in MutagenSync.list() if s['name'] == session_name), None)
 
     @staticmethod
-    def wait(session_name: str, timeout: int = 900):
-        '''Waits for a specific Mutagen sync session to complete initial sync.'''
+    def wait(session_name: str, timeout: int = 900) -> bool:
+        '''Waits for a specific Mutagen sync session to complete a synchronization cycle.
+
+        The session is flushed, which returns as soon as the cycle is done. If
+        flushing is not possible (e.g. the session is still connecting), the
+        session state is polled with a growing interval.
+        '''
         start = time.time()
+        try:
+            ret = subprocess.run(['mutagen', 'sync', 'flush', session_name],
+                                 capture_output=True,
+                                 text=True,
+                                 timeout=timeout)
+            if ret.returncode == 0:
+                return True
+        except subprocess.TimeoutExpired:
+            return False
+
+        delay = 0.05
         while True:
             if time.time() - start > timeout:
                 return False
             session = MutagenSync.get(session_name)
             if not session:
                 raise ExecutorError('Mutagen sync session not found')
-            elif session['status'] == 'Watching for changes':
+            elif session['status'] in ('watching', 'Watching for changes'):
                 break
-            time.sleep(1)
+            time.sleep(delay)
+            delay = min(delay * 2, 1)
         return True
 
     @staticmethod
@@ -378,6 +859,175 @@ class MutagenSync:
             raise ExecutorError(f'Failed to terminate Mutagen sync session: {ret.stderr}')
 
 
+# total length of the arguments passed to a single command run in a container
+_MAX_ARGS_LENGTH = 64 * 1024
+
+
+class NativeSync:
+    '''Sync engine using the Docker archive API
+
+    The host tree is compared with the manifest of the last sync kept in a
+    small state volume next to the synced one (so it is not a part of the
+    synced tree) and only the changed files are streamed to the container as a
+    tar archive, deleted files are removed in bulk. The changes made in the
+    container are found by listing the volume and copied back the same way.
+    No helper container or external binary is needed, the image must provide
+    `find`, `stat`, `tar` and `rm` (available in busybox or coreutils).
+    '''
+    STATE_DIR = '/brock-sync-state'
+    MANIFEST = 'manifest.json'
+    _FILE_LIST = '/tmp/brock-sync-files'
+    _ARCHIVE = '/tmp/brock-sync-out.tar'
+
+    def __init__(
+        self, container: Container, base_dir: str, mount_dir: str, path_filter: PathFilter, state_dir: str = STATE_DIR
+    ):
+        self._container = container
+        self._base_dir = base_dir
+        self._mount_dir = mount_dir
+        self._path_filter = path_filter
+        self._manifest_path = f'{state_dir}/{self.MANIFEST}'
+        self._log = get_logger()
+
+    def sync_in(self) -> Tuple[int, int]:
+        '''Syncs the host tree into the volume
+
+        :return: number of scanned and transferred files
+        '''
+        current = Manifest.scan(self._base_dir, self._path_filter)
+        previous = self._load_manifest() or Manifest()
+        changed, deleted = previous.diff(current)
+
+        if deleted:
+            self._remove_in_container(deleted)
+
+        if changed:
+            with tempfile.TemporaryFile() as archive:
+                with tarfile.open(fileobj=archive, mode='w') as tar:
+                    for path in changed:
+                        try:
+                            tar.add(os.path.join(self._base_dir, path), arcname=path, recursive=False)
+                        except FileNotFoundError:
+                            # removed meanwhile, will be synced next time
+                            current.entries.pop(path, None)
+                archive.seek(0)
+                self._container.put_archive(self._mount_dir, archive)
+
+        self._container.put_file(self._manifest_path, current.dumps())
+        return len(current), len(changed) + len(deleted)
+
+    def sync_out(self) -> Tuple[int, int]:
+        '''Syncs the changes made in the volume back to the host
+
+        :return: number of scanned and transferred files
+        '''
+        previous = self._load_manifest() or Manifest()
+        volume = self._list_volume()
+
+        changed = []
+        created = []
+        for path, entry in volume.items():
+            known = previous.entries.get(path)
+            if Manifest.is_dir(entry):
+                if known is None:
+                    os.makedirs(os.path.join(self._base_dir, path), exist_ok=True)
+                    created.append(path)
+            elif known is None or known[1] != entry[1] or known[0] // 1000000000 != entry[0]:
+                changed.append(path)
+        deleted = [x for x in previous.entries if x not in volume]
+
+        for path in sorted(deleted, reverse=True):
+            full_path = os.path.join(self._base_dir, path)
+            if os.path.isdir(full_path) and not os.path.islink(full_path):
+                shutil.rmtree(full_path, ignore_errors=True)
+            elif os.path.lexists(full_path):
+                os.remove(full_path)
+
+        if changed:
+            self._container.put_file(self._FILE_LIST, '\n'.join(changed).encode('utf-8'))
+            exit_code, _ = self._container.exec_output(['tar', '-cf', self._ARCHIVE, '-T', self._FILE_LIST],
+                                                       self._mount_dir)
+            if exit_code != 0:
+                raise ExecutorError('Failed to archive data in container')
+            archive = self._container.get_archive(self._ARCHIVE)
+            if archive is None:
+                raise ExecutorError('Failed to copy data from container')
+            with archive, tarfile.open(fileobj=archive) as outer:
+                inner = outer.extractfile(outer.next())  # type: ignore
+                with tarfile.open(fileobj=inner, mode='r|') as tar:
+                    _extract_tar(tar, self._base_dir)
+
+        # only the paths written from the volume are updated, host edits made meanwhile are synced in next time
+        current = previous.update(self._base_dir, created + changed, deleted)
+        self._container.put_file(self._manifest_path, current.dumps())
+        return len(volume), len(changed) + len(deleted)
+
+    def _load_manifest(self) -> Optional[Manifest]:
+        archive = self._container.get_archive(self._manifest_path)
+        if archive is None:
+            return None
+        with archive, tarfile.open(fileobj=archive) as tar:
+            member = tar.extractfile(self.MANIFEST)
+            return Manifest.loads(member.read()) if member else None
+
+    def _list_volume(self) -> Dict[str, Tuple[int, int]]:
+        '''Lists the volume content, mtimes are in seconds'''
+        exit_code, output = self._container.exec_output([
+            'sh', '-c', "find . -mindepth 1 -exec stat -c '%F|%Y|%s|%n' {} +"
+        ], self._mount_dir)
+        if exit_code != 0:
+            raise ExecutorError('Failed to list volume content')
+
+        entries = {}
+        for line in output.decode('utf-8', 'replace').splitlines():
+            try:
+                kind, mtime, size, name = line.split('|', 3)
+            except ValueError:
+                continue
+            path = name[2:]
+            is_dir = kind == 'directory'
+            if self._path_filter.excludes(path, is_dir):
+                continue
+            entries[path] = (0, -1) if is_dir else (int(mtime), int(size))
+
+        # excluded directories are listed by find, their content must be skipped as well
+        for path in sorted(entries):
+            parent = posixpath.dirname(path)
+            if parent and parent not in entries:
+                del entries[path]
+        return entries
+
+    def _remove_in_container(self, paths: List[str]):
+        _remove_in_container(self._container, paths, self._mount_dir)
+
+
+def _remove_in_container(container: Container, paths: List[str], work_dir: str):
+    '''Removes the paths using as few commands as the argument length limit allows'''
+    chunks: List[List[str]] = [[]]
+    length = 0
+    for path in paths:
+        if length + len(path) > _MAX_ARGS_LENGTH:
+            chunks.append([])
+            length = 0
+        chunks[-1].append(path)
+        length += len(path) + 1
+
+    for chunk in chunks:
+        exit_code, _ = container.exec_output(['rm', '-rf', '--'] + chunk, work_dir)
+        if exit_code != 0:
+            raise ExecutorError('Failed to remove files in container')
+
+
+def _extract_tar(tar: tarfile.TarFile, dest: str):
+    '''Extracts the archive, members pointing outside of the destination are skipped'''
+    kwargs: Dict[str, Any] = {'filter': 'tar'} if hasattr(tarfile, 'tar_filter') else {}
+    for member in tar:
+        name = posixpath.normpath(member.name)
+        if name.startswith('..') or posixpath.isabs(name):
+            continue
+        tar.extract(member, dest, **kwargs)
+
+
 class DockerExecutor(Executor):
     '''Executor for docker based toolchains
 
@@ -386,6 +1036,14 @@ class DockerExecutor(Executor):
     '''
     _HOST_PATH = '/host'
     _RSYNC_PATH = '/rsync_volume'
+    _SYNC_IMAGE = 'eeacms/rsync:2.3'
+    # sync state shared by executors working on the same synced volume
+    _sync_states: Dict[str, Dict[str, Any]] = {}
+    _FILES_FROM = '/tmp/brock-files-from'
+    _SYNC_MARKER = '/tmp/brock-sync-marker'
+    _TRANSFER_LOG = '/tmp/brock-transfer-log'
+    # rsync log line: date, time, pid, itemized change and path
+    _TRANSFER_LOG_REGEX = re.compile(r'^\S+ \S+ \[\d+\] ([<>ch.][fdLDS]\S*|\*deleting) +(.+)$')
 
     def __init__(self, config: Config, name: str):
         '''Initializes Docker executor
@@ -397,6 +1055,14 @@ class DockerExecutor(Executor):
 
         self._platform = self._conf.get('platform', 'linux')
         self._prepare = self._conf.get('prepare', [])
+        snapshot = self._conf.get('snapshot', False)
+        self._snapshot = bool(snapshot)
+        self._snapshot_inputs = snapshot.get('inputs', []) if isinstance(snapshot, dict) else []
+        self._snapshot_repository = f'brock-{config.project}-{name}-{self._hashed_base_dir}-snapshot'.lower()
+        idle = self._conf.get('idle', {})
+        self._idle_timeout = idle.get('timeout')
+        self._idle_spares = idle.get('spares', 0)
+        self._used = False
 
         self.env_vars.update(self._conf.get('env', {}))
 
@@ -434,11 +1100,30 @@ class DockerExecutor(Executor):
             self._sync_filter = self._conf.sync.get('filter', [])
             self._sync_include = self._conf.sync.get('include', [])
             self._sync_exclude = self._conf.sync.get('exclude', [])
+            self._sync_outputs = self._conf.sync.get('outputs', [])
+            # a full rsync into the volume would delete the intermediates kept there when only outputs are synced out
+            self._sync_incremental = self._conf.sync.get('incremental', bool(self._sync_outputs))
+            self._sync_scoped = self._conf.sync.get('scoped', False)
+            self._sync_paths = self._conf.sync.get('paths', [])
+            self._sync_shared = self._conf.sync.get('shared', False)
+            self._sync_gitignore = self._conf.sync.get('gitignore', False)
             self._sync_type = self._conf.sync.type
         else:
+            self._sync_gitignore = False
+            self._sync_incremental = False
+            self._sync_scoped = False
+            self._sync_shared = False
             self._sync_type = None
         self._sync_container = None
-        self._synced_in = False
+        self._sync_group = None
+        self._project_labels = {
+            Container.PROJECT_LABEL: config.project,
+            Container.BASE_DIR_LABEL: self._hashed_base_dir,
+            Container.PATH_LABEL: self._base_dir,
+        }
+        volume_labels: Dict[str, Dict[str, str]] = {}
+        # loaded on first use, walking the tree is not needed for commands not syncing
+        self._sync_gitignore_rules: Optional[List[Tuple[bool, str]]] = None
         if self._sync_type == 'rsync':
             self._sync_exclude = self._conf.sync.get('exclude', [])
 
@@ -447,7 +1132,8 @@ class DockerExecutor(Executor):
             self._sync_container = Container(
                 f'brock-{config.project}-rsync-{self._hashed_base_dir}',
                 platform='linux',
-                image='eeacms/rsync:2.3',
+                image=self._SYNC_IMAGE,
+                command='sh',
                 volumes={
                     self._sync_volume_name: {
                         'bind': self._RSYNC_PATH,
@@ -457,8 +1143,11 @@ class DockerExecutor(Executor):
                         'bind': self._HOST_PATH,
                         'mode': 'rw'
                     }
-                }
+                },
+                labels=self._labels('sync', executor=False),
+                volume_labels={self._sync_volume_name: self._labels('sync', executor=False)}
             )
+            self._sync_group = self._sync_volume_name
             volumes = {self._sync_volume_name: {'bind': self._mount_dir, 'mode': 'rw'}}
         elif self._sync_type == 'mutagen':
             try:
@@ -466,12 +1155,118 @@ class DockerExecutor(Executor):
             except FileNotFoundError:
                 raise ExecutorError('Mutagen is not installed')
 
-            self._sync_volume_name = f'brock-{config.project}-{self.name}-mutagen-volume-{self._hashed_base_dir}'
+            if self._sync_shared:
+                # one volume synced by one session through a helper container, used by all shared executors
+                self._sync_volume_name = f'brock-{config.project}-mutagen-volume-{self._hashed_base_dir}'
+                self._sync_container = Container(
+                    f'brock-{config.project}-mutagen-{self._hashed_base_dir}',
+                    platform='linux',
+                    image=self._SYNC_IMAGE,
+                    command='sh',
+                    volumes={self._sync_volume_name: {
+                        'bind': self._HOST_PATH,
+                        'mode': 'rw'
+                    }},
+                    labels=self._labels('sync', executor=False),
+                    volume_labels={self._sync_volume_name: self._labels('sync', executor=False)}
+                )
+                self._sync_group = self._sync_volume_name
+            else:
+                self._sync_volume_name = f'brock-{config.project}-{self.name}-mutagen-volume-{self._hashed_base_dir}'
+                volume_labels[self._sync_volume_name] = self._labels('sync')
 
             volumes = {self._sync_volume_name: {'bind': self._mount_dir, 'mode': 'rw'}}
+        elif self._sync_type == 'native':
+            if self._platform != 'linux':
+                raise ExecutorError('Native sync is supported only for linux containers')
+
+            self._sync_volume_name = f'brock-{config.project}-{self.name}-native-volume-{self._hashed_base_dir}'
+            volume_labels[self._sync_volume_name] = self._labels('sync')
+            # the manifest of the synced files lives and dies with the synced volume, outside of it
+            state_volume = f'brock-{config.project}-{self.name}-native-state-{self._hashed_base_dir}'
+            volume_labels[state_volume] = self._labels('sync')
+
+            volumes = {
+                self._sync_volume_name: {
+                    'bind': self._mount_dir,
+                    'mode': 'rw'
+                },
+                state_volume: {
+                    'bind': NativeSync.STATE_DIR,
+                    'mode': 'rw'
+                },
+            }
         else:
             volumes = {self._base_dir: {'bind': self._mount_dir, 'mode': 'rw'}}
 
+        if self._sync_scoped:
+            # each executor may need a different part of the tree
+            self._sync_group = None
+        if self._sync_group is not None:
+            self._sync_state = self._sync_states.setdefault(self._sync_group, {})
+        else:
+            self._sync_state = {}
+        self._sync_state.setdefault('synced_in', False)
+        # relative paths synced into the volume since the last sync out, None if the whole tree was synced
+        self._sync_state.setdefault('synced_scope', None)
+
+        # build directories overlaid over the project folder, the volumes survive idle stops and image updates
+        overlay_volumes: List[str] = []
+        tmpfs = {}
+        self._overlay_paths = []
+        self._overlay_exports = []
+        self._overlay_volumes = overlay_volumes
+        for overlay in self._conf.get('overlays', []):
+            path = posixpath.normpath(overlay.path.replace('\\', '/')).strip('/')
+            if path in ('', '.') or path.startswith('..'):
+                raise ExecutorError(f'Overlay path {overlay.path} must be inside the project directory')
+            target = f'{self._mount_dir}/{path}'
+            if overlay.get('type', 'volume') == 'tmpfs':
+                if self._platform != 'linux':
+                    raise ExecutorError('Tmpfs overlays are supported only for linux containers')
+                tmpfs[target] = ''
+            else:
+                slug = re.sub(r'[^a-zA-Z0-9_.-]', '-', path)
+                volume = f'brock-{config.project}-{name}-overlay-{slug}-{self._hashed_base_dir}'
+                volumes[volume] = {'bind': target, 'mode': 'rw'}
+                volume_labels[volume] = self._labels('overlay')
+                overlay_volumes.append(volume)
+            self._overlay_paths.append(path)
+            self._overlay_exports += [f'{path}/{x}' for x in overlay.get('export', [])]
+
+        # persistent caches, volumes of the same name are shared by executors of the project
+        self._caches: Dict[str, Tuple[str, str, Optional[int]]] = {}
+        for cache_name, cache in self._conf.get('caches', {}).items():
+            if isinstance(cache, str):
+                path, size = cache, None
+            else:
+                path, size = cache.path, cache.get('size')
+            volume = f'brock-{config.project}-cache-{cache_name}'
+            volumes[volume] = {'bind': path, 'mode': 'rw'}
+            volume_labels[volume] = self._labels('cache', executor=False)
+            self._caches[cache_name] = (volume, path, parse_size(size) if size else None)
+
+        # resource limits and scratch space
+        resources = self._conf.get('resources', {})
+        for mount in resources.get('tmpfs', []):
+            if self._platform != 'linux':
+                raise ExecutorError('Tmpfs mounts are supported only for linux containers')
+            if isinstance(mount, str):
+                tmpfs[mount] = ''
+            else:
+                tmpfs[mount.path] = f'size={parse_size(mount.size)}' if 'size' in mount else ''
+        if self._platform != 'linux' and ('cpuset' in resources or 'shm_size' in resources):
+            raise ExecutorError('Options cpuset and shm_size are supported only for linux containers')
+        ulimits = {}
+        for ulimit, value in resources.get('ulimits', {}).items():
+            ulimits[ulimit] = (value, value) if isinstance(value, int) else (value.soft, value.hard)
+
+        persistent_volumes = list(overlay_volumes) + [x[0] for x in self._caches.values()]
+        if self._sync_container is not None:
+            # the volume shared with the sync container is deleted together with the sync container
+            persistent_volumes.append(self._sync_volume_name)
+            volume_labels[self._sync_volume_name] = self._labels('sync', executor=False)
+
         if self._host_container_id is not None:
             # for Docker in Docker, we need to mount the docker socket from the host
             volumes['/var/run/docker.sock'] = {'bind': '/var/run/docker.sock', 'mode': 'rw'}
@@ -480,87 +1275,419 @@ class DockerExecutor(Executor):
         if 'dockerfile' in self._conf:
             dockerfile = os.path.join(self._base_dir, self._conf['dockerfile'])
 
-        self._container = Container(
-            f'brock-{config.project}-{name}-{self._hashed_base_dir}',
+        container_name = f'brock-{config.project}-{name}-{self._hashed_base_dir}'
+        container_args = dict(
             platform=self._platform,
-            image=self._conf.get('image'),
-            dockerfile=dockerfile,
             env=self.env_vars,
-            mac_address=self._conf.get('mac_address', None),
-            ports=self._conf.get('ports'),
             devices=self._conf.get('devices', []),
             volumes=volumes,
             host_container_id=self._host_container_id,
+            persistent_volumes=persistent_volumes,
+            tmpfs=tmpfs,
+            volume_labels=volume_labels,
+            cpus=resources.get('cpus'),
+            cpuset=resources.get('cpuset'),
+            memory=parse_size(resources['memory']) if 'memory' in resources else None,
+            shm_size=parse_size(resources['shm_size']) if 'shm_size' in resources else None,
+            ulimits=ulimits,
+        )
+        self._container = Container(
+            container_name,
+            image=self._conf.get('image'),
+            dockerfile=dockerfile,
+            mac_address=self._conf.get('mac_address', None),
+            ports=self._conf.get('ports'),
+            build_target=self._conf.get('build', {}).get('target'),
+            cache_from=self._conf.get('build', {}).get('cache_from', []),
+            buildkit=self._conf.get('build', {}).get('buildkit'),
+            labels=self._labels('executor'),
+            **container_args,
         )
+        # identical containers working on the same data, sharing the image (built by the main container)
+        # the ports and MAC address are not passed, they can't be shared
+        self._replicas = [
+            Container(
+                f'{container_name}-replica-{i}',
+                image=f'{container_name}:latest' if dockerfile else self._conf.get('image'),
+                labels=self._labels('replica'),
+                **container_args
+            ) for i in range(1, self._conf.get('replicas', 1))
+        ]
+
+        self._native_sync: Optional[NativeSync] = None
 
-    def sync_in(self):
+    @property
+    def idle_timeout(self) -> Optional[int]:
+        '''Seconds since the last use after which the executor is stopped, None if kept running'''
+        return self._idle_timeout * 60 if self._idle_timeout else None
+
+    @property
+    def idle_spares(self) -> int:
+        '''Number of idle containers of the same image kept running for instant reuse'''
+        return self._idle_spares
+
+    @property
+    def image(self) -> str:
+        return self._conf.get('image') or self._conf.get('dockerfile')
+
+    @property
+    def project_labels(self) -> Dict[str, str]:
+        '''Labels shared by all the containers and volumes of the project'''
+        return self._project_labels
+
+    @property
+    def hashed_base_dir(self) -> str:
+        return self._hashed_base_dir
+
+    @property
+    def container_name(self) -> str:
+        return self._container.name
+
+    @property
+    def used(self) -> bool:
+        '''True if the executor was used by this brock process'''
+        return self._used
+
+    @property
+    def _usage_path(self) -> str:
+        return os.path.join(get_cache_dir('usage'), self._container.name)
+
+    def record_use(self):
+        '''Records the executor is in use now, see last_used'''
+        self._used = True
+        try:
+            with open(self._usage_path, 'w'):
+                pass
+        except OSError:
+            pass
+
+    def last_used(self) -> Optional[float]:
+        try:
+            return os.path.getmtime(self._usage_path)
+        except OSError:
+            return None
+
+    def is_busy(self) -> bool:
+        '''Checks if a command is being executed in the executor'''
+        return self._container.has_running_exec()
+
+    def _lock(self, kind: str, shared: bool = False) -> FileLock:
+        '''Returns lock coordinating brock processes working with the executor
+
+        start - starting the executor, concurrent invocations wait for one startup
+        use - shared by commands running in the executor, exclusive for stopping it
+        sync - of the synced data (shared by the executors using the same sync volume), held while syncing
+        '''
+        if kind == 'sync':
+            return FileLock(f'{self._sync_volume_name}.sync', shared, f'syncing {self._sync_volume_name}')
+        return FileLock(f'{self._container.name}.{kind}', shared, f'{kind} of executor {self.name}')
+
+    def _labels(self, role: str, executor: bool = True) -> Dict[str, str]:
+        '''Returns labels of a container or volume with the role, not tied to this executor if shared'''
+        labels = dict(self._project_labels, **{Container.ROLE_LABEL: role})
+        if executor:
+            labels[Container.EXECUTOR_LABEL] = self.name
+        return labels
+
+    @property
+    def sync_group(self) -> Optional[str]:
+        return self._sync_group
+
+    @property
+    def synced(self) -> bool:
+        return self._sync_type is not None
+
+    def is_dirty(self) -> bool:
+        if not self._synced_in:
+            return False
+        return self._volume_changed()
+
+    def _volume_changed(self) -> bool:
+        '''Checks if the data in the volume were modified since the last sync, True if it can't be checked'''
+        if self._platform != 'linux' or not self._container.is_running():
+            return True
+        # anything written (or deleted) in the volume after the sync is newer than the marker
+        command = f'test -e {self._SYNC_MARKER} && find {self._mount_dir} -newer {self._SYNC_MARKER} | head -n 1'
+        exit_code, output = self._container.exec_output(['sh', '-c', command], '/')
+        return exit_code != 0 or bool(output.strip())
+
+    def _mark_synced(self):
+        '''Marks the time of the sync to be able to detect changes made by the executor'''
+        if self._platform != 'linux' or not self._container.is_running():
+            return
+        # backdated by a second as some find implementations compare whole seconds only
+        command = f'touch -d "@$(($(date +%s) - 1))" {self._SYNC_MARKER} 2>/dev/null || touch {self._SYNC_MARKER}'
+        self._container.exec_output(['sh', '-c', command], '/')
+
+    @property
+    def _synced_in(self) -> bool:
+        return self._sync_state['synced_in']
+
+    @_synced_in.setter
+    def _synced_in(self, value: bool):
+        self._sync_state['synced_in'] = value
+
+    @property
+    def _synced_scope(self) -> Optional[List[str]]:
+        return self._sync_state['synced_scope']
+
+    @_synced_scope.setter
+    def _synced_scope(self, value: Optional[List[str]]):
+        self._sync_state['synced_scope'] = value
+
+    def sync_in(self, chdir: Optional[str] = None, paths: Sequence[str] = ()):
         if not self._container.is_running():
             self._log.info('Executor not running -> starting')
-            self._start()
+            synced_in = self._synced_in
+            self._start(chdir, paths)
+            if self._synced_in and not synced_in:
+                # synced while starting
+                return
 
         if self._sync_type is None:
             return
 
+        # the executor is started before the sync lock is taken, the start lock is always the first one
+        with self._lock('sync'):
+            self._sync_in(chdir, paths)
+
+    def _sync_in(self, chdir: Optional[str] = None, paths: Sequence[str] = ()):
         if self._sync_type == 'rsync':
             if self._sync_container is None:
                 return
-            self._log.extra_info(f'Rsyncing data into docker volume')
-            self._rsync(self._HOST_PATH, self._RSYNC_PATH)
+            scope = self._get_sync_scope(chdir, paths)
+            if scope is None:
+                self._log.extra_info(f'Rsyncing data into docker volume')
+            else:
+                self._log.extra_info(f"Rsyncing {', '.join(scope)} into docker volume")
+            if self._sync_incremental:
+                if self._volume_changed():
+                    # the changes made in the volume were not synced out (skipped or failed), the manifest doesn't
+                    # describe the volume anymore
+                    self._invalidate_manifest()
+                self._rsync_incremental(scope)
+            else:
+                self._rsync(self._HOST_PATH, self._RSYNC_PATH, paths=scope)
+            if scope is None or self._synced_scope is None:
+                self._synced_scope = scope
+            else:
+                self._synced_scope = sorted(set(self._synced_scope + scope))
         elif self._sync_type == 'mutagen':
+            if self._sync_container is not None and not self._sync_container.is_running():
+                self._sync_container.start()
             if not MutagenSync.get(self._sync_volume_name):
                 self._create_mutagen_session()
 
             self._log.extra_info('Waiting for mutagen sync')
             if not MutagenSync.wait(self._sync_volume_name):
                 self._log.warning('Mutagen sync timed out')
+        elif self._sync_type == 'native':
+            self._log.extra_info('Syncing data into docker volume')
+            scanned, transferred = self._get_native_sync().sync_in()
+            self._log.extra_info(f'Sync stats: {scanned} files scanned, {transferred} files transferred')
         else:
             raise ExecutorError('Unknown sync type')
 
+        self._mark_synced()
         self._synced_in = True
 
     def sync_out(self):
         if not self._synced_in:
             return
 
+        with self._lock('sync'):
+            self._sync_out()
+
+    def _sync_out(self):
         if self._sync_type == 'rsync':
             if self._sync_container is None:
                 return
             self._log.extra_info(f'Rsyncing data out of docker volume')
-            self._rsync(self._RSYNC_PATH, self._HOST_PATH)
+            rules = None
+            if self._sync_outputs:
+                # only the declared outputs are synced back, other files on the host are left untouched
+                rules = ["--include '*/'"]
+                rules += [f"--include '{output}'" for output in self._sync_outputs]
+                rules += ["--exclude '*'", '--prune-empty-dirs']
+            previous = Manifest.load(self._manifest_path) if self._sync_incremental else None
+            if previous is None:
+                self._rsync(self._RSYNC_PATH, self._HOST_PATH, rules=rules, paths=self._synced_scope)
+            else:
+                try:
+                    # the transferred paths are logged, so the outputs are not seen as host changes next time
+                    self._sync_container.exec_output(['rm', '-f', self._TRANSFER_LOG], '/')
+                    self._rsync(
+                        self._RSYNC_PATH,
+                        self._HOST_PATH,
+                        extra_options=[f'--log-file={self._TRANSFER_LOG}', "--log-file-format='%i %n'"],
+                        rules=rules,
+                        paths=self._synced_scope
+                    )
+                    changed, deleted = self._read_transfer_log(self._sync_container)
+                except BaseException:
+                    # the host and the volume may differ in any file now, the next sync in compares them all
+                    self._invalidate_manifest()
+                    raise
+                # the host is not scanned again, files modified on the host meanwhile are synced in next time
+                previous.update(self._base_dir, changed, deleted).save(self._manifest_path)
+                # the volume matches the manifest again
+                self._mark_synced()
+            self._synced_scope = None
         elif self._sync_type == 'mutagen':
             self._log.extra_info('Waiting for mutagen sync')
             if not MutagenSync.wait(self._sync_volume_name):
                 self._log.warning('Mutagen sync timed out')
+        elif self._sync_type == 'native':
+            self._log.extra_info('Syncing data out of docker volume')
+            scanned, transferred = self._get_native_sync().sync_out()
+            self._log.extra_info(f'Sync stats: {scanned} files scanned, {transferred} files transferred')
         else:
             raise ExecutorError('Unknown sync type')
 
         self._synced_in = False
 
     def status(self) -> str:
-        res = 'Stopped'
-        if self._container.is_running() and (self._sync_container is None or self._sync_container.is_running()):
-            res = 'Running'
-        res += f'\n\t{self._container.name}'
-        if self._sync_container is not None:
-            res += f'\n\t{self._sync_container.name}'
+        return self.statuses([self])[self.name]
+
+    @classmethod
+    def statuses(cls, executors: Sequence['DockerExecutor'], usage: bool = False) -> Dict[str, str]:
+        '''Returns status of the executors (of one project) by their names
+
+        The running containers are found by a single query by their labels, memory usage is read concurrently.
+
+        :param usage: also show the CPU usage and size of the volumes, which takes a few seconds
+        '''
+        if not executors:
+            return {}
+        running = Container.list_labeled(executors[0]._project_labels)
+        # containers started by older brock versions have no labels
+        names = [x._container.name for x in executors]
+        names += [x._sync_container.name for x in executors if x._sync_container is not None]
+        running.update(Container.list_named([x for x in names if x not in running]))
+        with ThreadPoolExecutor(max_workers=max(len(running), 1)) as pool:
+            stats = dict(
+                zip(running, pool.map(partial(Container.resource_usage, one_shot=not usage), running.values()))
+            )
+
+        volume_sizes = {}
+        if usage and any(x._container.volume_names for x in executors):
+            volume_sizes = executors[0]._container.volume_sizes()
+
+        res = {}
+        for executor in executors:
+            containers = [executor._container]
+            if executor._sync_container is not None:
+                containers.append(executor._sync_container)
+            status = 'Running' if all(x.name in running for x in containers) else 'Stopped'
+
+            details = []
+            cpu, memory = stats.get(executor._container.name, (None, None))
+            if cpu is not None:
+                details.append(f'CPU {cpu:.1f}%')
+            if memory is not None:
+                details.append(f'memory {format_size(memory)}')
+            sizes = [volume_sizes.get(x, -1) for x in executor._container.volume_names]
+            sizes = [x for x in sizes if x >= 0]
+            if sizes:
+                details.append(f'volumes {format_size(sum(sizes))}')
+            if details:
+                status += f' ({", ".join(details)})'
+
+            status += ''.join(f'\n\t{x.name}' for x in containers)
+            status += ''.join(f'\n\t{x.name}' for x in executor._replicas if x.name in running)
+            res[executor.name] = status
         return res
 
     def stop(self):
-        self._container.stop()
-        if 'sync' in self._conf:
-            if self._sync_type == 'rsync' and self._sync_container:
-                self._sync_container.stop()
-            elif self._sync_type == 'mutagen':
-                if MutagenSync.get(self._sync_volume_name):
-                    self._log.extra_info(f'Terminating Mutagen sync session {self._sync_volume_name}')
-                    MutagenSync.terminate(self._sync_volume_name)
+        # waits for the commands running in the executor and for its startup
+        with self._lock('use'), self._lock('start'):
+            self._stop()
+            # unlike an idle stop or an image update, stopping explicitly drops the overlay content as well
+            for volume in self._overlay_volumes:
+                self._log.extra_info(f'Deleting overlay volume {volume}')
+                self._container.remove_volume(volume)
+
+    def stop_if_idle(self, now: Optional[float] = None) -> bool:
+        '''Stops the executor if it is still idle for its timeout, skipped if another process is using it
+
+        :return: True if the executor was stopped
+        '''
+        lock = self._lock('use')
+        if not lock.acquire(blocking=False):
+            return False
+        try:
+            # checked again under the lock, a command may have been run since the executor was found idle
+            last_used = self.last_used()
+            if self.idle_timeout is None or last_used is None or self.is_busy() or \
+                    last_used + self.idle_timeout > (now or time.time()):
+                return False
+            with self._lock('start'):
+                self._stop()
+            return True
+        finally:
+            lock.release()
+
+    def _stop(self):
+        # the replicas use the volumes of the executor container, they are stopped first
+        errors = run_parallel([(x.name, partial(x.stop, delete_volumes=False)) for x in self._replicas],
+                              aggregate=False)
+        if errors:
+            raise ExecutorError('; '.join(format_error(x) for _, x in errors))
+
+        if self._sync_container is not None and self._is_sync_volume_used():
+            self._log.extra_info(f'Volume {self._sync_volume_name} is used by other executors, keeping it')
+            self._container.stop()
+            return
+
+        # the main and the sync container are stopped concurrently, the sync volume is deleted once both are gone
+        tasks = [(self._container.name, self._container.stop)]
+        if self._sync_type in ('rsync', 'mutagen'):
+            tasks.append((self._sync_volume_name, self._stop_sync))
+        errors = run_parallel(tasks, aggregate=False)
+        if self._sync_container is not None and not errors:
+            self._sync_container.delete_volumes()
+        if errors:
+            raise ExecutorError('; '.join(format_error(x) for _, x in errors))
+        self._synced_in = False
+
+    def _stop_sync(self):
+        with self._lock('sync'):
+            self._stop_sync_container()
+
+    def _stop_sync_container(self):
+        if self._sync_type == 'rsync' and self._sync_container:
+            self._sync_container.stop(delete_volumes=False)
+        elif self._sync_type == 'mutagen':
+            if MutagenSync.get(self._sync_volume_name):
+                self._log.extra_info(f'Terminating Mutagen sync session {self._sync_volume_name}')
+                MutagenSync.terminate(self._sync_volume_name)
+            if self._sync_container is not None:
+                self._sync_container.stop(delete_volumes=False)
+
+    def _is_sync_volume_used(self) -> bool:
+        '''Checks if the volume of the sync container is used by containers of other executors'''
+        if self._sync_container is None:
+            return False
+        users = self._sync_container.volume_users(self._sync_volume_name)
+        return any(x not in (self._sync_container.name, self._container.name) for x in users)
 
     def restart(self) -> int:
         self.stop()
         return self._start()
 
     def update(self):
-        self._container.update()
+        # the container is stopped if the image changed
+        with self._lock('use'):
+            self._update()
+
+    def _update(self):
+        tasks = [(self._container.name, self._container.update)]
+        if self._sync_container is not None and not self._sync_container.is_running():
+            # a changed image would stop the container, the running sync container (and its volume) is kept
+            tasks.append((self._sync_container.name, self._sync_container.update))
+        errors = run_parallel(tasks, aggregate=False)
+        if errors:
+            raise ExecutorError('; '.join(format_error(x) for _, x in errors))
 
     def exec(
         self,
@@ -568,8 +1695,6 @@ class DockerExecutor(Executor):
         chdir: Optional[str] = None,
         env_options: Optional[dict] = None
     ) -> int:
-        if env_options is not None:
-            self.env_vars.update(env_options)
         if not self._container.is_running():
             self._log.info('Executor not running -> starting')
             exit_code = self._start()
@@ -581,7 +1706,94 @@ class DockerExecutor(Executor):
         directory = self._work_dir
         if chdir:
             directory = self._mount_dir + '/' + chdir
-        return self._container.exec(command, directory)
+        self.record_use()
+        try:
+            with self._lock('use', shared=True):
+                # the options are for this command only, the environment of the container is not changed
+                return self._container.exec(command, directory, env=env_options)
+        finally:
+            self.record_use()
+
+    def exec_sharded(
+        self,
+        command: Union[str, Sequence[str]],
+        items: Sequence[str],
+        chdir: Optional[str] = None,
+        env_options: Optional[dict] = None
+    ) -> int:
+        if not self._replicas:
+            return super().exec_sharded(command, items, chdir, env_options)
+
+        if not self._container.is_running():
+            self._log.info('Executor not running -> starting')
+            exit_code = self._start()
+            if exit_code != 0:
+                return exit_code
+        if not self._synced_in:
+            self.sync_in()
+        self._start_replicas()
+
+        directory = self._work_dir
+        if chdir:
+            directory = self._mount_dir + '/' + chdir
+
+        # the replicas take the items one by one as a work queue, no more items are taken once interrupted
+        work: 'queue.Queue[str]' = queue.Queue()
+        for item in items:
+            work.put(item)
+        stop = threading.Event()
+        failed: List[Tuple[str, int]] = []
+
+        def worker(index: int, container: Container):
+            while not stop.is_set():
+                try:
+                    item = work.get_nowait()
+                except queue.Empty:
+                    return
+                env = dict(env_options or {}, BROCK_SHARD_ITEM=item)
+                exit_code = container.exec(command, directory, env=env, prefix=f'[{index}] ')
+                if exit_code != 0:
+                    self._log.error(f'[{index}] Failed {item} (exit code {exit_code})')
+                    failed.append((item, exit_code))
+
+        containers = [self._container] + self._replicas
+        self._log.extra_info(f'Running {len(items)} items in {len(containers)} replicas')
+        self.record_use()
+        try:
+            with self._lock('use', shared=True):
+                errors = run_parallel([(x.name, partial(worker, i, x)) for i, x in enumerate(containers)],
+                                      aggregate=False,
+                                      stop=stop)
+        finally:
+            self.record_use()
+        if errors:
+            raise ExecutorError('; '.join(format_error(x) for _, x in errors))
+        if failed:
+            self._log.error(f"{len(failed)} of {len(items)} items failed: {', '.join(x for x, _ in failed)}")
+            # exit code of the first failed item, independent of the order the replicas finished
+            order = {x: i for i, x in enumerate(items)}
+            return min(failed, key=lambda x: order[x[0]])[1]
+        return 0
+
+    def _start_replicas(self):
+        '''Starts the replicas in the same prepared state as the executor container'''
+        with self._lock('start'):
+            replicas = [x for x in self._replicas if not x.is_running()]
+            if not replicas:
+                return
+            self._log.info(f'Starting {len(replicas)} replicas')
+            snapshot = self._get_snapshot()
+            image = snapshot if snapshot is not None and self._container.has_image(snapshot) else None
+            errors = run_parallel([(x.name, partial(self._start_replica, x, image)) for x in replicas], aggregate=False)
+        if errors:
+            raise ExecutorError('; '.join(format_error(x) for _, x in errors))
+
+    def _start_replica(self, replica: Container, snapshot: Optional[str]):
+        replica.start(image=snapshot)
+        for command in [] if snapshot else self._prepare:
+            if replica.exec(command, self._mount_dir, prefix=f'[{replica.name}] ') != 0:
+                replica.stop(delete_volumes=False)
+                raise ExecutorError(f'Failed to execute prepare steps in {replica.name}')
 
     def shell(self) -> int:
         if not self._container.is_running():
@@ -595,35 +1807,351 @@ class DockerExecutor(Executor):
         if shell is None:
             raise ExecutorError('Shell is not defined')
 
-        return self._container.shell(shell, self._work_dir)
+        self.record_use()
+        try:
+            with self._lock('use', shared=True):
+                return self._container.shell(shell, self._work_dir)
+        finally:
+            self.record_use()
+
+    def cache_stats(self) -> List[Tuple[str, str, Optional[int], Optional[int]]]:
+        if not self._caches:
+            return []
+        sizes = self._container.volume_sizes()
+        stats = []
+        for name, (volume, path, limit) in self._caches.items():
+            size = sizes.get(volume)
+            stats.append((name, path, size if size is None or size >= 0 else None, limit))
+        return stats
+
+    def prune_caches(self):
+        for name in self._caches:
+            self._clear_cache(name)
+
+    def _clear_cache(self, name: str):
+        volume, path, _ = self._caches[name]
+        self._log.info(f'Clearing cache {name}')
+        if not self._container.is_running():
+            # the volume is shared by executors of the project, it must not be removed under them
+            users = [x for x in self._container.volume_users(volume) if x != self._container.name]
+            if users:
+                raise ExecutorError(
+                    f"Cache {name} is used by {', '.join(users)}, clear it while executor {self.name} is running"
+                )
+            self._container.remove_volume(volume)
+        elif self._platform == 'linux':
+            exit_code = self._container.exec(['find', path, '-mindepth', '1', '-delete'], '/')
+            if exit_code != 0:
+                raise ExecutorError(f'Failed to clear cache {name}')
+        else:
+            raise ExecutorError(f'Executor {self.name} must be stopped to clear its caches')
+
+    def _check_cache_limits(self):
+        '''Evicts the least recently used files of the caches exceeding their size limit'''
+        if self._platform != 'linux':
+            return
+        for name, (volume, path, limit) in self._caches.items():
+            if limit is None:
+                continue
+            exit_code, output = self._container.exec_output([
+                'find', path, '-type', 'f', '-exec', 'stat', '-c', '%X %Y %s %n', '{}', '+'
+            ], '/')
+            if exit_code != 0:
+                self._log.warning(f'Failed to check size of cache {name}')
+                continue
+
+            files = []
+            for line in output.decode('utf-8', 'replace').splitlines():
+                try:
+                    atime, mtime, size, file = line.split(' ', 3)
+                    # the access time may not be updated on every read (relatime, noatime)
+                    files.append((max(int(atime), int(mtime)), int(size), file))
+                except ValueError:
+                    continue
+            total = sum(x[1] for x in files)
+            if total <= limit:
+                continue
 
-    def _start(self) -> int:
+            self._log.warning(
+                f'Cache {name} exceeds its size limit ({format_size(total)} > {format_size(limit)}), '
+                'evicting the least recently used files'
+            )
+            evicted = []
+            for _, size, file in sorted(files):
+                if total <= limit:
+                    break
+                evicted.append(file)
+                total -= size
+            _remove_in_container(self._container, evicted, '/')
+
+    def export(self, paths: Sequence[str] = ()) -> int:
+        patterns = list(paths) or self._overlay_exports
+        if not patterns:
+            raise ExecutorError('No artifacts to export, specify the paths or configure export of the overlays')
+        if not self._container.is_running():
+            self._log.info('Executor not running -> starting')
+            exit_code = self._start()
+            if exit_code != 0:
+                return exit_code
+
+        exported = 0
+        for pattern in patterns:
+            pattern = posixpath.normpath(pattern.replace('\\', '/')).strip('/')
+            if not any(pattern == x or pattern.startswith(x + '/') for x in self._overlay_paths):
+                raise ExecutorError(f'Path {pattern} is not inside any overlay')
+
+            for match in self._find_exported(pattern):
+                archive = self._container.get_archive(f'{self._mount_dir}/{match}')
+                if archive is None:
+                    continue
+                dest = os.path.join(self._base_dir, posixpath.dirname(match))
+                os.makedirs(dest, exist_ok=True)
+                with archive, tarfile.open(fileobj=archive) as tar:
+                    _extract_tar(tar, dest)
+                self._log.extra_info(f'Exported {match}')
+                exported += 1
+
+        if exported == 0:
+            raise ExecutorError('No artifacts found')
+        self._log.info(f'Exported {exported} artifacts')
+        return 0
+
+    def _find_exported(self, pattern: str) -> List[str]:
+        '''Returns paths in the container (relative to the mount directory) matching the glob pattern
+
+        The directories are listed by find (no shell is involved) and matched here.
+        '''
+        parts = pattern.split('/')
+        first_glob = next((i for i, x in enumerate(parts) if re.search(r'[*?[]', x)), len(parts))
+        if first_glob == len(parts) or self._platform != 'linux':
+            return [pattern]
+
+        base = '/'.join(parts[:first_glob]) or '.'
+        depth = len(parts) - first_glob
+        exit_code, output = self._container.exec_output([
+            'find', base, '-mindepth', str(depth), '-maxdepth',
+            str(depth)
+        ], self._mount_dir)
+        if exit_code != 0:
+            return []
+        matches = []
+        for line in output.decode('utf-8', 'replace').splitlines():
+            path = posixpath.normpath(line)
+            if all(fnmatch.fnmatchcase(x, y) for x, y in zip(path.split('/')[-depth:], parts[first_glob:])):
+                matches.append(path)
+        return sorted(matches)
+
+    def warm_up(self, chdir: Optional[str] = None, paths: Sequence[str] = ()) -> bool:
+        if self._container.is_running():
+            return False
+        if self._start(chdir, paths) != 0:
+            # started again (with the errors reported) when used
+            return False
+        return self._synced_in
+
+    def _start(self, chdir: Optional[str] = None, paths: Sequence[str] = ()) -> int:
         if self._container.is_running():
             return 0
+        # concurrent brock invocations wait for the one starting the executor
+        with self._lock('start'):
+            if self._container.is_running():
+                self._log.extra_info(f'Executor {self.name} was started by another brock process')
+                return 0
+            return self._start_container(chdir, paths)
+
+    def _start_container(self, chdir: Optional[str] = None, paths: Sequence[str] = ()) -> int:
+        snapshot = self._get_snapshot()
+        if snapshot is not None and self._container.has_image(snapshot):
+            self._log.info('Using snapshot of the prepared executor, skipping prepare steps')
+            self._container.start(image=snapshot)
+            prepare = []
+        else:
+            self._container.start()
+            prepare = self._prepare
+        self.record_use()
+        self._check_cache_limits()
 
-        self._container.start()
+        try:
+            if not self._synced_in:
+                self.sync_in(chdir, paths)
+
+            for command in prepare:
+                exit_code = self._container.exec(command, self._mount_dir)
+                if exit_code != 0:
+                    self._log.error('Failed to execute prepare steps')
+                    self._container.stop()
+                    return exit_code
+        except BaseException:
+            # a running container is considered prepared, the next start must not skip the prepare steps
+            if prepare:
+                self._container.stop()
+            raise
+
+        if prepare and snapshot is not None:
+            self._log.info(f'Creating snapshot {snapshot}')
+            repository, tag = snapshot.rsplit(':', 1)
+            self._container.commit(repository, tag)
+            # snapshots of the previous image, prepare steps or their inputs are not used anymore
+            self._container.remove_images(repository, snapshot)
+        return 0
 
-        if not self._synced_in:
-            self.sync_in()
+    def _get_snapshot(self) -> Optional[str]:
+        '''Returns name of the snapshot image for the current image, prepare steps and their inputs'''
+        if not self._snapshot or not self._prepare:
+            return None
+        if self._platform != 'linux':
+            self._log.warning('Snapshots are supported only for linux containers')
+            return None
 
+        # a start from the snapshot skips the build, the image is rebuilt here if its build context changed
+        digest = hashlib.sha256(self._container.image_id().encode('utf-8'))
         for command in self._prepare:
-            exit_code = self._container.exec(command, self._mount_dir)
-            if exit_code != 0:
-                self._log.error('Failed to execute prepare steps')
-                self._container.stop()
-                return exit_code
-        return 0
+            digest.update(b'\0' + command.encode('utf-8'))
+        for path in self._snapshot_inputs:
+            digest.update(b'\0' + path.encode('utf-8') + b'\0')
+            try:
+                with open(os.path.join(self._base_dir, path), 'rb') as f:
+                    for chunk in iter(lambda: f.read(65536), b''):
+                        digest.update(chunk)
+            except OSError:
+                self._log.warning(f'Snapshot input {path} not found')
+        return f'{self._snapshot_repository}:{digest.hexdigest()[:20]}'
 
     def _create_mutagen_session(self):
         self._log.info('Creating mutagen sync session')
 
-        options = self._sync_options if self._sync_options else []
+        options = list(self._sync_options) if self._sync_options else []
         if len(self._sync_exclude):
             options.append(f'--ignore={"/*,".join(self._sync_exclude)}/*')
+        # Mutagen evaluates ignores as git does - the last matching one wins
+        for include, pattern in reversed(self._get_gitignore_rules()):
+            options.append(f'--ignore={"!" if include else ""}{pattern}')
+
+        if self._sync_container is not None:
+            # shared session synced through the helper container, independent of the executor containers
+            MutagenSync.create(
+                self._sync_volume_name, self._base_dir, self._sync_container.name, self._HOST_PATH, options
+            )
+        else:
+            MutagenSync.create(self._sync_volume_name, self._base_dir, self._container.name, self._mount_dir, options)
+
+    @property
+    def _manifest_path(self) -> str:
+        return os.path.join(get_cache_dir('manifests'), f'{self._sync_volume_name}.json')
+
+    def _scan_manifest(self, scope: Optional[List[str]] = None) -> Manifest:
+        return Manifest.scan(self._base_dir, self._get_path_filter(), scope)
 
-        MutagenSync.create(self._sync_volume_name, self._base_dir, self._container.name, self._mount_dir, options)
+    def _get_path_filter(self) -> PathFilter:
+        return PathFilter.from_sync_config(
+            self._sync_filter, self._sync_include, self._sync_exclude, self._get_gitignore_rules()
+        )
 
-    def _rsync(self, src: str, dest: str):
+    def _get_gitignore_rules(self) -> List[Tuple[bool, str]]:
+        '''Returns sync filter rules derived from the .gitignore files if enabled'''
+        if self._sync_gitignore_rules is None:
+            self._sync_gitignore_rules = []
+            if self._sync_gitignore:
+                self._sync_gitignore_rules = GitIgnore.load(self._base_dir).rules
+                self._log.debug(f'Using {len(self._sync_gitignore_rules)} sync rules from .gitignore files')
+        return self._sync_gitignore_rules
+
+    def _get_native_sync(self) -> NativeSync:
+        if self._native_sync is None:
+            self._native_sync = NativeSync(self._container, self._base_dir, self._mount_dir, self._get_path_filter())
+        return self._native_sync
+
+    def _get_sync_scope(self, chdir: Optional[str], paths: Sequence[str]) -> Optional[List[str]]:
+        '''Returns relative paths to sync in scoped mode, None if the whole tree must be synced'''
+        if not self._sync_scoped:
+            return None
+
+        scope = set()
+        for path in [chdir or self._work_dir_rel] + self._sync_paths + list(paths):
+            path = posixpath.normpath(path.replace('\\', '/')).strip('/')
+            if path in ('', '.'):
+                return None
+            if path.startswith('..'):
+                raise ExecutorError(f'Sync path {path} is outside of the project directory')
+            scope.add(path)
+        return sorted(scope)
+
+    def _invalidate_manifest(self):
+        try:
+            os.remove(self._manifest_path)
+        except FileNotFoundError:
+            pass
+
+    def _read_transfer_log(self, container: Container) -> Tuple[List[str], List[str]]:
+        '''Returns relative paths transferred (changed) and deleted by the last rsync logging them'''
+        exit_code, output = container.exec_output(['cat', self._TRANSFER_LOG], '/')
+        if exit_code != 0:
+            raise ExecutorError('Failed to read the rsync log')
+        changed = []
+        deleted = []
+        for line in output.decode('utf-8', 'replace').splitlines():
+            m = self._TRANSFER_LOG_REGEX.match(line)
+            if m is None:
+                continue
+            path = m.group(2).rstrip('/')
+            if path == '.':
+                continue
+            if m.group(1) == '*deleting':
+                deleted.append(path)
+            else:
+                changed.append(path)
+        return changed, deleted
+
+    def _rsync_incremental(self, scope: Optional[List[str]] = None):
+        '''Rsyncs only the paths changed since the last sync into the volume
+
+        The host tree is compared with the manifest saved after the last sync,
+        the rsync is skipped completely if nothing changed. A full rsync is
+        used if there is no manifest or the volume was recreated meanwhile.
+        '''
+        if self._sync_container is None:
+            return
+
+        current = self._scan_manifest(scope)
+        volume = self._sync_container.volume_id(self._sync_volume_name)
+        previous = Manifest.load(self._manifest_path)
+
+        if previous is None or previous.volume != volume:
+            self._log.debug('No valid sync manifest, running full rsync')
+            self._rsync(self._HOST_PATH, self._RSYNC_PATH, paths=scope)
+            previous = Manifest()
+            transferred = len(current)
+        else:
+            changed, deleted = previous.diff(current, scope)
+            transferred = len(changed) + len(deleted)
+            if transferred:
+                self._sync_container.put_file(self._FILES_FROM, '\n'.join(changed + deleted).encode('utf-8'))
+                self._rsync(
+                    self._HOST_PATH,
+                    self._RSYNC_PATH,
+                    extra_options=[f'--files-from={self._FILES_FROM}', '--delete-missing-args', '--force']
+                )
+            else:
+                self._log.extra_info('No changes since the last sync, skipping rsync')
+
+        self._log.extra_info(f'Sync stats: {len(current)} files scanned, {transferred} files transferred')
+        current.volume = volume
+        previous.merge(current, scope).save(self._manifest_path)
+
+    def _rsync(
+        self,
+        src: str,
+        dest: str,
+        extra_options: Sequence[str] = (),
+        rules: Optional[List[str]] = None,
+        paths: Optional[List[str]] = None
+    ):
+        '''Runs rsync in the sync container
+
+        :param extra_options: additional rsync options
+        :param rules: rsync filter options to use instead of the configured filter/include/exclude
+        :param paths: relative paths to sync instead of the whole directory
+        '''
         if self._sync_container is None:
             return 0
 
@@ -635,14 +2163,27 @@ class DockerExecutor(Executor):
             # use default options
             options = ['-a', '--delete']
 
-        for filter_ in self._sync_filter:
-            options.append(f"--filter '{filter_}'")
-        for include in self._sync_include:
-            options.append(f"--include '{include}'")
-        for exclude in self._sync_exclude:
-            options.append(f"--exclude '{exclude}'")
+        if rules is None:
+            rules = []
+            for filter_ in self._sync_filter:
+                rules.append(f"--filter '{filter_}'")
+            for include in self._sync_include:
+                rules.append(f"--include '{include}'")
+            for exclude in self._sync_exclude:
+                rules.append(f"--exclude '{exclude}'")
+            for include, pattern in self._get_gitignore_rules():
+                rules.append('--filter ' + shlex.quote(f"{'+' if include else '-'} {pattern}"))
+        options += rules
+        options += extra_options
+
+        if paths is None:
+            sources = f'{src}/'
+        else:
+            # keep the relative paths (the part after /./) in the destination
+            options += ['--relative', '--ignore-missing-args']
+            sources = ' '.join(f"'{src}/./{path}'" for path in paths)
 
-        exit_code = self._sync_container.exec(f"rsync {' '.join(options)} {src}/ {dest}", '/')
+        exit_code = self._sync_container.exec(f"rsync {' '.join(options)} {sources} {dest}", '/')
         if exit_code != 0:
             raise ExecutorError(f'Failed to rsync data')
         return exit_code
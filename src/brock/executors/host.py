@@ -34,10 +34,9 @@ class HostExecutor(Executor):
         chdir: Optional[str] = None,
         env_options: Optional[dict] = None
     ) -> int:
-        if env_options is not None:
-            os.environ.update(env_options)
-
-        os.environ['PYTHONUNBUFFERED'] = '1'
+        # the environment of brock is not changed, other projects may run commands in other threads meanwhile
+        env = dict(os.environ, **(env_options or {}))
+        env['PYTHONUNBUFFERED'] = '1'
 
         self._log.extra_info(f'Executing command on host: {command}')
         if not chdir:
@@ -47,6 +46,7 @@ class HostExecutor(Executor):
             proc = subprocess.Popen(
                 command,
                 cwd=os.path.join(self._base_dir, chdir),
+                env=env,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
             )
@@ -0,0 +1,232 @@
+import os
+import re
+import json
+import time
+import hashlib
+import datetime
+import docker
+from typing import Dict, List, Optional, Tuple, Union
+
+from brock.cache import get_cache_dir
+from brock.exception import ExecutorError, UsageError
+from brock.executors.docker import Container
+from brock.log import get_logger
+from brock.size import format_size
+
+AGE_REGEX = re.compile(r'^\s*(\d+)\s*([smhdw]?)\s*$', re.IGNORECASE)
+_AGE_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 7 * 86400}
+
+# containers, volumes and images named by the executors end with the hash of the project directory
+_HASH_REGEX = re.compile(r'-([0-9a-f]{32})(?::[^/]*)?$')
+_TIME_REGEX = re.compile(r'^(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d)(?:\.\d+)?(Z|[+-]\d\d:\d\d)?')
+
+
+def parse_age(age: str) -> int:
+    '''Parses age like 30d, 12h or 90m to seconds, days are assumed without a unit'''
+    m = AGE_REGEX.match(age)
+    if not m:
+        raise UsageError(f'Invalid age {age}, use e.g. 30d, 12h or 90m')
+    return int(m.group(1)) * _AGE_UNITS[(m.group(2) or 'd').lower()]
+
+
+def record_usage(base_dir: str):
+    '''Records the project directory is in use, the time of the last use is the file modification time'''
+    hashed_base_dir = hashlib.md5(base_dir.encode('ascii')).hexdigest()
+    path = os.path.join(get_cache_dir('projects'), f'{hashed_base_dir}.json')
+    try:
+        with open(path, 'w') as f:
+            json.dump({'path': base_dir}, f)
+    except OSError:
+        pass
+
+
+def _load_usage() -> Dict[str, Tuple[str, float]]:
+    '''Returns the recorded project directories and the time of their last use by their hashes'''
+    usage = {}
+    root = get_cache_dir('projects')
+    for name in os.listdir(root):
+        if not name.endswith('.json'):
+            continue
+        path = os.path.join(root, name)
+        try:
+            with open(path) as f:
+                usage[name[:-5]] = (json.load(f)['path'], os.path.getmtime(path))
+        except (OSError, ValueError, KeyError):
+            continue
+    return usage
+
+
+def _parse_time(value: Union[int, str, None]) -> Optional[float]:
+    if isinstance(value, int):
+        return float(value)
+    m = _TIME_REGEX.match(value or '')
+    if not m:
+        return None
+    timezone = (m.group(2) or 'Z').replace('Z', '+00:00')
+    return datetime.datetime.fromisoformat(m.group(1) + timezone).timestamp()
+
+
+class Resource:
+    '''Docker container, volume or image created by brock'''
+
+    def __init__(
+        self,
+        kind: str,
+        name: str,
+        id: str,
+        labels: Optional[Dict[str, str]],
+        size: int,
+        created: Optional[float],
+        running: bool = False
+    ):
+        self.kind = kind
+        self.name = name
+        self.id = id
+        self.size = size
+        self.created = created
+        self.running = running
+        labels = labels or {}
+        self.path: Optional[str] = labels.get(Container.PATH_LABEL)
+        self.hashed_base_dir: Optional[str] = labels.get(Container.BASE_DIR_LABEL)
+        if labels.get(Container.ROLE_LABEL) == 'cache':
+            # shared by all checkouts of the project, cleared by --cache-prune
+            self.hashed_base_dir = None
+        elif self.hashed_base_dir is None:
+            m = _HASH_REGEX.search(name)
+            if m and (labels.get(Container.PROJECT_LABEL) or name.startswith('brock-') or '-rsync-volume-' in name):
+                self.hashed_base_dir = m.group(1)
+
+
+def _list_resources(client: docker.DockerClient) -> List[Resource]:
+    '''Lists the resources of brock projects using a single disk usage query'''
+    try:
+        usage = client.df()
+    except docker.errors.APIError as ex:
+        raise ExecutorError(f'Failed to get disk usage: {ex}')
+
+    resources = []
+    for container in usage.get('Containers') or []:
+        name = (container.get('Names') or ['/'])[0][1:]
+        resources.append(
+            Resource(
+                'container',
+                name,
+                container['Id'],
+                container.get('Labels'),
+                container.get('SizeRw') or 0,
+                _parse_time(container.get('Created')),
+                running=container.get('State') == 'running'
+            )
+        )
+    for volume in usage.get('Volumes') or []:
+        resources.append(
+            Resource(
+                'volume', volume['Name'], volume['Name'], volume.get('Labels'),
+                max((volume.get('UsageData') or {}).get('Size', 0), 0), _parse_time(volume.get('CreatedAt'))
+            )
+        )
+    for image in usage.get('Images') or []:
+        tags = [x for x in image.get('RepoTags') or [] if x != '<none>:<none>']
+        brock_tags = [x for x in tags if x.startswith('brock-')]
+        labels = image.get('Labels')
+        if not (labels or {}).get(Container.BASE_DIR_LABEL) and not brock_tags:
+            continue
+        # the layers shared with other images are not freed
+        size = image.get('Size', 0) - max(image.get('SharedSize', 0), 0)
+        resources.append(
+            Resource(
+                'image', (brock_tags or tags or [image['Id']])[0], image['Id'], labels, size,
+                _parse_time(image.get('Created'))
+            )
+        )
+    return [x for x in resources if x.hashed_base_dir is not None]
+
+
+def collect(client: docker.DockerClient, max_age: Optional[int] = None) -> List[Tuple[Resource, str]]:
+    '''Returns the resources of projects whose directory no longer exists or which weren't used for max_age seconds
+
+    :return: list of (resource, reason) tuples
+    '''
+    resources = _list_resources(client)
+    usage = _load_usage()
+    now = time.time()
+
+    projects: Dict[str, List[Resource]] = {}
+    for resource in resources:
+        if resource.hashed_base_dir is not None:
+            projects.setdefault(resource.hashed_base_dir, []).append(resource)
+
+    orphans = []
+    for hashed_base_dir, project_resources in projects.items():
+        if any(x.running for x in project_resources):
+            continue
+
+        path, last_used = usage.get(hashed_base_dir, (None, None))
+        path = path or next((x.path for x in project_resources if x.path), None)
+        if last_used is None:
+            last_used = max((x.created for x in project_resources if x.created is not None), default=None)
+
+        if path is not None and not os.path.isdir(path):
+            reason = f'{path} does not exist'
+        elif max_age is not None and last_used is not None and now - last_used > max_age:
+            days = (now - last_used) / 86400
+            reason = f'{path or hashed_base_dir} not used for {days:.0f} days'
+        else:
+            continue
+        orphans += [(x, reason) for x in project_resources]
+    return orphans
+
+
+def _remove(client: docker.DockerClient, resource: Resource):
+    try:
+        if resource.kind == 'container':
+            client.api.remove_container(resource.id, v=False)
+        elif resource.kind == 'volume':
+            client.api.remove_volume(resource.id)
+        else:
+            client.api.remove_image(resource.id, force=True)
+    except docker.errors.NotFound:
+        pass
+    except docker.errors.APIError as ex:
+        raise ExecutorError(f'Failed to remove {resource.kind} {resource.name}: {ex}')
+
+
+def gc(max_age: Optional[str] = None, dry_run: bool = False):
+    '''Removes containers, volumes and images of moved, deleted or (if max_age is set) unused projects'''
+    log = get_logger()
+    try:
+        client = docker.from_env()
+    except docker.errors.DockerException as ex:
+        raise ExecutorError(f'Docker engine is not running: {ex}')
+
+    orphans = collect(client, parse_age(max_age) if max_age else None)
+    if not orphans:
+        log.info('No orphaned resources found')
+        return
+
+    reason = None
+    for resource, resource_reason in orphans:
+        if resource_reason != reason:
+            reason = resource_reason
+            print(f'{reason}:')
+        print(f'\t{resource.kind} {resource.name} {format_size(resource.size)}')
+    if dry_run:
+        total = format_size(sum(x.size for x, _ in orphans))
+        log.info(f'{total} can be reclaimed by removing {len(orphans)} resources')
+        return
+
+    # the containers are removed first, so their volumes and images are not in use
+    order = {'container': 0, 'volume': 1, 'image': 2}
+    failed = 0
+    reclaimed = 0
+    for resource, _ in sorted(orphans, key=lambda x: order[x[0].kind]):
+        log.extra_info(f'Removing {resource.kind} {resource.name}')
+        try:
+            _remove(client, resource)
+            reclaimed += resource.size
+        except ExecutorError as ex:
+            log.warning(ex.message)
+            failed += 1
+    log.info(f'Removed {len(orphans) - failed} resources, {format_size(reclaimed)} reclaimed')
+    if failed:
+        raise ExecutorError(f'Failed to remove {failed} resources')
@@ -0,0 +1,86 @@
+import os
+import sys
+import time
+from typing import IO, Optional
+
+from brock.cache import get_cache_dir
+from brock.log import get_logger
+
+if sys.platform == 'win32':
+    import msvcrt
+else:
+    import fcntl
+
+
+class FileLock:
+    '''Lock shared by brock processes (and threads), backed by a file in the brock cache directory
+
+    Shared locks can be held by multiple holders at once, exclusive ones by a single holder. On Windows,
+    shared locks are exclusive too.
+    '''
+
+    def __init__(self, name: str, shared: bool = False, description: Optional[str] = None):
+        '''
+        :param name: name of the lock, processes using the same name are coordinated
+        :param shared: take a shared lock instead of an exclusive one
+        :param description: what the lock guards, reported when waiting for it
+        '''
+        self._path = os.path.join(get_cache_dir('locks'), name)
+        self._shared = shared
+        self._description = description or name
+        self._file: Optional[IO] = None
+
+    def _try_lock(self, file: IO) -> bool:
+        if sys.platform == 'win32':
+            try:
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+            except OSError:
+                return False
+        else:
+            flags = (fcntl.LOCK_SH if self._shared else fcntl.LOCK_EX) | fcntl.LOCK_NB
+            try:
+                fcntl.flock(file.fileno(), flags)
+            except BlockingIOError:
+                return False
+        return True
+
+    def acquire(self, blocking: bool = True) -> bool:
+        '''Acquires the lock, waiting for the other holders if blocking
+
+        :return: True if the lock was acquired
+        '''
+        # each holder needs its own file description, flock locks of the same description don't conflict
+        file = open(self._path, 'a+')
+        if not self._try_lock(file):
+            if not blocking:
+                file.close()
+                return False
+
+            get_logger().info(f'Waiting for another brock process ({self._description})')
+            if sys.platform == 'win32':
+                while not self._try_lock(file):
+                    time.sleep(0.1)
+            else:
+                fcntl.flock(file.fileno(), fcntl.LOCK_SH if self._shared else fcntl.LOCK_EX)
+        self._file = file
+        return True
+
+    def release(self):
+        file = self._file
+        if file is None:
+            return
+        if sys.platform == 'win32':
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+        file.close()
+        self._file = None
+
+    def __enter__(self) -> 'FileLock':
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
@@ -1,7 +1,11 @@
+import io
 import logging
 import os
 import sys
 import platform
+import threading
+from contextlib import contextmanager
+from typing import Iterator, Optional
 
 from colorama import Fore, Style
 from colorama.initialise import wrap_stream
@@ -187,3 +191,98 @@ def set_verbosity(verbosity):
 
 def get_logger():
     return Logger.manager.getLogger('color')
+
+
+# per-thread output buffers used while running operations concurrently
+_output = threading.local()
+_redirect_lock = threading.Lock()
+_redirect_count = 0
+_redirected_streams: list = []
+
+
+class OutputBuffer(io.StringIO):
+    '''Output of a thread, written directly to the output streams once it is set live'''
+
+    def __init__(self):
+        super().__init__()
+        self.live = False
+        self.lock = threading.Lock()
+
+    def go_live(self):
+        '''Prints the output buffered so far, the following output is not buffered'''
+        with self.lock:
+            print(self.getvalue(), end='')
+            self.live = True
+
+
+class ThreadStream:
+    '''Stream writing to the buffer of the current thread if set, to the wrapped stream otherwise'''
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, data):
+        buffer = get_output_buffer()
+        if buffer is not None:
+            with buffer.lock:
+                if not buffer.live:
+                    return buffer.write(data)
+        return self.stream.write(data)
+
+    def flush(self):
+        buffer = get_output_buffer()
+        if buffer is None or buffer.live:
+            self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def get_output_buffer() -> Optional[OutputBuffer]:
+    return getattr(_output, 'buffer', None)
+
+
+def set_output_buffer(buffer: Optional[OutputBuffer]):
+    _output.buffer = buffer
+
+
+def redirect_thread_output():
+    '''Makes the output (stdout, stderr and logging) of each thread go to its own buffer, if set
+
+    Can be nested, the original streams are restored by the last restore_thread_output call.
+    '''
+    global _redirect_count, _redirected_streams
+    with _redirect_lock:
+        _redirect_count += 1
+        if _redirect_count > 1:
+            return
+        handlers = [x for x in get_logger().handlers if isinstance(x, StreamHandler)]
+        _redirected_streams = [(x, x.stream) for x in handlers]
+        _redirected_streams.append((sys, (sys.stdout, sys.stderr)))
+        sys.stdout, sys.stderr = ThreadStream(sys.stdout), ThreadStream(sys.stderr)
+        for handler in handlers:
+            handler.stream = ThreadStream(handler.stream)
+
+
+def restore_thread_output():
+    global _redirect_count, _redirected_streams
+    with _redirect_lock:
+        _redirect_count -= 1
+        if _redirect_count > 0:
+            return
+        for target, stream in _redirected_streams:
+            if target is sys:
+                sys.stdout, sys.stderr = stream
+            else:
+                target.stream = stream
+        _redirected_streams = []
+
+
+@contextmanager
+def thread_output() -> Iterator[None]:
+    '''Redirects the output of threads to their buffers within the context, see redirect_thread_output'''
+    redirect_thread_output()
+    try:
+        yield
+    finally:
+        restore_thread_output()
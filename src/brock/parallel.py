@@ -0,0 +1,146 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from brock.exception import BaseBrockException
+from brock.log import OutputBuffer, get_logger, get_output_buffer, set_output_buffer, thread_output, \
+    redirect_thread_output, restore_thread_output
+
+
+def format_error(ex: BaseException) -> str:
+    if isinstance(ex, BaseBrockException):
+        return ex.message
+    return str(ex) or type(ex).__name__
+
+
+def _run(function: Callable[[], Any], buffer: Optional[OutputBuffer]):
+    set_output_buffer(buffer)
+    try:
+        return function()
+    finally:
+        set_output_buffer(None)
+
+
+def run_parallel(
+    tasks: Sequence[Tuple[str, Callable[[], Any]]],
+    aggregate: bool = True,
+    jobs: Optional[int] = None,
+    stop: Optional[threading.Event] = None
+) -> List[Tuple[str, BaseException]]:
+    '''Runs the tasks concurrently, all of them are run even if some fail
+
+    :param tasks: list of (name, function) tuples
+    :param aggregate: print the output of each task at once when it finishes,
+        otherwise the output goes where the output of the calling thread goes
+    :param jobs: maximum number of tasks running at once, all of them by default
+    :param stop: event set when the calling thread is interrupted (e.g. by Ctrl+C) before waiting for the running
+        tasks, so they can finish early
+    :return: list of (name, exception) tuples of the failed tasks
+    '''
+    errors: List[Tuple[str, BaseException]] = []
+    if len(tasks) <= 1:
+        for name, function in tasks:
+            try:
+                function()
+            except Exception as ex:
+                errors.append((name, ex))
+        return errors
+
+    log = get_logger()
+    parent_buffer = get_output_buffer()
+    with ThreadPoolExecutor(max_workers=min(jobs or len(tasks), len(tasks))) as pool, thread_output():
+        futures = {}
+        for name, function in tasks:
+            buffer = OutputBuffer() if aggregate else parent_buffer
+            futures[pool.submit(_run, function, buffer)] = (name, buffer)
+        try:
+            for future in as_completed(futures):
+                name, buffer = futures[future]
+                output = buffer.getvalue() if aggregate and buffer is not None else ''
+                if output:
+                    # printed by the calling thread, i.e. to its own buffer if nested
+                    log.info(f'{name}:')
+                    print(output, end='')
+                try:
+                    future.result()
+                except Exception as ex:
+                    errors.append((name, ex))
+        except BaseException:
+            # the pool waits for the running tasks when left
+            for future in futures:
+                future.cancel()
+            if stop is not None:
+                stop.set()
+            raise
+    return errors
+
+
+def report_results(title: str, results: Sequence[Tuple[str, Optional[int], float]]):
+    '''Prints a table of the results of the tasks
+
+    :param results: list of (name, exit code, duration) tuples, the exit code is None if the task failed with an error
+    '''
+    get_logger().info(title)
+    width = max((len(x) for x, _, _ in results), default=0)
+    for name, exit_code, duration in results:
+        if exit_code == 0:
+            result = 'passed'
+        elif exit_code is None:
+            result = 'error'
+        else:
+            result = f'failed ({exit_code})'
+        print(f'\t{name:<{width}}  {result:<12}{duration:8.1f} s')
+
+
+class BackgroundTask:
+    '''Runs the function in a background thread, its output is printed once the task is joined
+
+    :param stop: event set when the task is cancelled, the function is expected to check it between its steps
+    '''
+
+    def __init__(self, name: str, function: Callable[[], Any], stop: Optional[threading.Event] = None):
+        self.name = name
+        self._function = function
+        self._stop = stop or threading.Event()
+        self._buffer = OutputBuffer()
+        self._result: Any = None
+        self._error: Optional[BaseException] = None
+        self._joined = False
+
+        redirect_thread_output()
+        # not a daemon, a step interrupted by the exit of the interpreter (e.g. a half prepared executor) would leave
+        # its work inconsistent, the function is expected to stop early once the main thread is gone instead
+        self._thread = threading.Thread(target=self._run, name=f'brock-{name}')
+        self._thread.start()
+
+    def _run(self):
+        set_output_buffer(self._buffer)
+        try:
+            self._result = self._function()
+        except BaseException as ex:
+            self._error = ex
+        finally:
+            set_output_buffer(None)
+
+    def join(self) -> Any:
+        '''Waits for the task and returns its result (or raises its exception)
+
+        The output buffered so far is printed, the rest of it is printed as it comes.
+        '''
+        if not self._joined:
+            self._joined = True
+            self._buffer.go_live()
+            self._thread.join()
+            restore_thread_output()
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+    def cancel(self):
+        '''Cancels the task, waiting only for the step in progress, its output and result are dropped'''
+        if self._joined:
+            return
+        self._joined = True
+        self._stop.set()
+        self._thread.join()
+        restore_thread_output()
@@ -1,11 +1,19 @@
 import re
+import copy
+import time
+import threading
 from munch import Munch
-from typing import Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from functools import partial
 import os
 
 from brock.log import get_logger
-from brock.exception import ConfigError, UsageError
+from brock.exception import ConfigError, UsageError, ExecutorError
+from brock.parallel import BackgroundTask, run_parallel, format_error, report_results
+from brock.gc import record_usage
+from brock import reaper
 from brock.config.config import Config
+from brock.size import format_size
 from brock.executors import Executor
 from brock.executors.host import HostExecutor
 from brock.executors.docker import DockerExecutor
@@ -47,6 +55,15 @@ class Command:
         self._chdir = config.get('chdir')
         self._depends_on = config.get('depends_on', [])
         self._default_executor = config.get('default_executor', default_executor)
+        self._sync_out = config.get('sync_out', True)
+        self._sync_paths = config.get('sync_paths', [])
+        # executors the steps are run in instead of the default one, each with its own copy of the steps
+        matrix = config.get('matrix', [])
+        self._matrix_jobs: Optional[int] = None
+        if isinstance(matrix, dict):
+            self._matrix_jobs = matrix.get('jobs')
+            matrix = matrix['executors']
+        self._matrix: List[str] = list(matrix)
 
         self.name = name
         self.help = config.get('help', '')
@@ -74,16 +91,51 @@ class Command:
 
         self._log.extra_info(f'Executing command {self.name}')
 
+        if self._matrix:
+            return project.exec_matrix(
+                self.name, self._matrix, partial(self._exec_steps, step_options=step_options), self._matrix_jobs
+            )
+        return self._exec_steps(project, step_options=step_options)
+
+    def _exec_steps(self, project, default_executor: Optional[str] = None, step_options=None) -> int:
+        exit_code = 0
         for step in self._steps:
-            exit_code = self._exec_step(project, step, step_options)
+            exit_code = self._exec_step(project, step, step_options, default_executor)
 
             if exit_code != 0:
                 return exit_code
 
         return exit_code
 
-    def _exec_step(self, project, step, step_options) -> int:
+    def get_executors(self,
+                      commands: Dict[str, 'Command'],
+                      executors: Optional[Dict[str, Tuple]] = None) -> Dict[str, Tuple]:
+        '''Returns executors used by the command and its dependencies in the order of their first use
+
+        :return: dict of executor names and (chdir, sync_paths) of the first command using them
+        '''
+        if executors is None:
+            executors = {}
+        for dependency in self._depends_on:
+            if dependency in commands:
+                commands[dependency].get_executors(commands, executors)
+        for step in self._steps:
+            if type(step) is str:
+                res = re.search(r'(?:^@(\w+) )?(.*)', step)
+                executor = res.group(1) if res is not None else None
+            elif type(step) is dict:
+                executor = step.get('executor')
+            else:
+                continue
+            for name in [executor] if executor else self._matrix or [self._default_executor]:
+                if name and name not in executors:
+                    executors[name] = (self._chdir, self._sync_paths)
+        return executors
+
+    def _exec_step(self, project, step, step_options, default_executor: Optional[str] = None) -> int:
+        default_executor = default_executor or self._default_executor
         env_options = {}
+        shard = None
         if step_options is not None:
             env_options = self._get_options(step_options)
         if type(step) is str:
@@ -93,16 +145,25 @@ class Command:
             executor = res.group(1)
             command = res.group(2)
             if not executor:
-                executor = self._default_executor
+                executor = default_executor
         elif type(step) is dict:
-            executor = step.get('executor', self._default_executor)
+            executor = step.get('executor', default_executor)
             shell = step.get('shell', project.get_default_shell(executor))
             if shell is None:
                 raise ConfigError('Shell must be specified')
             command = self._get_shell_command(step.get('script'), shell)
+            shard = step.get('shard')
         else:
             raise ConfigError(f'Unexpected step type: {type(step)}')
-        return project.exec_raw(command, executor, self._chdir, env_options=env_options)
+        return project.exec_raw(
+            command,
+            executor,
+            self._chdir,
+            env_options=env_options,
+            sync_out=self._sync_out,
+            sync_paths=self._sync_paths,
+            shard=shard
+        )
 
     def _get_options(self, step_options):
         env_options = {}
@@ -155,13 +216,23 @@ class Command:
 class Project:
     '''Handles processing of the cli commands related to the project configuration.'''
     _default_executor: Optional[str] = None
-    _executors: Dict[str, Executor] = {}
-    _commands: Dict[str, Command] = {}
     _default_command: Optional[str] = None
     _prev_executor = None
+    _sync_out_pending = False
+    _reaping = False
+    # incremented whenever the project tree on the host may have been modified
+    _host_generation = 0
 
     def __init__(self, config: Config):
         self._log = get_logger()
+        self._executors: Dict[str, Executor] = {}
+        self._commands: Dict[str, Command] = {}
+        # held while the project tree on the host is synced or used by a host step, shared by the matrix runs
+        self._host_lock = threading.Lock()
+        # host generation, work dir and paths of the last sync in of each executor
+        self._synced_generations: Dict[str, Tuple] = {}
+        # executors started in background by their names, None until the first command is executed
+        self._warm_ups: Optional[Dict[str, BackgroundTask]] = None
         self._default_executor = config.executors.get('default')
 
         for name, cmd in config.commands.items():
@@ -185,6 +256,8 @@ class Project:
                 self._executors[name] = SshExecutor(config, name)
             else:
                 raise ConfigError(f"Unknown executor type '{executor.type}'")
+        self._usage_recorded = False
+        self._base_dir = config.base_dir
         if self._default_executor is None:
             if len(config.executors) == 0:
                 self._default_executor = 'host'
@@ -201,8 +274,27 @@ class Project:
         return list(self._executors.values())
 
     def on_exit(self):
-        if self._prev_executor:
-            self._executors[self._prev_executor].sync_out()
+        # the warm-ups still pending are of executors not used by the command, only the start in progress is waited
+        # for, so no executor is left started without its prepare steps done
+        for task in (self._warm_ups or {}).values():
+            task.cancel()
+        self._warm_ups = {}
+        if self._prev_executor and self._sync_out_pending:
+            self._leave_executor(self._prev_executor)
+        idle_executors = [x for x in self._get_idle_executors() if x.used]
+        if idle_executors and not self._reaping and not reaper.is_alive(idle_executors[0].hashed_base_dir):
+            # stops the executors when they are not used for their idle timeout
+            reaper.spawn(self._base_dir)
+
+    def _get_idle_executors(self) -> List[DockerExecutor]:
+        return [x for x in self._executors.values() if isinstance(x, DockerExecutor) and x.idle_timeout]
+
+    def reap(self):
+        '''Stops executors not used for their idle timeout, runs until no such executor is running'''
+        self._reaping = True
+        idle_executors = self._get_idle_executors()
+        if idle_executors:
+            reaper.run(idle_executors, idle_executors[0].hashed_base_dir)
 
     @property
     def commands(self) -> Dict[str, Command]:
@@ -226,22 +318,54 @@ class Project:
         else:
             return None
 
-    def status(self):
+    def status(self, usage: bool = False):
+        '''Prints state of the executors
+
+        :param usage: also print the CPU usage and size of the volumes, which takes a few seconds
+        '''
+        # the docker executors are queried at once
+        docker_executors = [x for x in self._executors.values() if isinstance(x, DockerExecutor)]
+        statuses = DockerExecutor.statuses(docker_executors, usage)
         for name, executor in self._executors.items():
             if name != 'host':
-                print(f'{name}: {executor.status()}')
+                print(f'{name}: {statuses[name] if name in statuses else executor.status()}')
 
-    def stop(self, executor_name: Optional[str] = None):
+    def cache_stats(self, executor_name: Optional[str] = None):
         for executor in self._get_selected_executors(executor_name):
-            executor.stop()
+            for name, path, size, limit in executor.cache_stats():
+                limit_info = f' (limit {format_size(limit)})' if limit is not None else ''
+                print(f'{executor.name}: {name} ({path}) {format_size(size)}{limit_info}')
 
-    def restart(self, executor_name: Optional[str] = None):
+    def prune_caches(self, executor_name: Optional[str] = None):
         for executor in self._get_selected_executors(executor_name):
-            executor.restart()
+            executor.prune_caches()
+
+    def stop(self, executor_name: Optional[str] = None):
+        self._run_concurrently('stop', lambda x: x.stop(), executor_name)
+
+    def restart(self, executor_name: Optional[str] = None):
+        self._run_concurrently('restart', lambda x: x.restart(), executor_name)
 
     def update(self, executor_name: Optional[str] = None):
+        self._run_concurrently('update', lambda x: x.update(), executor_name)
+
+    def _run_concurrently(self, action: str, operation: Callable[[Executor], Any], executor_name: Optional[str] = None):
+        '''Runs the operation on the selected executors concurrently, failures do not stop the other executors'''
+        # executors sharing the synced data manage the same sync container, they are handled one after another
+        groups: Dict[str, List[Executor]] = {}
         for executor in self._get_selected_executors(executor_name):
-            executor.update()
+            groups.setdefault(executor.sync_group or executor.name, []).append(executor)
+
+        def run_group(executors: List[Executor]):
+            for executor in executors:
+                operation(executor)
+
+        tasks = [(', '.join(x.name for x in executors), partial(run_group, executors)) for executors in groups.values()]
+        errors = run_parallel(tasks)
+        for name, ex in errors:
+            self._log.error(f'Failed to {action} {name}: {format_error(ex)}')
+        if errors:
+            raise ExecutorError(f'Failed to {action} {len(errors)} of {len(tasks)} executor(s)')
 
     def exec(self, command: Optional[str] = None, env_options: Optional[dict] = None) -> int:
         if command is None:
@@ -252,15 +376,138 @@ class Project:
 
         if command not in self._commands:
             raise UsageError(f'Unknown command {command}')
+        if self._warm_ups is None:
+            self._warm_up(self._commands[command])
         return self._commands[command].exec(self, env_options)
 
+    def exec_matrix(
+        self,
+        command: str,
+        executors: Sequence[str],
+        run: Callable[['Project', str], int],
+        jobs: Optional[int] = None
+    ) -> int:
+        '''Runs the steps of the command once per executor, concurrently up to the jobs limit
+
+        :param run: function executing the steps in the project with the given default executor
+        :return: exit code of the first failed executor (in the matrix order), 0 if all succeeded
+        '''
+        # the runs sync in the current host tree, it must not be changed by the previous steps meanwhile
+        for name in list(self._warm_ups or []):
+            self._join_warm_up(name)
+        if self._prev_executor and self._sync_out_pending:
+            self._leave_executor(self._prev_executor)
+        self._prev_executor = None
+        self._sync_out_pending = False
+
+        generation = self._host_generation
+        lanes: List[Project] = []
+        results: Dict[str, Tuple[Optional[int], float]] = {}
+
+        def run_executor(name: str):
+            # each run switches between the executors on its own, the sync state of the executors is shared
+            lane = copy.copy(self)
+            lanes.append(lane)
+            start = time.monotonic()
+            exit_code = None
+            try:
+                exit_code = run(lane, name)
+                if lane._prev_executor and lane._sync_out_pending:
+                    with self._host_lock:
+                        lane._leave_executor(lane._prev_executor)
+            finally:
+                # no exit code if the run failed with an error
+                results[name] = (exit_code, time.monotonic() - start)
+
+        def run_lanes(names: List[str]):
+            for name in names:
+                try:
+                    run_executor(name)
+                except Exception as ex:
+                    lane_errors.append((name, ex))
+
+        # the runs of executors working on the same tree would overwrite each other's files, they are serialized
+        trees: Dict[str, List[str]] = {}
+        for name in executors:
+            trees.setdefault(self._working_tree(name), []).append(name)
+        lane_errors: List[Tuple[str, BaseException]] = []
+        errors = run_parallel([(', '.join(x), partial(run_lanes, x)) for x in trees.values()], jobs=jobs)
+        errors += lane_errors
+        self._host_generation += sum(x._host_generation - generation for x in lanes)
+        for name, ex in errors:
+            self._log.error(f'Failed to run {command} in {name}: {format_error(ex)}')
+
+        report_results(f'Results of {command}:', [(x, *results.get(x, (None, 0.0))) for x in executors])
+
+        if errors:
+            raise ExecutorError(f'Failed to run {command} in {len(errors)} of {len(executors)} executor(s)')
+        for name in executors:
+            exit_code = results[name][0]
+            if exit_code:
+                return exit_code
+        return 0
+
+    def _warm_up(self, command: Command):
+        '''Starts the executors needed by the command in background, overlapping with the other steps'''
+        self._warm_ups = {}
+        generation = self._host_generation
+        groups: Dict[str, Dict[str, Tuple]] = {}
+        for name, (chdir, sync_paths) in command.get_executors(self._commands).items():
+            executor = self._executors.get(name)
+            if executor is None or name == 'host':
+                continue
+            # executors sharing the synced data use the same sync container, they are started one after another
+            groups.setdefault(executor.sync_group or name, {})[name] = (chdir, sync_paths)
+
+        def warm_up(executors: Dict[str, Tuple], stop: threading.Event) -> Dict[str, Tuple]:
+            synced = {}
+            for name, (chdir, sync_paths) in executors.items():
+                # cancelled, or brock is exiting without cancelling it (e.g. interrupted by Ctrl+C)
+                if stop.is_set() or not threading.main_thread().is_alive():
+                    break
+                if self._executors[name].warm_up(chdir, sync_paths):
+                    synced[name] = (generation, chdir, tuple(sync_paths))
+            return synced
+
+        for executors in groups.values():
+            stop = threading.Event()
+            task = BackgroundTask(', '.join(executors), partial(warm_up, executors, stop), stop)
+            for name in executors:
+                self._warm_ups[name] = task
+
+    def _join_warm_up(self, executor_name: str):
+        '''Waits for the background start of the executor (and of the ones started together with it)'''
+        if not self._warm_ups:
+            return
+        task = self._warm_ups.pop(executor_name, None)
+        if task is None:
+            return
+        for name in [x for x, y in self._warm_ups.items() if y is task]:
+            del self._warm_ups[name]
+        try:
+            synced = task.join()
+        except Exception as ex:
+            # the executor is started again when used, reporting the error
+            self._log.extra_info(f'Failed to start {task.name} in advance: {format_error(ex)}')
+            return
+        for name, sync_key in synced.items():
+            # the sync in done while starting is up to date if the host tree didn't change since
+            self._synced_generations.setdefault(name, sync_key)
+
     def exec_raw(
         self,
         command: str,
         executor_name: Optional[str] = None,
         chdir: Optional[str] = None,
-        env_options: Optional[dict] = None
+        env_options: Optional[dict] = None,
+        sync_out: bool = True,
+        sync_paths: Sequence[str] = (),
+        shard: Optional[Sequence[str]] = None
     ) -> int:
+        '''Executes the command in the executor, syncing the data between executors as needed
+
+        :param shard: work items to run the command for, spread over the replicas of the executor
+        '''
         if not executor_name:
             if self._default_executor:
                 executor_name = self._default_executor
@@ -268,18 +515,81 @@ class Project:
                 raise ConfigError('No default executor is set!')
         if executor_name not in self._executors:
             raise ConfigError(f'Unknown executor {executor_name}')
+        self._record_usage(executor_name)
+        self._join_warm_up(executor_name)
 
-        if self._prev_executor != executor_name:
-            if self._prev_executor:
-                self._executors[self._prev_executor].sync_out()
-            self._executors[executor_name].sync_in()
+        if self._prev_executor != executor_name and self._shares_synced_data(self._prev_executor, executor_name):
+            # both executors work on the same synced data, nothing to transfer
             self._prev_executor = executor_name
+        elif self._prev_executor != executor_name or \
+                self._synced_generations.get(executor_name) != (self._host_generation, chdir, tuple(sync_paths)):
+            # switching executors or the directory (scope of the sync) within the same one
+            with self._host_lock:
+                if self._prev_executor and self._sync_out_pending:
+                    self._leave_executor(self._prev_executor)
+                sync_key = (self._host_generation, chdir, tuple(sync_paths))
+                if self._synced_generations.get(executor_name) != sync_key:
+                    self._executors[executor_name].sync_in(chdir, sync_paths)
+                    self._synced_generations[executor_name] = sync_key
+                else:
+                    self._log.extra_info(f'Project not changed since last sync into {executor_name}, skipping sync in')
+            self._prev_executor = executor_name
+            self._sync_out_pending = False
+        # data is synced out of the executor only if any of the commands run in it may produce outputs
+        self._sync_out_pending = self._sync_out_pending or sync_out
+        if shard is not None:
+            return self._executors[executor_name].exec_sharded(command, shard, chdir=chdir, env_options=env_options)
+        if isinstance(self._executors[executor_name], HostExecutor):
+            # works on the project tree the other matrix runs sync from
+            with self._host_lock:
+                return self._executors[executor_name].exec(command=command, chdir=chdir, env_options=env_options)
         return self._executors[executor_name].exec(command=command, chdir=chdir, env_options=env_options)
 
+    def _record_usage(self, executor_name: str):
+        '''Records the project is in use when it runs anything in docker, once per brock invocation'''
+        if self._usage_recorded or not isinstance(self._executors[executor_name], DockerExecutor):
+            return
+        # the docker resources of projects not used for a long time can be removed by brock --gc
+        record_usage(self._base_dir)
+        self._usage_recorded = True
+
+    def _leave_executor(self, executor_name: str):
+        '''Syncs out the data of the executor if it may have modified them'''
+        executor = self._executors[executor_name]
+        if not executor.synced:
+            # works directly on the host tree (or on a remote one)
+            self._host_generation += 1
+        elif executor.is_dirty():
+            executor.sync_out()
+            self._host_generation += 1
+        else:
+            self._log.extra_info(f'No changes made in {executor_name}, skipping sync out')
+
+    def _working_tree(self, executor_name: str) -> str:
+        '''Returns identifier of the project tree the executor works on'''
+        executor = self._executors[executor_name]
+        if not executor.synced:
+            # the tree on the host (mounted in case of docker), or one brock doesn't sync at all
+            return 'host'
+        return executor.sync_group or f'executor:{executor_name}'
+
+    def _shares_synced_data(self, first: Optional[str], second: str) -> bool:
+        if not first:
+            return False
+        group = self._executors[first].sync_group
+        return group is not None and group == self._executors[second].sync_group
+
+    def export(self, executor_name: str, paths: Sequence[str] = ()) -> int:
+        if executor_name not in self._executors:
+            raise ConfigError(f'Unknown executor {executor_name}')
+        return self._executors[executor_name].export(paths)
+
     def shell(self, executor_name: str) -> int:
         if executor_name not in self._executors:
             raise ConfigError(f'Unknown executor {executor_name}')
+        self._record_usage(executor_name)
 
         self._executors[executor_name].sync_in()
         self._prev_executor = executor_name
+        self._sync_out_pending = True
         return self._executors[executor_name].shell()
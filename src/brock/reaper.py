@@ -0,0 +1,101 @@
+import os
+import sys
+import time
+import subprocess
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from brock.cache import get_cache_dir
+from brock.executors.docker import Container, DockerExecutor
+from brock.log import get_logger
+
+# the reaper refreshes its heartbeat file at least this often (in seconds)
+HEARTBEAT = 60
+
+
+def _heartbeat_path(hashed_base_dir: str) -> str:
+    return os.path.join(get_cache_dir('reapers'), hashed_base_dir)
+
+
+def is_alive(hashed_base_dir: str) -> bool:
+    '''Checks if a reaper of the project is running, using its heartbeat file'''
+    try:
+        return time.time() - os.path.getmtime(_heartbeat_path(hashed_base_dir)) < 2 * HEARTBEAT
+    except OSError:
+        return False
+
+
+def spawn(base_dir: str):
+    '''Starts a reaper of the project in a detached process'''
+    kwargs: Dict[str, Any] = {}
+    if sys.platform == 'win32':
+        kwargs['creationflags'] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        kwargs['start_new_session'] = True
+    get_logger().debug('Starting idle executors reaper')
+    subprocess.Popen([sys.executable, '-m', 'brock', '--reap'],
+                     cwd=base_dir,
+                     stdin=subprocess.DEVNULL,
+                     stdout=subprocess.DEVNULL,
+                     stderr=subprocess.DEVNULL,
+                     **kwargs)
+
+
+def reap(executors: Sequence[DockerExecutor], now: Optional[float] = None) -> Optional[float]:
+    '''Stops the running executors idle for longer than their timeout
+
+    The most recently used idle executors of each image are kept running as warm spares, separately for each
+    checkout of the project.
+
+    :return: time of the next check, None if no executor is to be stopped later
+    '''
+    log = get_logger()
+    now = now or time.time()
+    executors = [x for x in executors if x.idle_timeout]
+    if not executors:
+        return None
+    running = Container.list_labeled(executors[0].project_labels)
+
+    next_check = None
+    idle: Dict[Tuple[str, str], List[DockerExecutor]] = {}
+    for executor in executors:
+        if executor.idle_timeout is None or executor.container_name not in running:
+            continue
+        last_used = executor.last_used()
+        if last_used is None or executor.is_busy():
+            executor.record_use()
+            last_used = now
+        deadline = last_used + executor.idle_timeout
+        if deadline <= now:
+            # other checkouts of the project (possibly of another version, with the same image names) have their own
+            idle.setdefault((executor.hashed_base_dir, executor.image), []).append(executor)
+        else:
+            next_check = deadline if next_check is None else min(next_check, deadline)
+
+    for image_executors in idle.values():
+        image_executors.sort(key=lambda x: x.last_used() or 0, reverse=True)
+        spares = max(x.idle_spares for x in image_executors)
+        for executor in image_executors[spares:]:
+            if executor.stop_if_idle(now):
+                log.info(f'Stopped idle executor {executor.name}')
+            else:
+                # used meanwhile (or being used by another process), checked again later
+                next_check = now + HEARTBEAT if next_check is None else min(next_check, now + HEARTBEAT)
+    return next_check
+
+
+def run(executors: Sequence[DockerExecutor], hashed_base_dir: str):
+    '''Reaps the idle executors until there is no running executor with an idle timeout'''
+    heartbeat = _heartbeat_path(hashed_base_dir)
+    try:
+        while True:
+            with open(heartbeat, 'w'):
+                pass
+            next_check = reap(executors)
+            if next_check is None:
+                return
+            time.sleep(min(max(next_check - time.time(), 1), HEARTBEAT))
+    finally:
+        try:
+            os.remove(heartbeat)
+        except OSError:
+            pass
@@ -0,0 +1,26 @@
+import re
+from typing import Optional
+
+_UNITS = {'': 1, 'K': 1024, 'M': 1024**2, 'G': 1024**3, 'T': 1024**4}
+# size with an optional binary unit, e.g. 512M or 1.5G
+SIZE_REGEX = r'^\s*(\d+(?:\.\d+)?)\s*([kKmMgGtT]?)[bB]?\s*$'
+
+
+def parse_size(size: str) -> int:
+    '''Converts a size like 512M or 1.5G to bytes'''
+    match = re.match(SIZE_REGEX, str(size))
+    if match is None:
+        raise ValueError(f'Invalid size: {size}')
+    return int(float(match.group(1)) * _UNITS[match.group(2).upper()])
+
+
+def format_size(size: Optional[int]) -> str:
+    '''Formats the size in bytes for humans'''
+    if size is None or size < 0:
+        return 'unknown'
+    value = float(size)
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if value < 1024:
+            return f'{value:.0f} {unit}' if unit == 'B' else f'{value:.1f} {unit}'
+        value /= 1024
+    return f'{value:.1f} TB'
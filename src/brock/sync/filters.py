@@ -0,0 +1,92 @@
+import re
+from typing import List, Optional, Pattern, Sequence, Tuple
+
+
+def compile_pattern(pattern: str) -> Tuple[Pattern, bool]:
+    '''Compiles an rsync-like path pattern to a regular expression
+
+    Patterns containing a slash are matched against the whole relative path
+    (anchored to the root if they start with a slash, otherwise to any
+    directory level), other patterns are matched against the file name.
+    A trailing slash limits the pattern to directories.
+
+    :return: compiled regex and a flag if the pattern matches directories only
+    '''
+    dir_only = pattern.endswith('/')
+    pattern = pattern.rstrip('/')
+    anchored = pattern.startswith('/')
+    pattern = pattern.lstrip('/')
+
+    regex = ''
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith('**', i):
+            regex += '.*'
+            i += 2
+            continue
+        if c == '*':
+            regex += '[^/]*'
+        elif c == '?':
+            regex += '[^/]'
+        elif c == '[':
+            end = pattern.find(']', i + 1)
+            if end == -1:
+                regex += re.escape(c)
+            else:
+                regex += '[' + pattern[i + 1:end].replace('!', '^', 1) + ']'
+                i = end
+        else:
+            regex += re.escape(c)
+        i += 1
+
+    if anchored:
+        regex = '^' + regex
+    else:
+        regex = '(^|/)' + regex
+    return re.compile(regex + '$'), dir_only
+
+
+class PathFilter:
+    '''Ordered include/exclude rules, the first matching rule wins (as in rsync)'''
+
+    def __init__(self, rules: Optional[List[Tuple[bool, str]]] = None):
+        '''Initializes the filter
+
+        :param rules: list of (include, pattern) tuples
+        '''
+        self._rules = []
+        for include, pattern in rules or []:
+            regex, dir_only = compile_pattern(pattern)
+            self._rules.append((include, regex, dir_only))
+
+    @classmethod
+    def from_sync_config(
+        cls, filters: List[str], includes: List[str], excludes: List[str], rules: Sequence[Tuple[bool, str]] = ()
+    ) -> 'PathFilter':
+        '''Creates the filter from the rsync sync configuration
+
+        Only the plain `+ pattern` and `- pattern` filter rules are understood,
+        if any other rule is used, no paths are excluded to stay on the safe side.
+
+        :param rules: additional (include, pattern) rules applied after the configured ones
+        '''
+        all_rules = []
+        for filter_ in filters:
+            if filter_[:2] in ('+ ', '- '):
+                all_rules.append((filter_[0] == '+', filter_[2:].strip()))
+            else:
+                return cls()
+        all_rules += [(True, x) for x in includes]
+        all_rules += [(False, x) for x in excludes]
+        all_rules += rules
+        return cls(all_rules)
+
+    def excludes(self, rel_path: str, is_dir: bool) -> bool:
+        '''Checks if the path (relative to the synced root) is excluded'''
+        for include, regex, dir_only in self._rules:
+            if dir_only and not is_dir:
+                continue
+            if regex.search(rel_path):
+                return not include
+        return False
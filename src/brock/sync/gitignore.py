@@ -0,0 +1,169 @@
+import os
+import json
+import hashlib
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from brock.cache import get_cache_dir
+from brock.sync.filters import PathFilter
+
+IGNORE_FILE = '.gitignore'
+# repository-wide excludes, lower priority than any .gitignore
+INFO_EXCLUDE = '.git/info/exclude'
+
+
+def translate(line: str, rel_dir: str = '') -> List[Tuple[bool, str]]:
+    '''Translates a line of an ignore file to rsync-like filter rules
+
+    :param line: line of the ignore file
+    :param rel_dir: directory (relative to the synced root) containing the ignore file
+    :return: list of (include, pattern) tuples, empty for comments and blank lines
+    '''
+    line = line.rstrip('\r\n')
+    if not line or line.startswith('#'):
+        return []
+    if not line.endswith('\\ '):
+        line = line.rstrip(' ')
+    include = line.startswith('!')
+    if include:
+        line = line[1:]
+    if line.startswith('\\'):
+        # escaped leading '!' or '#'
+        line = line[1:]
+
+    dir_only = line.endswith('/')
+    pattern = line.rstrip('/')
+    if not pattern:
+        return []
+
+    prefix = f'/{rel_dir}/' if rel_dir else '/'
+    if pattern.startswith('**/'):
+        pattern = pattern[3:]
+        anchored = False
+    else:
+        anchored = '/' in pattern
+        pattern = pattern.lstrip('/')
+
+    if anchored:
+        patterns = [prefix + pattern]
+    elif not rel_dir and '/' not in pattern:
+        # file name pattern matched at any level
+        patterns = [pattern]
+    else:
+        patterns = [prefix + pattern, prefix + '**/' + pattern]
+
+    suffix = '/' if dir_only else ''
+    return [(include, x + suffix) for x in patterns]
+
+
+def _read_rules(path: str, rel_dir: str) -> List[Tuple[bool, str]]:
+    rules: List[Tuple[bool, str]] = []
+    try:
+        with open(path, encoding='utf-8', errors='replace') as f:
+            for line in f:
+                rules += translate(line, rel_dir)
+    except OSError:
+        pass
+    return rules
+
+
+def _mtime(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class GitIgnore:
+    '''Sync exclusions derived from the .gitignore files of the project
+
+    The tree is walked breadth-first (ignored directories are not entered) and
+    the rules are ordered so that the first matching one wins, as in rsync.
+    The result is cached together with the mtimes of the ignore files and of
+    the walked directories, the tree is walked again only if any of them changed.
+    '''
+
+    def __init__(self, rules: List[Tuple[bool, str]], files: Dict[str, int], dirs: Dict[str, int]):
+        '''Initializes the rules
+
+        :param rules: list of (include, pattern) tuples, the first matching rule wins
+        :param files: mtimes of the ignore files used
+        :param dirs: mtimes of the walked directories
+        '''
+        self.rules = rules
+        self._files = files
+        self._dirs = dirs
+
+    @classmethod
+    def load(cls, root: str) -> 'GitIgnore':
+        '''Returns the rules of the project, using the cache if up to date'''
+        cache_path = os.path.join(get_cache_dir('gitignore'), hashlib.md5(root.encode('utf-8')).hexdigest() + '.json')
+        try:
+            with open(cache_path, 'rb') as f:
+                content = json.loads(f.read())
+            cached = cls([(x[0], x[1]) for x in content['rules']], content['files'], content['dirs'])
+            if cached._is_valid(root):
+                return cached
+        except (OSError, ValueError, KeyError, TypeError, IndexError):
+            pass
+
+        result = cls.scan(root)
+        try:
+            tmp_path = f'{cache_path}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump({'rules': result.rules, 'files': result._files, 'dirs': result._dirs}, f)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            pass
+        return result
+
+    @classmethod
+    def scan(cls, root: str) -> 'GitIgnore':
+        '''Collects the rules of all ignore files in the tree'''
+        # rules in the order of git priority - the last matching rule wins
+        git_rules = []
+        files = {}
+        dirs = {}
+
+        mtime = _mtime(os.path.join(root, INFO_EXCLUDE))
+        if mtime is not None:
+            git_rules += _read_rules(os.path.join(root, INFO_EXCLUDE), '')
+            files[INFO_EXCLUDE] = mtime
+
+        path_filter = PathFilter(list(reversed(git_rules)))
+        queue = deque([''])
+        while queue:
+            rel_dir = queue.popleft()
+            full_dir = os.path.join(root, rel_dir)
+            mtime = _mtime(full_dir)
+            if mtime is None:
+                continue
+            dirs[rel_dir] = mtime
+
+            ignore_file = os.path.join(full_dir, IGNORE_FILE)
+            mtime = _mtime(ignore_file)
+            if mtime is not None:
+                files[f'{rel_dir}/{IGNORE_FILE}' if rel_dir else IGNORE_FILE] = mtime
+                rules = _read_rules(ignore_file, rel_dir)
+                if rules:
+                    git_rules += rules
+                    path_filter = PathFilter(list(reversed(git_rules)))
+
+            try:
+                with os.scandir(full_dir) as it:
+                    subdirs = sorted(x.name for x in it if x.is_dir(follow_symlinks=False))
+            except OSError:
+                continue
+            for name in subdirs:
+                rel_path = f'{rel_dir}/{name}' if rel_dir else name
+                if name == '.git' or path_filter.excludes(rel_path, True):
+                    continue
+                queue.append(rel_path)
+
+        return cls(list(reversed(git_rules)), files, dirs)
+
+    def _is_valid(self, root: str) -> bool:
+        for rel_path, mtime in list(self._files.items()) + list(self._dirs.items()):
+            if _mtime(os.path.join(root, rel_path)) != mtime:
+                return False
+        return True
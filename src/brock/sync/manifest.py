@@ -0,0 +1,151 @@
+import os
+import json
+import stat
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from brock.sync.filters import PathFilter
+
+# size marker used for directory entries
+_DIR = -1
+
+
+class Manifest:
+    '''Snapshot of a directory tree used to find changes between two syncs
+
+    Each entry maps a relative path (with forward slashes) to a tuple of
+    modification time (in nanoseconds) and size. Directories are tracked only
+    by their presence.
+    '''
+
+    def __init__(self, entries: Optional[Dict[str, Tuple[int, int]]] = None, volume: Optional[str] = None):
+        '''Initializes the manifest
+
+        :param entries: mapping of relative paths to (mtime, size) tuples
+        :param volume: identifier of the volume the manifest was synced into
+        '''
+        self.entries = entries if entries is not None else {}
+        self.volume = volume
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @classmethod
+    def scan(
+        cls, root: str, path_filter: Optional[PathFilter] = None, paths: Optional[Sequence[str]] = None
+    ) -> 'Manifest':
+        '''Scans the directory tree, excluded directories are not entered
+
+        :param paths: relative paths of subtrees to scan, the whole tree is scanned if None
+        '''
+        entries: Dict[str, Tuple[int, int]] = {}
+        stack = []
+        for path in paths if paths is not None else ['']:
+            full_path = os.path.join(root, path)
+            if not path or os.path.isdir(full_path):
+                stack.append(path)
+                if path:
+                    entries[path] = (0, _DIR)
+            elif os.path.exists(full_path):
+                stat = os.lstat(full_path)
+                entries[path] = (stat.st_mtime_ns, stat.st_size)
+        while stack:
+            rel_dir = stack.pop()
+            try:
+                with os.scandir(os.path.join(root, rel_dir)) as it:
+                    for entry in it:
+                        rel_path = f'{rel_dir}/{entry.name}' if rel_dir else entry.name
+                        try:
+                            is_dir = entry.is_dir(follow_symlinks=False)
+                            if path_filter is not None and path_filter.excludes(rel_path, is_dir):
+                                continue
+                            if is_dir:
+                                entries[rel_path] = (0, _DIR)
+                                stack.append(rel_path)
+                            else:
+                                stat = entry.stat(follow_symlinks=False)
+                                entries[rel_path] = (stat.st_mtime_ns, stat.st_size)
+                        except FileNotFoundError:
+                            # removed while scanning
+                            continue
+            except (FileNotFoundError, NotADirectoryError, PermissionError):
+                continue
+        return cls(entries)
+
+    @classmethod
+    def load(cls, path: str) -> Optional['Manifest']:
+        '''Loads the manifest saved by `save`, returns None if not available'''
+        try:
+            with open(path, 'rb') as f:
+                return cls.loads(f.read())
+        except OSError:
+            return None
+
+    @classmethod
+    def loads(cls, data: bytes) -> Optional['Manifest']:
+        '''Loads the manifest serialized by `dumps`, returns None if invalid'''
+        try:
+            content = json.loads(data)
+            entries = {k: (v[0], v[1]) for k, v in content['entries'].items()}
+            return cls(entries, content.get('volume'))
+        except (ValueError, KeyError, TypeError, IndexError):
+            return None
+
+    def dumps(self) -> bytes:
+        return json.dumps({'volume': self.volume, 'entries': self.entries}).encode('utf-8')
+
+    def save(self, path: str) -> None:
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(self.dumps())
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def is_dir(entry: Tuple[int, int]) -> bool:
+        return entry[1] == _DIR
+
+    def diff(self, current: 'Manifest', paths: Optional[Sequence[str]] = None) -> Tuple[List[str], List[str]]:
+        '''Compares the manifest with a newer one
+
+        :param paths: relative paths of the subtrees the newer manifest was limited to
+        :return: sorted lists of changed (incl. new) and deleted paths
+        '''
+        changed = [k for k, v in current.entries.items() if self.entries.get(k) != v]
+        deleted = [k for k in self.entries if k not in current.entries and _is_within(k, paths)]
+        return sorted(changed), sorted(deleted)
+
+    def update(self, root: str, changed: Sequence[str], deleted: Sequence[str] = ()) -> 'Manifest':
+        '''Returns the manifest with only the given paths updated from the directory tree, the other entries are kept
+
+        Used after syncing files into the tree, the files changed in the tree meanwhile must not be seen as synced.
+
+        :param changed: relative paths written to the tree (directories are not entered)
+        :param deleted: relative paths deleted from the tree
+        '''
+        entries = dict(self.entries)
+        for path in deleted:
+            entries.pop(path, None)
+        for path in changed:
+            try:
+                path_stat = os.lstat(os.path.join(root, path))
+            except OSError:
+                entries.pop(path, None)
+                continue
+            if stat.S_ISDIR(path_stat.st_mode):
+                entries[path] = (0, _DIR)
+            else:
+                entries[path] = (path_stat.st_mtime_ns, path_stat.st_size)
+        return Manifest(entries, self.volume)
+
+    def merge(self, current: 'Manifest', paths: Optional[Sequence[str]] = None) -> 'Manifest':
+        '''Returns the manifest updated by a newer one limited to the given subtrees'''
+        if paths is None:
+            return Manifest(dict(current.entries), current.volume)
+        entries = {k: v for k, v in self.entries.items() if not _is_within(k, paths)}
+        entries.update(current.entries)
+        return Manifest(entries, current.volume)
+
+
+def _is_within(path: str, parents: Optional[Sequence[str]]) -> bool:
+    if parents is None:
+        return True
+    return any(path == p or path.startswith(p + '/') for p in parents)
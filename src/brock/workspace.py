@@ -0,0 +1,140 @@
+import os
+import time
+import hiyapyco
+from functools import partial
+from typing import Any, Dict, List, Optional, Tuple
+
+from brock.config.config import Config
+from brock.exception import ConfigError, ExecutorError, UsageError
+from brock.log import get_logger
+from brock.parallel import run_parallel, format_error, report_results
+from brock.project import Project
+
+
+def find_projects(root: str) -> List[Config]:
+    '''Finds the projects in the root directory and below it in a single walk of the tree
+
+    The directories with a config file defining the project are the project candidates, the configs of
+    candidates continuing a project of a parent directory (with the same name) are merged into it.
+    Each config file is read only once, the content is passed to the project configs.
+    '''
+    log = get_logger()
+    log.extra_info(f'Scanning projects in {root}')
+    # text and parsed content by config file path
+    contents: Dict[str, Tuple[str, Any]] = {}
+
+    def read(path: str) -> Tuple[str, Any]:
+        if path not in contents:
+            try:
+                with open(path) as f:
+                    # a string with a new line is taken by hiyapyco as the content, not as a file name
+                    text = f.read() + '\n'
+                content = hiyapyco.load(
+                    text, method=hiyapyco.METHOD_MERGE, none_behavior=hiyapyco.NONE_BEHAVIOR_OVERRIDE
+                )
+            except Exception as ex:
+                raise ConfigError(f'Failed to process config file {path}: {ex}')
+            contents[path] = (text, content)
+        return contents[path]
+
+    def project_files(path: str) -> List[str]:
+        '''Returns the config files of the project in the directory, the same ones Config finds from it'''
+        files: List[str] = []
+        directory = path
+        while True:
+            files[:0] = _config_files(directory)
+            parent = os.path.dirname(directory)
+            if parent == directory:
+                break
+            directory = parent
+
+        project = None
+        start = len(files) - 1
+        for i in range(len(files) - 1, -1, -1):
+            content = read(files[i])[1]
+            if isinstance(content, dict) and 'project' in content:
+                if project is not None and project != content['project']:
+                    break
+                project = content['project']
+                start = i
+        return files[start:]
+
+    configs: Dict[str, Config] = {}
+    for path, dirs, files in os.walk(root):
+        # hidden directories (.git, ...) contain no projects
+        dirs[:] = sorted(x for x in dirs if not x.startswith('.'))
+        candidate = _config_files(path, files)
+        if not candidate:
+            continue
+        content = read(candidate[0])[1]
+        if not isinstance(content, dict) or 'project' not in content:
+            continue
+
+        config_files = project_files(path)
+        base_dir = os.path.dirname(config_files[0])
+        if base_dir.replace('\\', '/') in configs:
+            continue
+        config = Config([read(x)[0] for x in config_files], work_dir=base_dir)
+        log.debug(f'Found project {config.project} in {config.base_dir}')
+        configs[config.base_dir] = config
+    return list(configs.values())
+
+
+def _config_files(directory: str, files: Optional[List[str]] = None) -> List[str]:
+    '''Returns the config file of the directory (as a list, empty if there is none)
+
+    :param files: names of the files in the directory, listed if not given
+    '''
+    if files is None:
+        names = [x for x in Config.FILE_NAMES if os.path.isfile(os.path.join(directory, x))]
+    else:
+        names = [x for x in Config.FILE_NAMES if x in files]
+    if len(names) > 1:
+        raise ConfigError(f"Multiple brock config files found in '{directory}'")
+    return [os.path.join(directory, x) for x in names]
+
+
+def run(command: str, jobs: Optional[int] = None, root: Optional[str] = None) -> int:
+    '''Runs the command in all projects below the root directory (the current one by default) having it
+
+    :param jobs: maximum number of projects running the command at once, all of them by default
+    :return: exit code of the first failed project, 0 if all succeeded
+    '''
+    log = get_logger()
+    root = os.path.abspath(root or os.getcwd())
+    projects: List[Tuple[str, Project]] = []
+    for config in find_projects(root):
+        name = os.path.relpath(config.base_dir, root).replace('\\', '/')
+        project = Project(config)
+        if command not in project.commands:
+            log.extra_info(f'Project {name} has no command {command}, skipping')
+            continue
+        projects.append((name, project))
+    if not projects:
+        raise UsageError(f'No project with command {command} found in {root}')
+
+    results: Dict[str, Tuple[Optional[int], float]] = {}
+
+    def run_project(name: str, project: Project):
+        start = time.monotonic()
+        exit_code = None
+        try:
+            exit_code = project.exec(command)
+        finally:
+            # no exit code if the command failed with an error
+            results[name] = (exit_code, time.monotonic() - start)
+            project.on_exit()
+
+    log.info(f'Running {command} in {len(projects)} projects')
+    errors = run_parallel([(x, partial(run_project, x, y)) for x, y in projects], jobs=jobs)
+    for name, ex in errors:
+        log.error(f'Failed to run {command} in {name}: {format_error(ex)}')
+
+    report_results(f'Results of {command}:', [(x, *results.get(x, (None, 0.0))) for x, _ in projects])
+    if errors:
+        raise ExecutorError(f'Failed to run {command} in {len(errors)} of {len(projects)} project(s)')
+    for name, _ in projects:
+        exit_code = results[name][0]
+        if exit_code:
+            return exit_code
+    return 0
@@ -12,11 +12,12 @@ def test_example_config():
     assert config.project == 'someprojectname'
     assert config.help == 'brock --help message'
 
-    assert len(config.commands.keys()) == 5
+    assert len(config.commands.keys()) == 7
     assert config.commands.default == 'build'
 
     assert config.commands.clean.default_executor == 'atollic'
     assert config.commands.clean.chdir == 'foo/bar'
+    assert config.commands.clean.sync_paths == ['common/include']
     assert config.commands.clean.help == 'Help message for this command'
     assert config.commands.clean.steps == ['make clean']
 
@@ -28,6 +29,11 @@ def test_example_config():
 
     assert config.commands.rebuild.depends_on == ['clean', 'build']
 
+    assert config.commands.firmware.matrix.executors == ['gcc', 'atollic']
+    assert config.commands.firmware.matrix.jobs == 2
+    assert config.commands.test.steps[0].shard == ['unit', 'integration', 'hil']
+
+    assert config.commands.service.sync_out is False
     assert len(config.commands.service.steps) == 1
     assert config.commands.service.steps[0].executor == 'atollic'
     assert config.commands.service.steps[0].shell == 'powershell'
@@ -41,6 +47,9 @@ def test_example_config():
     assert config.executors.atollic.type == 'docker'
     assert config.executors.atollic.help == 'Executor --help message'
     assert config.executors.atollic.dockerfile == 'path/to/Dockerfile'
+    assert config.executors.atollic.build.target == 'toolchain'
+    assert config.executors.atollic.build.cache_from == ['registry.example.com/atollic:latest']
+    assert config.executors.atollic.build.buildkit is False
     assert config.executors.atollic.platform == 'windows'
     assert len(config.executors.atollic.env.keys()) == 2
     assert config.executors.atollic.env.SOME_VAR == 'foo'
@@ -48,6 +57,9 @@ def test_example_config():
     assert config.executors.atollic.mac_address == '88:99:aa:bb:cc:dd'
     assert config.executors.atollic.ports == {5000: 5000, '6000/udp': 6000}
     assert config.executors.atollic.devices == ['class/{interface class GUID}']
+    assert config.executors.atollic.overlays[0].path == 'build'
+    assert config.executors.atollic.overlays[0].type == 'volume'
+    assert config.executors.atollic.overlays[0].export == ['*.hex']
     assert config.executors.atollic.default_shell == 'powershell'
 
     assert config.executors.python.type == 'docker'
@@ -57,17 +69,33 @@ def test_example_config():
     assert config.executors.python.sync.filter == ['+ foo/', '+ foo/**/', '+ foo/**.c', '+ foo/src/**', '- *']
     assert config.executors.python.sync.include == ['foo/bar']
     assert config.executors.python.sync.exclude == ['foo/bar']
+    assert config.executors.python.sync.incremental is True
+    assert config.executors.python.sync.outputs == ['build/*.hex', 'reports/**']
+    assert config.executors.python.sync.scoped is True
+    assert config.executors.python.sync.paths == ['requirements.txt']
+    assert config.executors.python.sync.gitignore is True
     assert config.executors.python.devices == ['/dev/ttyUSB0:/dev/ttyUSB0:rwm']
     assert config.executors.python.prepare == [
         'pip install -r requirements.txt',
         'echo "Foo bar"',
     ]
+    assert config.executors.python.snapshot.inputs == ['requirements.txt']
+    assert config.executors.python.idle.timeout == 30
+    assert config.executors.python.resources.cpus == 4
+    assert config.executors.python.resources.tmpfs == [{'path': '/tmp/build', 'size': '2G'}, '/scratch']
+    assert config.executors.python.resources.ulimits.core.hard == -1
+    assert config.executors.python.idle.spares == 1
 
     assert config.executors.gcc.type == 'docker'
     assert config.executors.gcc.image == 'gcc'
     assert config.executors.gcc.sync.type == 'mutagen'
     assert config.executors.gcc.sync.options == ['--ignore-vcs']
     assert config.executors.gcc.sync.exclude == ['foo/bar']
+    assert config.executors.gcc.sync.shared
+    assert config.executors.gcc.caches.ccache.path == '/root/.ccache'
+    assert config.executors.gcc.caches.ccache.size == '5G'
+    assert config.executors.gcc.caches.conan == '/root/.conan/data'
+    assert config.executors.gcc.replicas == 4
 
     assert config.executors.remote.type == 'ssh'
     assert config.executors.remote.host == 'somesite.example.com:1235'
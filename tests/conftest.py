@@ -0,0 +1,43 @@
+import os
+
+import pytest
+import yaml
+
+from brock.config.config import Config
+from brock.executors.docker import DockerExecutor
+
+
+@pytest.fixture
+def write_file():
+    '''Returns function writing a text file, creating its parent directories'''
+
+    def write(path, content='foo'):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+
+    return write
+
+
+@pytest.fixture
+def docker_executor(tmp_path, monkeypatch):
+    '''Returns function creating docker executor gcc of project test, configured by its keyword arguments
+
+    The project is in the given work dir (tmp_path by default), the brock cache in tmp_path.
+    '''
+    monkeypatch.setenv('BROCK_CACHE_DIR', str(tmp_path / 'cache'))
+
+    def create(work_dir=None, **conf):
+        content = {
+            'version': '0.0.1',
+            'project': 'test',
+            'executors': {
+                'gcc': dict({
+                    'type': 'docker',
+                    'image': 'gcc'
+                }, **conf)
+            }
+        }
+        return DockerExecutor(Config([yaml.dump(content)], work_dir=str(work_dir or tmp_path)), 'gcc')
+
+    return create
@@ -0,0 +1,62 @@
+import tarfile
+import tempfile
+
+from brock.executors.build_context import BuildContext
+
+
+def test_build_context_digest(tmp_path, write_file):
+    '''Test the digest changes only with the files sent to the build.'''
+    write_file(tmp_path / 'Dockerfile', 'FROM alpine\nCOPY . /src\n')
+    write_file(tmp_path / 'src' / 'main.c')
+    write_file(tmp_path / 'build' / 'main.o')
+    write_file(tmp_path / '.dockerignore', '# comment\nbuild\n')
+
+    context = BuildContext(str(tmp_path))
+    assert context.files == ['.dockerignore', 'Dockerfile', 'src', 'src/main.c']
+    digest = context.digest()
+
+    write_file(tmp_path / 'build' / 'main.o', 'changed')
+    assert BuildContext(str(tmp_path)).digest() == digest
+    assert BuildContext(str(tmp_path)).digest(['--target=dev']) != digest
+
+    write_file(tmp_path / 'src' / 'main.c', 'changed')
+    assert BuildContext(str(tmp_path)).digest() != digest
+
+
+def test_build_context_digest_cache(tmp_path, monkeypatch, write_file):
+    '''Test the content is hashed again only when the metadata of the context files change.'''
+    write_file(tmp_path / 'context' / 'Dockerfile', 'FROM alpine\nCOPY . /src\n')
+    write_file(tmp_path / 'context' / 'main.c')
+    cache_path = str(tmp_path / 'digest.json')
+    digest = BuildContext(str(tmp_path / 'context')).digest(cache_path=cache_path)
+    assert digest == BuildContext(str(tmp_path / 'context')).digest()
+
+    hashed = []
+    original = BuildContext._content_digest
+    monkeypatch.setattr(
+        BuildContext, '_content_digest', lambda self, options: hashed.append(1) or original(self, options)
+    )
+    assert BuildContext(str(tmp_path / 'context')).digest(cache_path=cache_path) == digest
+    assert BuildContext(str(tmp_path / 'context')).digest(['target=dev'], cache_path) != digest
+    assert len(hashed) == 1
+
+    write_file(tmp_path / 'context' / 'main.c', 'changed')
+    assert BuildContext(str(tmp_path / 'context')).digest(cache_path=cache_path) != digest
+    assert len(hashed) == 2
+
+
+def test_build_context_archive(tmp_path, write_file):
+    '''Test only the context files are archived.'''
+    write_file(tmp_path / 'Dockerfile', 'FROM alpine\n')
+    write_file(tmp_path / 'src' / 'main.c', 'int main;')
+    write_file(tmp_path / 'build' / 'main.o')
+    write_file(tmp_path / '.dockerignore', 'build\n')
+
+    context = BuildContext(str(tmp_path))
+    assert context.file_count == 3
+    assert context.size == len('FROM alpine\n') + len('int main;') + len('build\n')
+    with tempfile.TemporaryFile() as f:
+        context.archive(f)
+        f.seek(0)
+        with tarfile.open(fileobj=f) as tar:
+            assert sorted(tar.getnames()) == ['.dockerignore', 'Dockerfile', 'src', 'src/main.c']
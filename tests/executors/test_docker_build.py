@@ -0,0 +1,72 @@
+import subprocess
+
+import pytest
+
+from brock.executors.docker import Container
+
+
+class Builds:
+    '''Docker commands run, the buildx builder reports the given driver'''
+
+    def __init__(self):
+        self.driver = 'docker'
+        self.commands = []
+
+    def run(self, cmd, **kwargs):
+        self.commands.append(cmd)
+        stdout = f'Name: builder\nDriver: {self.driver}\n' if cmd[:3] == ['docker', 'buildx', 'inspect'] else ''
+        return subprocess.CompletedProcess(cmd, 0, stdout=stdout)
+
+
+@pytest.fixture
+def builds(monkeypatch):
+    builds = Builds()
+    monkeypatch.setattr(subprocess, 'run', builds.run)
+    monkeypatch.setattr(Container, '_buildx_driver', None)
+    return builds
+
+
+def test_build_buildkit(builds, tmp_path):
+    '''Test the image is built by the docker CLI with the context digest label.'''
+    container = Container('brock-test-gcc', dockerfile=str(tmp_path / 'Dockerfile'))
+    container._build_buildkit(None, 'Dockerfile', 'digest')  # type: ignore
+    cmd = builds.commands[-1]
+    assert cmd[:2] == ['docker', 'build']
+    assert 'brock.context.digest=digest' in cmd
+    assert cmd[cmd.index('--platform') + 1] == 'linux'
+    assert '--load' not in cmd
+    assert '--pull' not in cmd
+
+
+def test_build_buildkit_container_driver(builds, tmp_path):
+    '''Test the image built by a builder running in a container is loaded to the docker engine.'''
+    builds.driver = 'docker-container'
+    container = Container('brock-test-gcc', platform=None, dockerfile=str(tmp_path / 'Dockerfile'))
+    container._build_buildkit(None, 'Dockerfile', 'digest')  # type: ignore
+    cmd = builds.commands[-1]
+    assert '--load' in cmd
+    assert '--platform' not in cmd
+
+
+class FakeImage:
+
+    def __init__(self, id):
+        self.id = id
+        self.labels = {}
+
+
+def test_update_pulls_base_images(builds, tmp_path, monkeypatch):
+    '''Test the update builds the image with the base images pulled even if the build context didn't change.'''
+    monkeypatch.setenv('BROCK_CACHE_DIR', str(tmp_path / 'cache'))
+    (tmp_path / 'Dockerfile').write_text('FROM gcc\n')
+    container = Container('brock-test-gcc', dockerfile=str(tmp_path / 'Dockerfile'))
+    monkeypatch.setattr(Container, '_use_buildkit', lambda self: True)
+    monkeypatch.setattr(Container, 'is_running', lambda self: False)
+    images = [FakeImage('sha256:1'), FakeImage('sha256:1')]
+    monkeypatch.setattr(Container, '_image', property(lambda self: images.pop(0)))
+
+    # the base images didn't change, the layers were reused
+    assert not container.update()
+    cmd = builds.commands[-1]
+    assert cmd[:2] == ['docker', 'build']
+    assert '--pull' in cmd
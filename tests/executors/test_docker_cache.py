@@ -0,0 +1,56 @@
+import pytest
+
+from brock.exception import ExecutorError
+
+
+class FakeContainer:
+
+    def __init__(self, name, users):
+        self.name = name
+        self.users = users
+        self.removed = []
+
+    def is_running(self):
+        return False
+
+    def volume_users(self, name):
+        return self.users
+
+    def remove_volume(self, name):
+        self.removed.append(name)
+
+    def exec_output(self, command, work_dir):
+        if command[0] == 'rm':
+            self.removed += command[3:]
+            return 0, b''
+        # access time, modification time, size and path of the cache files
+        return 0, b'300 100 400 /root/.ccache/a\n100 100 400 /root/.ccache/b\n100 200 400 /root/.ccache/c\n'
+
+
+def _executor(docker_executor, users):
+    executor = docker_executor(caches={'ccache': '/root/.ccache'})
+    executor._container = FakeContainer(executor._container.name, users)
+    return executor
+
+
+def test_prune_caches(docker_executor):
+    '''Test the cache volume of a stopped executor is removed.'''
+    executor = _executor(docker_executor, [])
+    executor.prune_caches()
+    assert executor._container.removed == ['brock-test-cache-ccache']
+
+
+def test_prune_caches_shared(docker_executor):
+    '''Test the cache volume is kept while another executor uses it.'''
+    executor = _executor(docker_executor, ['brock-test-clang'])
+    with pytest.raises(ExecutorError, match='brock-test-clang'):
+        executor.prune_caches()
+    assert executor._container.removed == []
+
+
+def test_cache_limit(docker_executor):
+    '''Test the least recently used files of a cache over its size limit are evicted.'''
+    executor = docker_executor(caches={'ccache': {'path': '/root/.ccache', 'size': '1000'}})
+    executor._container = FakeContainer(executor._container.name, [])
+    executor._check_cache_limits()
+    assert executor._container.removed == ['/root/.ccache/b']
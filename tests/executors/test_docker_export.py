@@ -0,0 +1,101 @@
+import io
+import os
+import subprocess
+import tarfile
+
+import pytest
+
+from brock.exception import ExecutorError
+
+
+class LocalContainer:
+    '''Emulates the container exec and archive API, the mount directory is a local directory'''
+
+    def __init__(self, name, mount_dir, root):
+        self.name = name
+        self.mount_dir = mount_dir
+        self.root = root
+        self.commands = []
+        self.removed = []
+
+    def is_running(self):
+        return True
+
+    def stop(self):
+        pass
+
+    def remove_volume(self, name):
+        self.removed.append(name)
+
+    def exec_output(self, command, work_dir):
+        self.commands.append(command)
+        res = subprocess.run(command, cwd=self.root, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        return res.returncode, res.stdout
+
+    def get_archive(self, path):
+        path = os.path.join(self.root, os.path.relpath(path, self.mount_dir))
+        if not os.path.exists(path):
+            return None
+        archive = io.BytesIO()
+        with tarfile.open(fileobj=archive, mode='w') as tar:
+            tar.add(path, arcname=os.path.basename(path))
+        archive.seek(0)
+        return archive
+
+
+def _executor(docker_executor, tmp_path):
+    project = tmp_path / 'project'
+    project.mkdir()
+    executor = docker_executor(
+        project, overlays=[{
+            'path': 'build',
+            'export': ['*.hex']
+        }, {
+            'path': 'out',
+            'type': 'tmpfs'
+        }]
+    )
+    executor._container = LocalContainer(executor._container.name, executor._mount_dir, str(tmp_path / 'volume'))
+    return executor, project, tmp_path / 'volume'
+
+
+def test_export(docker_executor, tmp_path, write_file):
+    '''Test the artifacts matching the patterns are copied to the project folder.'''
+    executor, project, volume = _executor(docker_executor, tmp_path)
+    write_file(volume / 'build' / 'main.hex', 'hex')
+    write_file(volume / 'build' / 'main.o')
+    write_file(volume / 'build' / 'lib' / 'lib.hex')
+    write_file(volume / 'build' / 'lib' / 'lib.map', 'map')
+
+    assert executor.export() == 0
+    assert os.listdir(project / 'build') == ['main.hex']
+    assert executor.export(['build/*/*.map', 'build/lib/lib.hex']) == 0
+    assert sorted(os.listdir(project / 'build' / 'lib')) == ['lib.hex', 'lib.map']
+
+
+def test_export_quoted(docker_executor, tmp_path, write_file):
+    '''Test the patterns are not interpreted by a shell.'''
+    executor, project, volume = _executor(docker_executor, tmp_path)
+    write_file(volume / 'build' / 'a b' / 'main.hex')
+
+    assert executor.export(['build/a b/*.hex']) == 0
+    assert os.listdir(project / 'build' / 'a b') == ['main.hex']
+    with pytest.raises(ExecutorError, match='No artifacts found'):
+        executor.export(['build/$(touch pwned)*'])
+    assert not (volume / 'pwned').exists()
+    assert all(x[0] == 'find' for x in executor._container.commands)
+
+
+def test_export_outside_overlay(docker_executor, tmp_path):
+    '''Test only the overlay content can be exported.'''
+    executor, _, _ = _executor(docker_executor, tmp_path)
+    with pytest.raises(ExecutorError, match='not inside any overlay'):
+        executor.export(['src/*.c'])
+
+
+def test_stop_deletes_overlays(docker_executor, tmp_path):
+    '''Test the overlay volumes are deleted when the executor is stopped explicitly.'''
+    executor, _, _ = _executor(docker_executor, tmp_path)
+    executor.stop()
+    assert len(executor._container.removed) == 1
+    assert executor._container.removed[0].startswith('brock-test-gcc-overlay-build-')
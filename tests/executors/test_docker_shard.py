@@ -0,0 +1,120 @@
+import threading
+import time
+
+import pytest
+
+from brock.exception import ExecutorError
+
+
+class FakeContainer:
+
+    def __init__(self, name, exit_codes, running=True):
+        self.name = name
+        self.exit_codes = exit_codes
+        self.running = running
+        self.started_image = None
+        self.items = []
+        self.commands = []
+
+    def is_running(self):
+        return self.running
+
+    def start(self, image=None):
+        self.running = True
+        self.started_image = image
+
+    def stop(self, delete_volumes=True):
+        self.running = False
+
+    def has_image(self, name):
+        return True
+
+    def image_id(self):
+        return 'sha256:1'
+
+    def exec(self, command, work_dir, env=None, prefix=None):
+        if env is None:
+            self.commands.append(command)
+            return self.exit_codes.get(command, 0)
+        item = env['BROCK_SHARD_ITEM']
+        self.items.append(item)
+        return self.exit_codes.get(item, 0)
+
+
+def _executor(docker_executor, exit_codes=None, **conf):
+    '''Creates a docker executor with three replicas, the containers are fakes'''
+    executor = docker_executor(replicas=3, **conf)
+    executor._container = FakeContainer(executor._container.name, exit_codes or {})
+    executor._replicas = [FakeContainer(x.name, exit_codes or {}, running=False) for x in executor._replicas]
+    executor._synced_in = True
+    return executor
+
+
+def test_exec_sharded(docker_executor):
+    '''Test every item is run exactly once, spread over the replicas.'''
+    executor = _executor(docker_executor)
+    items = [f'test-{i}' for i in range(20)]
+    assert executor.exec_sharded('make', items) == 0
+    containers = [executor._container] + executor._replicas
+    assert all(x.is_running() for x in containers)
+    assert sorted(x for c in containers for x in c.items) == sorted(items)
+
+
+def test_exec_sharded_exit_code(docker_executor):
+    '''Test the exit code of the first failed item is returned, no matter which replica finished first.'''
+    executor = _executor(docker_executor, {'test-1': 3, 'test-5': 7})
+    assert executor.exec_sharded('make', [f'test-{i}' for i in range(8)]) == 3
+    executor = _executor(docker_executor, {'test-1': 3, 'test-5': 7})
+    assert executor.exec_sharded('make', [f'test-{i}' for i in reversed(range(8))]) == 7
+
+
+def test_exec_sharded_no_replicas(docker_executor):
+    '''Test the items are run one by one without replicas, the item is not left in the executor environment.'''
+    executor = _executor(docker_executor)
+    executor._replicas = []
+    assert executor.exec_sharded('make', ['test-1', 'test-2'], env_options={'CC': 'gcc'}) == 0
+    assert executor._container.items == ['test-1', 'test-2']
+    assert 'BROCK_SHARD_ITEM' not in executor.env_vars
+    assert 'CC' not in executor.env_vars
+
+
+def test_exec_sharded_stop(docker_executor):
+    '''Test the replicas take no more items once interrupted.'''
+    executor = _executor(docker_executor)
+    executor._replicas = executor._replicas[:1]
+    interrupted = threading.Event()
+
+    def interrupt(command, work_dir, env=None, prefix=None):
+        interrupted.set()
+        raise KeyboardInterrupt()
+
+    def slow(command, work_dir, env=None, prefix=None):
+        interrupted.wait()
+        time.sleep(0.01)
+        executor._replicas[0].items.append(env['BROCK_SHARD_ITEM'])
+        return 0
+
+    executor._container.exec = interrupt
+    executor._replicas[0].exec = slow
+    with pytest.raises(KeyboardInterrupt):
+        executor.exec_sharded('make', [f'test-{i}' for i in range(100)])
+    assert len(executor._replicas[0].items) < 10
+
+
+def test_start_replicas(docker_executor):
+    '''Test only the stopped replicas are started and prepared.'''
+    executor = _executor(docker_executor, prepare=['./setup.sh'])
+    executor._replicas[0].running = True
+    executor._start_replicas()
+    assert executor._replicas[0].commands == []
+    assert executor._replicas[1].running
+    assert executor._replicas[1].started_image is None
+    assert executor._replicas[1].commands == ['./setup.sh']
+
+
+def test_start_replicas_failed(docker_executor):
+    '''Test a replica failing the prepare steps is stopped.'''
+    executor = _executor(docker_executor, {'./setup.sh': 1}, prepare=['./setup.sh'])
+    with pytest.raises(ExecutorError):
+        executor._start_replicas()
+    assert not any(x.is_running() for x in executor._replicas)
@@ -0,0 +1,97 @@
+import docker
+
+from brock.executors.docker import Container
+
+
+class FakeImage:
+
+    def __init__(self, tags):
+        self.tags = tags
+
+
+class FakeImages:
+    '''Emulates the image API of the docker client, images in use can't be removed'''
+
+    def __init__(self, images, used=()):
+        self.images = images
+        self.used = used
+        self.removed = []
+
+    def list(self, name=None):
+        return [x for x in self.images if any(y.startswith(f'{name}:') for y in x.tags)]
+
+    def remove(self, image):
+        if image in self.used:
+            raise docker.errors.APIError('image is being used by a container')
+        self.removed.append(image)
+
+
+class FakeDocker:
+
+    def __init__(self, images):
+        self.images = images
+
+
+def test_remove_images(monkeypatch):
+    '''Test the other tags of the repository are removed, the images in use are kept.'''
+    tags = [['snapshot:new'], ['snapshot:old'], ['snapshot:used'], ['snapshot:older', 'other:latest']]
+    images = FakeImages([FakeImage(x) for x in tags], used=['snapshot:used'])
+    monkeypatch.setattr(Container, '_docker', property(lambda self: FakeDocker(images)))
+    Container('brock-test-gcc', image='gcc').remove_images('snapshot', 'snapshot:new')
+    assert images.removed == ['snapshot:old', 'snapshot:older']
+
+
+class FakeContainer:
+
+    def __init__(self, name, image_id='sha256:1'):
+        self.name = name
+        self.id = image_id
+        self.calls = []
+
+    def has_image(self, name):
+        return False
+
+    def image_id(self):
+        return self.id
+
+    def start(self, image=None):
+        self.calls.append('start')
+
+    def exec(self, command, work_dir):
+        self.calls.append(command)
+        return 0
+
+    def commit(self, repository, tag):
+        self.calls.append(f'commit {repository}:{tag}')
+
+    def remove_images(self, repository, keep):
+        self.calls.append(f'remove {repository} except {keep}')
+
+
+def test_snapshot_name(docker_executor, tmp_path):
+    '''Test the snapshots of other checkouts of the project are separate, the snapshot follows the image.'''
+    (tmp_path / 'a').mkdir()
+    (tmp_path / 'b').mkdir()
+    first = docker_executor(tmp_path / 'a', prepare=['./setup.sh'], snapshot=True)
+    second = docker_executor(tmp_path / 'b', prepare=['./setup.sh'], snapshot=True)
+    first._container = FakeContainer(first._container.name)
+    second._container = FakeContainer(second._container.name)
+    assert first._get_snapshot().split(':')[0] != second._get_snapshot().split(':')[0]
+
+    snapshot = first._get_snapshot()
+    first._container.id = 'sha256:2'
+    assert first._get_snapshot() != snapshot
+
+
+def test_snapshot_replaced(docker_executor):
+    '''Test the previous snapshots are removed once a new one is created.'''
+    executor = docker_executor(prepare=['./setup.sh'], snapshot=True)
+    executor._container = FakeContainer(executor._container.name)
+    executor._synced_in = True
+    assert executor._start_container() == 0
+
+    snapshot = executor._get_snapshot()
+    repository = snapshot.split(':')[0]
+    assert executor._container.calls == [
+        'start', './setup.sh', f'commit {snapshot}', f'remove {repository} except {snapshot}'
+    ]
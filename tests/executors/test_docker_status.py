@@ -0,0 +1,61 @@
+import yaml
+
+from brock.config.config import Config
+from brock.executors.docker import Container, DockerExecutor
+
+
+class FakeContainer:
+
+    def __init__(self, stats):
+        self._stats = stats
+
+    def stats(self, stream=True, one_shot=None):
+        return self._stats
+
+
+def test_resource_usage():
+    '''Test CPU and memory usage are computed from the container stats like docker stats does.'''
+    stats = {
+        'cpu_stats': {
+            'cpu_usage': {
+                'total_usage': 300
+            },
+            'system_cpu_usage': 2000,
+            'online_cpus': 4
+        },
+        'precpu_stats': {
+            'cpu_usage': {
+                'total_usage': 100
+            },
+            'system_cpu_usage': 1000
+        },
+        'memory_stats': {
+            'usage': 5000,
+            'stats': {
+                'inactive_file': 1000
+            }
+        },
+    }
+    assert Container.resource_usage(FakeContainer(stats)) == (80.0, 4000)
+
+
+def test_resource_usage_unknown():
+    '''Test missing stats (e.g. the first sample) are reported as unknown.'''
+    assert Container.resource_usage(FakeContainer({'cpu_stats': {}, 'precpu_stats': {}})) == (None, None)
+
+
+def test_statuses_unlabeled(tmp_path, monkeypatch):
+    '''Test containers without labels (started by older versions) are found by their names, quickly.'''
+    content = {'version': '0.0.1', 'project': 'test', 'executors': {'gcc': {'type': 'docker', 'image': 'gcc'}}}
+    executor = DockerExecutor(Config([yaml.dump(content)], work_dir=str(tmp_path)), 'gcc')
+    container = FakeContainer({})
+    monkeypatch.setattr(Container, 'list_labeled', lambda labels: {})
+    monkeypatch.setattr(Container, 'list_named', lambda names: {x: container for x in names})
+    monkeypatch.setattr(
+        container, 'stats', lambda stream, one_shot: {'memory_stats': {
+            'usage': 2048
+        }} if one_shot else {}
+    )
+
+    status = DockerExecutor.statuses([executor])['gcc']
+    assert status.startswith('Running (memory 2.0 KB)')
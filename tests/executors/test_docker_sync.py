@@ -0,0 +1,167 @@
+import pytest
+
+from brock.exception import ExecutorError
+
+
+class FakeContainer:
+
+    def __init__(self, name, running=False):
+        self.name = name
+        self.running = running
+        self.transfer_log = ''
+        # the volume was modified since the last sync
+        self.modified = False
+        self.users = [name]
+        self.calls = []
+
+    def is_running(self):
+        return self.running
+
+    def volume_id(self, name):
+        return f'{name}@1'
+
+    def volume_users(self, name):
+        return self.users
+
+    def stop(self, delete_volumes=True):
+        self.calls.append('stop')
+
+    def delete_volumes(self):
+        self.calls.append('delete_volumes')
+
+    def put_file(self, path, data):
+        self.files = data.decode().split('\n')
+
+    def exec_output(self, command, work_dir):
+        if command[0] == 'cat':
+            return 0, self.transfer_log.encode()
+        if command[0] == 'sh' and 'find' in command[2]:
+            return 0, b'/src/main.o' if self.modified else b''
+        if command[0] == 'sh' and 'touch' in command[2]:
+            self.modified = False
+        return 0, b''
+
+
+def _executor(docker_executor, tmp_path, monkeypatch, sync):
+    '''Creates a docker executor with the rsync calls recorded instead of run'''
+    project = tmp_path / 'project'
+    project.mkdir()
+    executor = docker_executor(project, sync=dict({'type': 'rsync'}, **sync))
+    executor._container = FakeContainer(executor._container.name, running=True)
+    executor._sync_container = FakeContainer(executor._sync_container.name)
+    executor.rsyncs = []
+    monkeypatch.setattr(executor, '_rsync', lambda src, dest, **kwargs: executor.rsyncs.append((src, dest, kwargs)))
+    return executor, project
+
+
+def test_outputs(docker_executor, tmp_path, monkeypatch):
+    '''Test only the changed files are synced in with outputs, so the intermediates in the volume are kept.'''
+    executor, project = _executor(docker_executor, tmp_path, monkeypatch, {'outputs': ['build/*.hex']})
+    (project / 'main.c').write_text('int main;')
+    executor._sync_in()
+    # no manifest yet, the whole tree is synced
+    assert executor.rsyncs.pop() == ('/host', '/rsync_volume', {'paths': None})
+
+    executor._sync_out()
+    src, dest, kwargs = executor.rsyncs.pop()
+    assert (src, dest) == ('/rsync_volume', '/host')
+    assert "--include 'build/*.hex'" in kwargs['rules']
+    assert "--exclude '*'" in kwargs['rules']
+
+    (project / 'main.c').unlink()
+    (project / 'util.c').write_text('int util;')
+    executor._sync_in()
+    src, dest, kwargs = executor.rsyncs.pop()
+    assert '--delete-missing-args' in kwargs['extra_options']
+    assert sorted(executor._sync_container.files) == ['main.c', 'util.c']
+
+
+def test_outputs_host_edits(docker_executor, tmp_path, monkeypatch):
+    '''Test files edited on the host while the command ran are still synced in next time.'''
+    executor, project = _executor(docker_executor, tmp_path, monkeypatch, {'outputs': ['build/*.hex']})
+    (project / 'main.c').write_text('int main;')
+    (project / 'old.hex').write_text('old')
+    executor._sync_in()
+    executor.rsyncs.clear()
+
+    # an output is synced back while main.c is edited on the host
+    (project / 'build').mkdir()
+    (project / 'build' / 'main.hex').write_text('hex')
+    (project / 'old.hex').unlink()
+    (project / 'main.c').write_text('int main = 1;')
+    executor._sync_container.transfer_log = '\n'.join([
+        '2024/01/01 10:00:00 [42] building file list',
+        '2024/01/01 10:00:00 [42] cd+++++++++ build/',
+        '2024/01/01 10:00:00 [42] >f+++++++++ build/main.hex',
+        '2024/01/01 10:00:00 [42] *deleting   old.hex',
+    ])
+    executor._sync_out()
+
+    executor._sync_in()
+    assert executor._sync_container.files == ['main.c']
+    executor.rsyncs.clear()
+    executor._sync_in()
+    assert executor.rsyncs == []
+
+
+def test_outputs_not_incremental(docker_executor, tmp_path, monkeypatch):
+    '''Test the incremental sync in implied by outputs can be disabled.'''
+    executor, _ = _executor(docker_executor, tmp_path, monkeypatch, {'outputs': ['build/*.hex'], 'incremental': False})
+    executor._sync_in()
+    executor._sync_in()
+    assert executor.rsyncs == [('/host', '/rsync_volume', {'paths': None})] * 2
+
+
+def test_outputs_not_synced_out(docker_executor, tmp_path, monkeypatch):
+    '''Test the whole tree is synced in after the changes made in the volume were not synced out.'''
+    executor, project = _executor(docker_executor, tmp_path, monkeypatch, {'outputs': ['build/*.hex']})
+    (project / 'main.c').write_text('int main;')
+    executor._sync_in()
+    executor._sync_in()
+    assert executor.rsyncs.pop() == ('/host', '/rsync_volume', {'paths': None})
+    assert executor.rsyncs == []
+
+    executor._container.modified = True
+    executor._sync_in()
+    assert executor.rsyncs.pop() == ('/host', '/rsync_volume', {'paths': None})
+
+
+def test_outputs_sync_out_failed(docker_executor, tmp_path, monkeypatch):
+    '''Test the whole tree is synced in after a failed sync out.'''
+    executor, project = _executor(docker_executor, tmp_path, monkeypatch, {'outputs': ['build/*.hex']})
+    (project / 'main.c').write_text('int main;')
+    executor._sync_in()
+    executor.rsyncs.clear()
+
+    def fail(src, dest, **kwargs):
+        raise ExecutorError('Failed to rsync data')
+
+    monkeypatch.setattr(executor, '_rsync', fail)
+    with pytest.raises(ExecutorError):
+        executor._sync_out()
+    monkeypatch.setattr(executor, '_rsync', lambda src, dest, **kwargs: executor.rsyncs.append((src, dest, kwargs)))
+    executor._sync_in()
+    assert executor.rsyncs == [('/host', '/rsync_volume', {'paths': None})]
+
+
+def test_sync_lock_not_held_by_commands(docker_executor, tmp_path, monkeypatch):
+    '''Test a running command holds only the use lock, syncs of other processes don't wait for it.'''
+    executor, _ = _executor(docker_executor, tmp_path, monkeypatch, {})
+    with executor._lock('use', shared=True):
+        assert not executor._lock('use').acquire(blocking=False)
+        sync = executor._lock('sync')
+        assert sync.acquire(blocking=False)
+        sync.release()
+
+
+def test_stop_shared_volume(docker_executor, tmp_path, monkeypatch):
+    '''Test the sync volume and container are kept while another executor uses the volume.'''
+    executor, _ = _executor(docker_executor, tmp_path, monkeypatch, {})
+    executor._sync_container.users = [executor._sync_container.name, 'brock-test-clang']
+    executor._stop()
+    assert executor._container.calls == ['stop']
+    assert executor._sync_container.calls == []
+
+    executor._sync_container.users = [executor._sync_container.name]
+    executor._stop()
+    assert executor._sync_container.calls == ['stop', 'delete_volumes']
@@ -0,0 +1,16 @@
+import os
+
+import yaml
+
+from brock.config.config import Config
+from brock.executors.host import HostExecutor
+
+
+def test_exec_env(tmp_path, monkeypatch):
+    '''Test the environment options are passed to the command only, not to the brock process.'''
+    monkeypatch.delenv('BROCK_TEST_VAR', raising=False)
+    config = Config([yaml.dump({'version': '0.0.1', 'project': 'test'})], work_dir=str(tmp_path))
+    executor = HostExecutor(config, 'host')
+    assert executor.exec(['sh', '-c', 'test "$BROCK_TEST_VAR" = foo'], env_options={'BROCK_TEST_VAR': 'foo'}) == 0
+    assert 'BROCK_TEST_VAR' not in os.environ
+    assert executor.exec(['sh', '-c', 'test -z "$BROCK_TEST_VAR"']) == 0
@@ -0,0 +1,103 @@
+import os
+import sys
+import time
+import stat
+
+import pytest
+
+from brock.executors.docker import MutagenSync
+
+FAKE_MUTAGEN = '''#!{python}
+import sys
+import json
+import time
+
+args = sys.argv[1:]
+if args[:2] == ['sync', 'flush']:
+    time.sleep(0.05)
+    sys.exit(0 if args[2] == 'brock-session' else 1)
+elif args[:2] == ['sync', 'list'] and '--template' in args:
+    {template}
+elif args[:2] == ['sync', 'list']:
+    print(\'\'\'
+Name: first
+Identifier: sync_1
+Alpha:
+    URL: /foo
+    Connected: Yes
+Beta:
+    URL: docker://first/host
+    Connected: Yes
+Status: Watching for changes
+--------------------------------
+Name: second
+Identifier: sync_2
+Alpha:
+    URL: /bar
+    Connected: Yes
+Beta:
+    URL: docker://second/host
+    Connected: No
+Status: Connecting to beta
+\'\'\')
+'''
+
+JSON_TEMPLATE = '''sessions = [{"name": "brock-session", "identifier": "sync_1", "status": "watching",
+                 "alpha": {"path": "/foo", "connected": True},
+                 "beta": {"protocol": "docker", "host": "first", "path": "/host", "connected": True}}]
+    if len(args) > 4 and args[4] != 'brock-session':
+        print('unable to locate requested sessions', file=sys.stderr)
+        sys.exit(1)
+    print(json.dumps(sessions))'''
+
+
+@pytest.fixture
+def fake_mutagen(tmp_path, monkeypatch):
+
+    def install(template='sys.exit(1)'):
+        path = tmp_path / 'mutagen'
+        path.write_text(FAKE_MUTAGEN.format(python=sys.executable, template=template))
+        path.chmod(path.stat().st_mode | stat.S_IEXEC)
+        monkeypatch.setenv('PATH', f'{tmp_path}{os.pathsep}{os.environ["PATH"]}')
+
+    return install
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='fake binary is a python script')
+def test_mutagen_wait_latency(fake_mutagen):
+    '''Test wait returns as soon as the session is flushed.'''
+    fake_mutagen(JSON_TEMPLATE)
+    start = time.time()
+    assert MutagenSync.wait('brock-session')
+    assert time.time() - start < 0.9
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='fake binary is a python script')
+def test_mutagen_get_json(fake_mutagen):
+    '''Test a single session is read from the machine-readable output.'''
+    fake_mutagen(JSON_TEMPLATE)
+    session = MutagenSync.get('brock-session')
+    assert session == {
+        'name': 'brock-session',
+        'identifier': 'sync_1',
+        'status': 'watching',
+        'alpha': {
+            'url': '/foo',
+            'connected': True
+        },
+        'beta': {
+            'url': 'docker://first/host',
+            'connected': True
+        },
+    }
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='fake binary is a python script')
+def test_mutagen_list_text(fake_mutagen):
+    '''Test all sessions are parsed from the human-readable output of older Mutagen versions.'''
+    fake_mutagen()
+    sessions = list(MutagenSync.list())
+    assert [x['name'] for x in sessions] == ['first', 'second']
+    assert sessions[1]['beta'] == {'url': 'docker://second/host', 'connected': False}
+    assert MutagenSync.get('second')['status'] == 'Connecting to beta'
+    assert MutagenSync.get('third') is None
@@ -0,0 +1,97 @@
+import io
+import os
+import subprocess
+import tarfile
+
+from brock.executors.docker import NativeSync
+from brock.sync.filters import PathFilter
+
+
+class LocalContainer:
+    '''Emulates the container archive and exec API on the local file system'''
+
+    def put_file(self, path, data):
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def put_archive(self, path, archive):
+        with tarfile.open(fileobj=archive) as tar:
+            tar.extractall(path)
+
+    def get_archive(self, path):
+        if not os.path.exists(path):
+            return None
+        archive = io.BytesIO()
+        with tarfile.open(fileobj=archive, mode='w') as tar:
+            tar.add(path, arcname=os.path.basename(path))
+        archive.seek(0)
+        return archive
+
+    def exec_output(self, command, work_dir):
+        res = subprocess.run(command, cwd=work_dir, stdout=subprocess.PIPE)
+        return res.returncode, res.stdout
+
+
+def _read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def test_native_sync(tmp_path, write_file):
+    '''Test syncing changes into the volume and back.'''
+    host = tmp_path / 'host'
+    volume = tmp_path / 'volume'
+    volume.mkdir()
+    (tmp_path / 'state').mkdir()
+    write_file(host / 'src' / 'main.c')
+    write_file(host / 'src' / 'old.c')
+    write_file(host / 'build' / 'main.o')
+
+    sync = NativeSync(
+        LocalContainer(), str(host), str(volume), PathFilter([(False, 'build/')]), str(tmp_path / 'state')
+    )  # type: ignore
+    assert sync.sync_in() == (3, 3)
+    assert sorted(os.listdir(volume)) == ['src']
+    assert sorted(os.listdir(volume / 'src')) == ['main.c', 'old.c']
+
+    # nothing changed
+    assert sync.sync_in() == (3, 0)
+
+    os.remove(host / 'src' / 'old.c')
+    write_file(host / 'src' / 'main.c', 'changed')
+    assert sync.sync_in() == (2, 2)
+    assert os.listdir(volume / 'src') == ['main.c']
+    assert _read(volume / 'src' / 'main.c') == 'changed'
+
+    # changes made in the container
+    write_file(volume / 'src' / 'generated.c', 'generated')
+    write_file(volume / 'build' / 'main.o', 'object')
+    os.remove(volume / 'src' / 'main.c')
+    assert sync.sync_out()[1] == 2
+    assert os.listdir(host / 'src') == ['generated.c']
+    assert _read(host / 'src' / 'generated.c') == 'generated'
+    assert _read(host / 'build' / 'main.o') == 'foo'
+
+    assert sync.sync_out()[1] == 0
+    assert sync.sync_in() == (2, 0)
+
+
+def test_native_sync_host_edits(tmp_path, write_file):
+    '''Test files edited on the host while the command ran are still synced in next time.'''
+    host = tmp_path / 'host'
+    volume = tmp_path / 'volume'
+    volume.mkdir()
+    (tmp_path / 'state').mkdir()
+    write_file(host / 'src' / 'main.c')
+
+    sync = NativeSync(LocalContainer(), str(host), str(volume), PathFilter([]), str(tmp_path / 'state'))  # type: ignore
+    assert sync.sync_in() == (2, 2)
+
+    write_file(volume / 'out' / 'main.hex', 'hex')
+    write_file(host / 'src' / 'main.c', 'edited on host')
+    assert sync.sync_out()[1] == 1
+    assert _read(host / 'out' / 'main.hex') == 'hex'
+
+    assert sync.sync_in()[1] == 1
+    assert _read(volume / 'src' / 'main.c') == 'edited on host'
+    assert sync.sync_in()[1] == 0
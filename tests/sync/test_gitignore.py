@@ -0,0 +1,50 @@
+from brock.sync.filters import PathFilter
+from brock.sync.gitignore import GitIgnore, translate
+
+
+def test_translate():
+    '''Test ignore file lines are translated to rsync-like rules.'''
+    assert translate('# comment\n') == []
+    assert translate('   \n') == []
+    assert translate('*.o\n') == [(False, '*.o')]
+    assert translate('/build/\n') == [(False, '/build/')]
+    assert translate('!keep.o') == [(True, 'keep.o')]
+    assert translate('\\#file') == [(False, '#file')]
+    assert translate('doc/*.html') == [(False, '/doc/*.html')]
+    assert translate('**/out') == [(False, 'out')]
+    assert translate('**/out/bin') == [(False, '/out/bin'), (False, '/**/out/bin')]
+    assert translate('*.o', 'lib') == [(False, '/lib/*.o'), (False, '/lib/**/*.o')]
+    assert translate('/gen/', 'lib') == [(False, '/lib/gen/')]
+
+
+def test_gitignore_scan(tmp_path, write_file):
+    '''Test rules of nested ignore files override the parent ones.'''
+    write_file(tmp_path / '.gitignore', '*.o\nbuild/\n')
+    write_file(tmp_path / 'lib' / '.gitignore', '!keep.o\n')
+    write_file(tmp_path / 'build' / '.gitignore', 'never-read\n')
+    write_file(tmp_path / '.git' / 'info' / 'exclude', '*.log\n')
+
+    rules = GitIgnore.scan(str(tmp_path)).rules
+    assert (False, 'never-read') not in rules
+    path_filter = PathFilter(rules)
+    assert path_filter.excludes('main.o', False)
+    assert path_filter.excludes('src/main.o', False)
+    assert not path_filter.excludes('lib/keep.o', False)
+    assert not path_filter.excludes('lib/sub/keep.o', False)
+    assert path_filter.excludes('lib/main.o', False)
+    assert path_filter.excludes('build', True)
+    assert not path_filter.excludes('build', False)
+    assert path_filter.excludes('debug.log', False)
+    assert not path_filter.excludes('main.c', False)
+
+
+def test_gitignore_cache(tmp_path, monkeypatch, write_file):
+    '''Test the cached rules are refreshed when an ignore file is added.'''
+    monkeypatch.setenv('BROCK_CACHE_DIR', str(tmp_path / 'cache'))
+    project = tmp_path / 'project'
+    write_file(project / '.gitignore', '*.o\n')
+    assert GitIgnore.load(str(project)).rules == [(False, '*.o')]
+    assert GitIgnore.load(str(project)).rules == [(False, '*.o')]
+
+    write_file(project / 'lib' / '.gitignore', '/gen/\n')
+    assert GitIgnore.load(str(project)).rules == [(False, '/lib/gen/'), (False, '*.o')]
@@ -0,0 +1,88 @@
+import os
+
+from brock.sync.filters import PathFilter
+from brock.sync.manifest import Manifest
+
+
+def test_manifest_diff(tmp_path, write_file):
+    '''Test changed, new and deleted files are detected.'''
+    write_file(tmp_path / 'src' / 'main.c')
+    write_file(tmp_path / 'src' / 'old.c')
+    write_file(tmp_path / 'README.md')
+    previous = Manifest.scan(str(tmp_path))
+
+    write_file(tmp_path / 'src' / 'main.c', 'changed content')
+    write_file(tmp_path / 'src' / 'new' / 'new.c')
+    os.remove(tmp_path / 'src' / 'old.c')
+    current = Manifest.scan(str(tmp_path))
+
+    changed, deleted = previous.diff(current)
+    assert changed == ['src/main.c', 'src/new', 'src/new/new.c']
+    assert deleted == ['src/old.c']
+    assert current.diff(Manifest.scan(str(tmp_path))) == ([], [])
+
+
+def test_manifest_save_load(tmp_path, write_file):
+    '''Test the manifest is the same after saving and loading.'''
+    write_file(tmp_path / 'tree' / 'a.txt')
+    manifest = Manifest.scan(str(tmp_path / 'tree'))
+    manifest.volume = 'volume@1'
+    manifest.save(str(tmp_path / 'manifest.json'))
+
+    loaded = Manifest.load(str(tmp_path / 'manifest.json'))
+    assert loaded is not None
+    assert loaded.volume == 'volume@1'
+    assert loaded.diff(manifest) == ([], [])
+    assert Manifest.load(str(tmp_path / 'missing.json')) is None
+
+
+def test_manifest_filter(tmp_path, write_file):
+    '''Test excluded paths are not scanned.'''
+    write_file(tmp_path / 'build' / 'out.o')
+    write_file(tmp_path / 'src' / 'build' / 'gen.c')
+    write_file(tmp_path / 'src' / 'main.c')
+    write_file(tmp_path / 'src' / 'main.o')
+
+    path_filter = PathFilter.from_sync_config([], ['/src/build'], ['build', '*.o'])
+    manifest = Manifest.scan(str(tmp_path), path_filter)
+    assert sorted(manifest.entries) == ['src', 'src/build', 'src/build/gen.c', 'src/main.c']
+
+    # unknown filter rules disable the filtering completely
+    path_filter = PathFilter.from_sync_config(['dir-merge .rsync-filter'], [], ['build'])
+    assert len(Manifest.scan(str(tmp_path), path_filter)) == 7
+
+
+def test_manifest_scoped(tmp_path, write_file):
+    '''Test scanning and merging of a manifest limited to subtrees.'''
+    write_file(tmp_path / 'a' / 'one.c')
+    write_file(tmp_path / 'b' / 'two.c')
+    write_file(tmp_path / 'top.txt')
+    previous = Manifest.scan(str(tmp_path))
+
+    os.remove(tmp_path / 'a' / 'one.c')
+    os.remove(tmp_path / 'b' / 'two.c')
+    write_file(tmp_path / 'a' / 'three.c')
+    current = Manifest.scan(str(tmp_path), paths=['a', 'top.txt', 'missing'])
+    assert sorted(current.entries) == ['a', 'a/three.c', 'top.txt']
+
+    # deletions outside of the scanned subtrees are not reported
+    assert previous.diff(current, ['a', 'top.txt', 'missing']) == (['a/three.c'], ['a/one.c'])
+
+    merged = previous.merge(current, ['a', 'top.txt', 'missing'])
+    assert sorted(merged.entries) == ['a', 'a/three.c', 'b', 'b/two.c', 'top.txt']
+
+
+def test_manifest_update(tmp_path, write_file):
+    '''Test only the given paths are updated from the tree.'''
+    write_file(tmp_path / 'src' / 'main.c')
+    write_file(tmp_path / 'src' / 'old.c')
+    previous = Manifest.scan(str(tmp_path))
+
+    write_file(tmp_path / 'src' / 'main.c', 'edited on host')
+    write_file(tmp_path / 'build' / 'main.hex')
+    os.remove(tmp_path / 'src' / 'old.c')
+    updated = previous.update(str(tmp_path), ['build', 'build/main.hex'], ['src/old.c'])
+
+    changed, deleted = updated.diff(Manifest.scan(str(tmp_path)))
+    assert changed == ['src/main.c']
+    assert deleted == []
@@ -0,0 +1,43 @@
+import docker
+import pytest
+
+from brock.executors.docker import Container
+
+
+@pytest.fixture(scope='module')
+def registry():
+    '''Local registry with two different images to push under the same tag'''
+    client = docker.from_env()
+    container = client.containers.run('registry:2', detach=True, auto_remove=True, ports={'5000/tcp': None})
+    container.reload()
+    port = container.ports['5000/tcp'][0]['HostPort']
+    yield client, f'localhost:{port}'
+    container.stop()
+
+
+def _push(client, source, repository):
+    image = client.images.pull(source)
+    image.tag(repository, 'test')
+    client.images.push(repository, 'test')
+
+
+def test_update_image(registry):
+    '''Test the image is updated and the container stopped only if the image changed in the registry.'''
+    client, address = registry
+    repository = f'{address}/brock-update'
+    _push(client, 'alpine:3.18', repository)
+
+    container = Container('brock-test-update', image=f'{repository}:test', command='sh')
+    try:
+        client.images.remove(f'{repository}:test', force=True)
+        assert container.update()
+        container.start()
+
+        assert not container.update()
+        assert container.is_running()
+
+        _push(client, 'alpine:3.19', repository)
+        assert container.update()
+        assert not container.is_running()
+    finally:
+        container.stop()
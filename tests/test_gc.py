@@ -0,0 +1,100 @@
+import time
+import hashlib
+
+import pytest
+
+from brock.exception import UsageError
+from brock.gc import collect, parse_age, record_usage
+
+
+class FakeClient:
+
+    def __init__(self, usage):
+        self._usage = usage
+
+    def df(self):
+        return self._usage
+
+
+def _labels(path, role='executor'):
+    return {'brock.project': 'test', 'brock.base-dir': 'a' * 32, 'brock.path': str(path), 'brock.role': role}
+
+
+def test_parse_age():
+    '''Test age is parsed to seconds, days are the default unit.'''
+    assert parse_age('30') == 30 * 86400
+    assert parse_age('12h') == 12 * 3600
+    assert parse_age('2w') == 14 * 86400
+    with pytest.raises(UsageError):
+        parse_age('soon')
+
+
+def test_collect_missing_directory(tmp_path):
+    '''Test resources of a deleted project directory are collected, except the shared caches.'''
+    missing = tmp_path / 'missing'
+    client = FakeClient({
+        'Containers': [{
+            'Id': '1',
+            'Names': ['/brock-test-gcc-' + 'a' * 32],
+            'Labels': _labels(missing),
+            'State': 'exited',
+            'Created': 0
+        }],
+        'Volumes': [
+            {
+                'Name': 'test-rsync-volume-' + 'b' * 32,
+                'Labels': None,
+                'UsageData': {
+                    'Size': 1024
+                }
+            },
+            {
+                'Name': 'brock-test-cache-ccache',
+                'Labels': _labels(missing, 'cache'),
+                'UsageData': {
+                    'Size': 1024
+                }
+            },
+            {
+                'Name': 'foo',
+                'Labels': None,
+                'UsageData': {
+                    'Size': 1024
+                }
+            },
+        ],
+        'Images': [{
+            'Id': 'sha256:1',
+            'RepoTags': ['brock-test-gcc-snapshot:123'],
+            'Labels': _labels(missing),
+            'Size': 300,
+            'SharedSize': 100,
+            'Created': 0
+        }],
+    })
+    orphans = collect(client)
+    assert [(x.kind, x.name, x.size) for x, _ in orphans] == [
+        ('container', 'brock-test-gcc-' + 'a' * 32, 0),
+        ('image', 'brock-test-gcc-snapshot:123', 200),
+    ]
+    assert orphans[0][1] == f'{missing} does not exist'
+
+
+def test_collect_unused(tmp_path, monkeypatch):
+    '''Test resources of existing projects are collected only if not used for the given age.'''
+    monkeypatch.setenv('BROCK_CACHE_DIR', str(tmp_path / 'cache'))
+    labels = dict(_labels(tmp_path, 'overlay'), **{'brock.base-dir': hashlib.md5(str(tmp_path).encode()).hexdigest()})
+    created = time.gmtime(time.time() - 10 * 86400)
+    client = FakeClient({
+        'Volumes': [{
+            'Name': 'brock-test-gcc-overlay-build',
+            'Labels': labels,
+            'CreatedAt': time.strftime('%Y-%m-%dT%H:%M:%SZ', created)
+        }]
+    })
+    assert collect(client) == []
+    assert len(collect(client, parse_age('5d'))) == 1
+
+    # the recorded use is more recent than the creation
+    record_usage(str(tmp_path))
+    assert collect(client, parse_age('5d')) == []
@@ -0,0 +1,51 @@
+import sys
+import threading
+import time
+
+import pytest
+
+from brock.lock import FileLock
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv('BROCK_CACHE_DIR', str(tmp_path))
+
+
+def test_exclusive_lock():
+    '''Test an exclusive lock is held by a single holder at once.'''
+    with FileLock('test'):
+        assert not FileLock('test').acquire(blocking=False)
+        assert not FileLock('test', shared=True).acquire(blocking=False)
+    lock = FileLock('test')
+    assert lock.acquire(blocking=False)
+    lock.release()
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='shared locks are exclusive on Windows')
+def test_shared_lock():
+    '''Test shared locks are held at once and exclude the exclusive ones.'''
+    with FileLock('test', shared=True):
+        shared = FileLock('test', shared=True)
+        assert shared.acquire(blocking=False)
+        shared.release()
+        assert not FileLock('test').acquire(blocking=False)
+
+
+def test_waiting_for_lock():
+    '''Test a blocking lock waits for the current holder.'''
+    events = []
+    lock = FileLock('test')
+    lock.acquire()
+
+    def wait():
+        with FileLock('test'):
+            events.append('acquired')
+
+    thread = threading.Thread(target=wait)
+    thread.start()
+    time.sleep(0.2)
+    events.append('released')
+    lock.release()
+    thread.join()
+    assert events == ['released', 'acquired']
@@ -0,0 +1,376 @@
+import re
+import time
+import threading
+import pytest
+import yaml
+from munch import Munch
+
+from brock.config.config import Config
+from brock.exception import ExecutorError
+from brock.executors import Executor
+from brock.project import Command, Project
+
+
+class FakeExecutor(Executor):
+    '''Records sync calls, the synced data are modified by commands containing "write"'''
+
+    def __init__(self, config, name, synced=True):
+        super().__init__(config, name)
+        self._synced = synced
+        self._dirty = False
+        self.calls = []
+
+    @property
+    def synced(self):
+        return self._synced
+
+    def is_dirty(self):
+        return self._dirty
+
+    def sync_in(self, chdir=None, paths=()):
+        self.calls.append('sync_in')
+        self._dirty = False
+
+    def sync_out(self):
+        self.calls.append('sync_out')
+
+    def exec(self, command, chdir=None, env_options=None):
+        self.calls.append(command)
+        self._dirty = self._dirty or 'write' in command
+        return 0
+
+    def stop(self):
+        print(f'stopping {self.name}')
+        self.calls.append('stop')
+        if self.name == 'a':
+            raise ExecutorError('cannot stop')
+
+
+def _project(steps, names=('a', 'b')):
+    config = Config([yaml.dump({'version': '0.0.1', 'project': 'test', 'commands': {'build': {'steps': steps}}})])
+    project = Project(config)
+    project._executors = {'host': FakeExecutor(config, 'host', synced=False)}
+    project._executors.update((x, FakeExecutor(config, x)) for x in names)
+    return project
+
+
+def test_clean_executor_switch():
+    '''Test no data are synced when switching away from an executor that made no changes.'''
+    project = _project(['@a read', '@b read', '@a read'])
+    assert project.exec('build') == 0
+    project.on_exit()
+
+    assert project.executors['a'].calls == ['sync_in', 'read', 'read']
+    assert project.executors['b'].calls == ['sync_in', 'read']
+
+
+def test_dirty_executor_switch():
+    '''Test changes are synced out and into the executors that need them.'''
+    project = _project(['@a write', '@b read', '@host read', '@a read'])
+    assert project.exec('build') == 0
+    project.on_exit()
+
+    assert project.executors['a'].calls == ['sync_in', 'write', 'sync_out', 'sync_in', 'read']
+    assert project.executors['b'].calls == ['sync_in', 'read']
+
+
+def test_concurrent_stop(capsys):
+    '''Test all executors are stopped even if one fails, the output of each one is printed at once.'''
+    project = _project([])
+    with pytest.raises(ExecutorError) as ex:
+        project.stop()
+    assert ex.value.message == 'Failed to stop 1 of 3 executor(s)'
+
+    assert all(x.calls == ['stop'] for x in project.executors.values())
+    output = capsys.readouterr().out
+    assert 'stopping a\n' in output
+    assert 'stopping b\n' in output
+
+
+class WarmUpExecutor(FakeExecutor):
+
+    def warm_up(self, chdir=None, paths=()):
+        print(f'starting {self.name}')
+        self.calls.append('warm_up')
+        return True
+
+
+def test_warm_up(capsys):
+    '''Test executors are started in advance and synced again only if the host tree may have changed since.'''
+    project = _project(['@a read', '@host write', '@b read'])
+    for name in ('a', 'b'):
+        project.executors[name].__class__ = WarmUpExecutor
+    assert project.exec('build') == 0
+    project.on_exit()
+
+    assert project.executors['a'].calls == ['warm_up', 'read']
+    assert project.executors['b'].calls == ['warm_up', 'sync_in', 'read']
+    assert project.executors['host'].calls == ['sync_in', 'write']
+    output = capsys.readouterr().out
+    assert 'starting a\n' in output
+    assert 'starting b\n' in output
+
+
+class BlockedWarmUpExecutor(FakeExecutor):
+    '''Executor b starts until released, b and c share the synced data, commands named "fail" fail'''
+    release = threading.Event()
+
+    @property
+    def sync_group(self):
+        return 'volume' if self.name in ('b', 'c') else None
+
+    def warm_up(self, chdir=None, paths=()):
+        self.calls.append('warm_up')
+        if self.name == 'b':
+            self.release.wait()
+        return True
+
+    def exec(self, command, chdir=None, env_options=None):
+        super().exec(command, chdir, env_options)
+        return 1 if command == 'fail' else 0
+
+
+def test_warm_up_unused():
+    '''Test the exit waits only for the start in progress, the executors the command didn't get to are not started.'''
+    project = _project(['@a fail', '@b read', '@c read'], names=('a', 'b', 'c'))
+    for name in ('a', 'b', 'c'):
+        project.executors[name].__class__ = BlockedWarmUpExecutor
+    timer = threading.Timer(0.2, BlockedWarmUpExecutor.release.set)
+    try:
+        assert project.exec('build') == 1
+        timer.start()
+        project.on_exit()
+        assert BlockedWarmUpExecutor.release.is_set()
+        assert project.executors['b'].calls == ['warm_up']
+        assert project.executors['c'].calls == []
+    finally:
+        timer.cancel()
+        BlockedWarmUpExecutor.release.set()
+
+
+class GroupExecutor(FakeExecutor):
+
+    @property
+    def sync_group(self):
+        return 'volume'
+
+
+def test_shared_sync_group():
+    '''Test no data are synced when switching between executors working on the same synced data.'''
+    project = _project(['@a write', '@b read', '@a read'])
+    for name in ('a', 'b'):
+        project.executors[name].__class__ = GroupExecutor
+    assert project.exec('build') == 0
+    project.on_exit()
+
+    assert project.executors['a'].calls == ['sync_in', 'write', 'read', 'sync_out']
+    assert project.executors['b'].calls == ['read']
+
+
+class ShardExecutor(FakeExecutor):
+
+    def exec(self, command, chdir=None, env_options=None):
+        item = env_options['BROCK_SHARD_ITEM']
+        self.calls.append(item)
+        return 2 if item.startswith('bad') else 0
+
+
+def test_shard():
+    '''Test the command is run for all work items, the exit code is the one of the first failed item.'''
+    project = _project([{'executor': 'a', 'shell': 'sh', 'script': 'test', 'shard': ['x', 'bad1', 'y', 'bad2']}])
+    project.executors['a'].__class__ = ShardExecutor
+    assert project.exec('build') == 2
+    project.on_exit()
+
+    assert project.executors['a'].calls == ['sync_in', 'x', 'bad1', 'y', 'bad2']
+
+
+class FailingExecutor(FakeExecutor):
+
+    def exec(self, command, chdir=None, env_options=None):
+        self.calls.append(command)
+        return 2
+
+
+def test_matrix(capsys):
+    '''Test the steps are run once per matrix executor, the results are summarized.'''
+    config = Config([
+        yaml.dump({
+            'version': '0.0.1',
+            'project': 'test',
+            'commands': {
+                'build': {
+                    'matrix': {
+                        'executors': ['a', 'b'],
+                        'jobs': 1
+                    },
+                    'steps': ['write', '@host read']
+                }
+            }
+        })
+    ])
+    project = Project(config)
+    project._executors = {
+        'host': FakeExecutor(config, 'host', synced=False),
+        'a': FakeExecutor(config, 'a'),
+        'b': FailingExecutor(config, 'b'),
+    }
+    assert project.exec('build') == 2
+    project.on_exit()
+
+    assert project.executors['a'].calls == ['sync_in', 'write', 'sync_out']
+    assert project.executors['b'].calls == ['sync_in', 'write']
+    assert project.executors['host'].calls == ['sync_in', 'read']
+    output = capsys.readouterr().out
+    assert re.search(r'a +passed +\d+\.\d s', output)
+    assert re.search(r'b +failed \(2\) +\d+\.\d s', output)
+
+
+def test_chdir_change():
+    '''Test the executor is synced again when a command on it works in another directory.'''
+    config = Config([
+        yaml.dump({
+            'version': '0.0.1',
+            'project': 'test',
+            'commands': {
+                'generate': {
+                    'chdir': 'gen',
+                    'steps': ['@a write']
+                },
+                'build': {
+                    'chdir': 'src',
+                    'depends_on': ['generate'],
+                    'steps': ['@a read', '@a read']
+                }
+            }
+        })
+    ])
+    project = Project(config)
+    project._executors = {'host': FakeExecutor(config, 'host', synced=False), 'a': FakeExecutor(config, 'a')}
+    assert project.exec('build') == 0
+    project.on_exit()
+
+    assert project.executors['a'].calls == ['sync_in', 'write', 'sync_out', 'sync_in', 'read', 'read']
+
+
+def test_no_sync_out():
+    '''Test commands with sync_out disabled don't sync the changes back, unless another command needs it.'''
+    config = Config([
+        yaml.dump({
+            'version': '0.0.1',
+            'project': 'test',
+            'commands': {
+                'check': {
+                    'sync_out': False,
+                    'steps': ['@a write']
+                },
+                'build': {
+                    'steps': ['@a write']
+                }
+            }
+        })
+    ])
+    project = Project(config)
+    project._executors = {'host': FakeExecutor(config, 'host', synced=False), 'a': FakeExecutor(config, 'a')}
+    assert project.exec('check') == 0
+    project.on_exit()
+    assert project.executors['a'].calls == ['sync_in', 'write']
+
+    assert project.exec('build') == 0
+    project.on_exit()
+    assert project.executors['a'].calls == ['sync_in', 'write', 'write', 'sync_out']
+
+
+class SlowSyncExecutor(FakeExecutor):
+    '''Records the number of syncs running at once'''
+    active = 0
+    max_active = 0
+    lock = threading.Lock()
+
+    def _sync(self, name):
+        with self.lock:
+            SlowSyncExecutor.active += 1
+            SlowSyncExecutor.max_active = max(SlowSyncExecutor.max_active, SlowSyncExecutor.active)
+        time.sleep(0.05)
+        self.calls.append(name)
+        with self.lock:
+            SlowSyncExecutor.active -= 1
+
+    def sync_in(self, chdir=None, paths=()):
+        self._sync('sync_in')
+        self._dirty = False
+
+    def sync_out(self):
+        self._sync('sync_out')
+
+
+def test_matrix_host_syncs():
+    '''Test the matrix runs don't sync the project tree on the host at once.'''
+    project = _project([])
+    project._commands['build'] = Command('build', Munch(matrix=['a', 'b'], steps=['write']), 'host')
+    for name in ('a', 'b'):
+        project.executors[name].__class__ = SlowSyncExecutor
+    assert project.exec('build') == 0
+    project.on_exit()
+
+    assert all(project.executors[x].calls == ['sync_in', 'write', 'sync_out'] for x in ('a', 'b'))
+    assert SlowSyncExecutor.max_active == 1
+
+
+class SlowGroupExecutor(GroupExecutor):
+    '''Records the number of commands running at once on the shared synced data'''
+    active = 0
+    max_active = 0
+    lock = threading.Lock()
+
+    def exec(self, command, chdir=None, env_options=None):
+        with self.lock:
+            SlowGroupExecutor.active += 1
+            SlowGroupExecutor.max_active = max(SlowGroupExecutor.max_active, SlowGroupExecutor.active)
+        time.sleep(0.05)
+        with self.lock:
+            SlowGroupExecutor.active -= 1
+        return super().exec(command, chdir, env_options)
+
+
+def test_matrix_shared_tree():
+    '''Test the matrix runs of executors working on the same synced data are serialized.'''
+    project = _project([])
+    project._commands['build'] = Command('build', Munch(matrix=['a', 'b'], steps=['write']), 'host')
+    for name in ('a', 'b'):
+        project.executors[name].__class__ = SlowGroupExecutor
+    assert project.exec('build') == 0
+    project.on_exit()
+
+    assert all(project.executors[x].calls == ['sync_in', 'write', 'sync_out'] for x in ('a', 'b'))
+    assert SlowGroupExecutor.max_active == 1
+
+
+def test_record_usage(monkeypatch):
+    '''Test the usage is recorded once a docker executor runs a command, not by merely loading the project.'''
+    recorded = []
+    monkeypatch.setattr('brock.project.record_usage', recorded.append)
+    content = {
+        'version': '0.0.1',
+        'project': 'test',
+        'executors': {
+            'gcc': {
+                'type': 'docker',
+                'image': 'gcc'
+            }
+        },
+        'commands': {
+            'build': {
+                'steps': ['@gcc make']
+            }
+        }
+    }
+    project = Project(Config([yaml.dump(content)]))
+    executor = project.executors['gcc']
+    monkeypatch.setattr(executor, 'sync_in', lambda chdir=None, paths=(): None)
+    monkeypatch.setattr(executor, 'exec', lambda command, chdir=None, env_options=None: 0)
+    assert recorded == []
+
+    assert project.exec_raw('make', 'gcc') == 0
+    assert project.exec_raw('make', 'gcc') == 0
+    assert len(recorded) == 1
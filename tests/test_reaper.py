@@ -0,0 +1,104 @@
+import yaml
+
+from brock import reaper
+from brock.config.config import Config
+from brock.executors.docker import Container, DockerExecutor
+
+
+class FakeExecutor:
+
+    def __init__(self, name, last_used, idle_timeout=60, image='gcc', spares=0, busy=False, base_dir='a'):
+        self.name = name
+        self.container_name = f'brock-test-{name}'
+        self.hashed_base_dir = base_dir
+        self.project_labels = {}
+        self.idle_timeout = idle_timeout
+        self.idle_spares = spares
+        self.image = image
+        self.busy = busy
+        self.stopped = False
+        self._last_used = last_used
+
+    def last_used(self):
+        return self._last_used
+
+    def record_use(self):
+        self._last_used = 1000
+
+    def is_busy(self):
+        return self.busy
+
+    def stop_if_idle(self, now=None):
+        self.stopped = True
+        return True
+
+
+def test_reap(monkeypatch):
+    '''Test idle executors are stopped, busy ones and warm spares are kept running.'''
+    executors = [
+        FakeExecutor('old', 100, spares=1),
+        FakeExecutor('older', 50, spares=1),
+        FakeExecutor('python', 100, image='python'),
+        FakeExecutor('busy', 100, image='python', busy=True),
+        FakeExecutor('recent', 980),
+        FakeExecutor('stopped', 100),
+    ]
+    running = {x.container_name: None for x in executors if x.name != 'stopped'}
+    monkeypatch.setattr(Container, 'list_labeled', lambda labels: running)
+
+    assert reaper.reap(executors, now=1000) == 1040
+    assert [x.name for x in executors if x.stopped] == ['older', 'python']
+
+
+def test_reap_spares_per_checkout(monkeypatch):
+    '''Test each checkout of the project keeps its own warm spares.'''
+    executors = [
+        FakeExecutor('a', 100, spares=1),
+        FakeExecutor('a-older', 50, spares=1),
+        FakeExecutor('b', 90, spares=1, base_dir='b'),
+    ]
+    running = {x.container_name: None for x in executors}
+    monkeypatch.setattr(Container, 'list_labeled', lambda labels: running)
+
+    reaper.reap(executors, now=1000)
+    assert [x.name for x in executors if x.stopped] == ['a-older']
+
+
+def test_reap_nothing_to_wait_for(monkeypatch):
+    '''Test the reaper finishes when no executor with a timeout is running.'''
+    monkeypatch.setattr(Container, 'list_labeled', lambda labels: {})
+    assert reaper.reap([FakeExecutor('gcc', 100)], now=1000) is None
+    assert reaper.reap([FakeExecutor('gcc', 100, idle_timeout=None)], now=1000) is None
+
+
+def test_stop_if_idle(tmp_path, monkeypatch):
+    '''Test the executor is stopped only if still idle and not used by another process.'''
+    monkeypatch.setenv('BROCK_CACHE_DIR', str(tmp_path))
+    content = {
+        'version': '0.0.1',
+        'project': 'test',
+        'executors': {
+            'gcc': {
+                'type': 'docker',
+                'image': 'gcc',
+                'idle': {
+                    'timeout': 1
+                }
+            }
+        }
+    }
+    executor = DockerExecutor(Config([yaml.dump(content)], work_dir=str(tmp_path)), 'gcc')
+    stopped = []
+    monkeypatch.setattr(executor, '_stop', lambda: stopped.append(True))
+    monkeypatch.setattr(executor, 'is_busy', lambda: False)
+    monkeypatch.setattr(executor, 'last_used', lambda: 1000)
+
+    # used since it was found idle
+    assert not executor.stop_if_idle(now=1030)
+    # a command is running in another process
+    with executor._lock('use', shared=True):
+        assert not executor.stop_if_idle(now=1100)
+    assert not stopped
+
+    assert executor.stop_if_idle(now=1100)
+    assert stopped
@@ -0,0 +1,20 @@
+import pytest
+
+from brock.size import parse_size, format_size
+
+
+def test_parse_size():
+    '''Test sizes with binary units are converted to bytes.'''
+    assert parse_size('512') == 512
+    assert parse_size('1K') == 1024
+    assert parse_size('1.5G') == 1536 * 1024**2
+    assert parse_size('10 mb') == 10 * 1024**2
+    with pytest.raises(ValueError):
+        parse_size('10 apples')
+
+
+def test_format_size():
+    '''Test sizes are formatted with a suitable unit.'''
+    assert format_size(None) == 'unknown'
+    assert format_size(512) == '512 B'
+    assert format_size(1536 * 1024**2) == '1.5 GB'
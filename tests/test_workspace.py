@@ -0,0 +1,55 @@
+import re
+
+import yaml
+
+from brock.workspace import find_projects, run
+
+
+def _write_config(path, content):
+    path.mkdir(parents=True, exist_ok=True)
+    (path / '.brock.yml').write_text(yaml.dump(dict({'version': '0.0.1'}, **content)))
+
+
+def _workspace(root):
+    _write_config(root / 'a', {'project': 'a', 'commands': {'test': {'steps': ['true']}}})
+    # continues project a, it is not a project of its own
+    _write_config(root / 'a' / 'sub', {'project': 'a'})
+    _write_config(root / 'b', {'project': 'b', 'commands': {'test': {'steps': ['false']}}})
+    _write_config(root / 'c', {'project': 'c', 'commands': {'build': {'steps': ['true']}}})
+    _write_config(root / '.hidden', {'project': 'hidden', 'commands': {'test': {'steps': ['true']}}})
+
+
+def test_find_projects(tmp_path):
+    '''Test the projects below the directory are found, the configs continuing a project are merged into it.'''
+    _workspace(tmp_path)
+    configs = find_projects(str(tmp_path))
+    assert sorted(x.project for x in configs) == ['a', 'b', 'c']
+    assert sorted(x.base_dir for x in configs) == [str(tmp_path / x) for x in ('a', 'b', 'c')]
+
+
+def test_run(tmp_path, capsys):
+    '''Test the command is run in the projects having it, the exit code is the one of the first failed project.'''
+    _workspace(tmp_path)
+    assert run('test', jobs=1, root=str(tmp_path)) == 1
+
+    output = capsys.readouterr().out
+    assert re.search(r'a +passed +\d+\.\d s', output)
+    assert re.search(r'b +failed \(1\) +\d+\.\d s', output)
+    assert re.search(r'^\s+c ', output, re.MULTILINE) is None
+
+
+def test_find_projects_reads_once(tmp_path, monkeypatch):
+    '''Test each config file is read only once and a parent project is continued by the nested configs.'''
+    _workspace(tmp_path)
+    opened = []
+    original_open = open
+
+    def recording_open(file, *args, **kwargs):
+        if str(file).endswith('.brock.yml'):
+            opened.append(str(file))
+        return original_open(file, *args, **kwargs)
+
+    monkeypatch.setattr('builtins.open', recording_open)
+    configs = find_projects(str(tmp_path / 'a' / 'sub'))
+    assert [x.base_dir for x in configs] == [str(tmp_path / 'a')]
+    assert opened and sorted(opened) == sorted(set(opened))